@@ -0,0 +1,80 @@
+"""Benchmark backend tile: Zarr/Blosc contro mmap (.npy non compressi).
+
+Dimensione su disco, build, lettura di tutti i tile del LOD0 e ROI (load_roi, cache disattivata).
+"freddo": page cache svuotata se possibile (root su Linux), altrimenti solo store appena aperto.
+"caldo": seconda passata sullo stesso store (file gia' nella page cache).
+
+Uso (dalla cartella PointAI_v5_6):
+    python -m bench.bench_backend [n_punti]
+"""
+from __future__ import annotations
+import os, sys, time, shutil, tempfile
+import numpy as np
+
+from bench.bench_build import _make_las
+from core.oc_build import build_store_from_source
+from core.oc_store import PointStore
+from core.oc_query import load_roi
+
+
+def _du(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(r, f)) for r, _, files in os.walk(path) for f in files)
+
+
+def _drop_caches() -> bool:
+    try:
+        os.sync()
+        with open("/proc/sys/vm/drop_caches", "w") as f:
+            f.write("3\n")
+        return True
+    except OSError:
+        return False
+
+
+def _read_all(store: str) -> float:
+    ps = PointStore(store, cache_mb=0)
+    m = ps.manifest(0)
+    t0 = time.perf_counter()
+    for key in m.keys():
+        ps.read_tile(0, *m.get(key)["ijk"])
+    return time.perf_counter() - t0
+
+
+def _roi(store: str) -> float:
+    ps = PointStore(store, cache_mb=0)
+    ps.manifest(0)
+    t0 = time.perf_counter()
+    load_roi(ps, 0, np.array([250.0, 250.0, 15.0]), 100.0, max_points=10**9)
+    return time.perf_counter() - t0
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 3_000_000
+    tmp = tempfile.mkdtemp(prefix="pointai_bench_")
+    try:
+        src = os.path.join(tmp, "src.las")
+        _make_las(src, n)
+        rows = []
+        for backend in ("zarr", "mmap"):
+            store = os.path.join(tmp, f"store_{backend}")
+            t0 = time.perf_counter()
+            build_store_from_source(src, store, tile_size=25.0, mode="stream", backend=backend)
+            t_build = time.perf_counter() - t0
+            cold = _drop_caches()
+            t_cold = _read_all(store)
+            t_warm = _read_all(store)
+            _drop_caches()
+            r_cold = _roi(store)
+            r_warm = _roi(store)
+            rows.append((backend, _du(store), t_build, t_cold, t_warm, r_cold, r_warm))
+
+        print(f"punti {n:,} | page cache svuotata: {'si' if cold else 'no'}")
+        print(f"{'backend':<8}{'MB':>9}{'build s':>9}{'lod0 freddo ms':>16}{'lod0 caldo ms':>15}{'roi freddo ms':>15}{'roi caldo ms':>14}")
+        for b, size, tb, tc, tw, rc, rw in rows:
+            print(f"{b:<8}{size/2**20:>9.1f}{tb:>9.2f}{tc*1000:>16.1f}{tw*1000:>15.1f}{rc*1000:>15.1f}{rw*1000:>14.1f}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
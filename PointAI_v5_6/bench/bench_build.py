@@ -0,0 +1,55 @@
+"""Benchmark scaling del build store: 1..N worker (sample e stream).
+
+Uso (dalla cartella PointAI_v5_6):
+    python -m bench.bench_build [n_punti]
+"""
+from __future__ import annotations
+import os, sys, time, shutil, tempfile
+import numpy as np
+
+from core.oc_build import build_store_from_source
+
+
+def _make_las(path: str, n: int, seed: int = 0):
+    import laspy
+
+    rng = np.random.default_rng(seed)
+    h = laspy.LasHeader(point_format=2, version="1.2")
+    h.scales = np.array([0.001, 0.001, 0.001])
+    h.offsets = np.array([0.0, 0.0, 0.0])
+    las = laspy.LasData(h)
+    las.x = rng.uniform(0, 500, n)
+    las.y = rng.uniform(0, 500, n)
+    las.z = rng.uniform(0, 30, n)
+    las.red = rng.integers(0, 65535, n)
+    las.green = rng.integers(0, 65535, n)
+    las.blue = rng.integers(0, 65535, n)
+    las.write(path)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 3_000_000
+    tmp = tempfile.mkdtemp(prefix="pointai_bench_")
+    try:
+        src = os.path.join(tmp, "src.las")
+        _make_las(src, n)
+        cpus = os.cpu_count() or 1
+        ws = sorted({1, 2, 4, cpus})
+        print(f"punti {n:,} | cpu {cpus}")
+        print(f"{'mode':<8}{'workers':>8}{'sec':>10}{'speedup':>10}")
+        for mode in ("sample", "stream"):
+            t1 = None
+            for w in ws:
+                out = os.path.join(tmp, f"store_{mode}_{w}.zarr")
+                t0 = time.perf_counter()
+                build_store_from_source(src, out, mode=mode, workers=w, max_points_ingest=n)
+                dt = time.perf_counter() - t0
+                t1 = t1 or dt
+                print(f"{mode:<8}{w:>8}{dt:>10.2f}{t1/dt:>10.2f}")
+                shutil.rmtree(out, ignore_errors=True)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
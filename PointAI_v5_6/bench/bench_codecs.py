@@ -0,0 +1,55 @@
+"""Benchmark codec per array (Blosc: cname, livello, shuffle) su un campione di tile, e scelta per obiettivo.
+
+Per ogni obiettivo lo store viene ricompresso con i codec scelti (migrate_backend) e riletto:
+dimensione su disco e lettura di tutti i tile del LOD0 (cache disattivata).
+
+Uso (dalla cartella PointAI_v5_6):
+    python -m bench.bench_codecs [n_punti]
+"""
+from __future__ import annotations
+import os, sys, shutil, tempfile
+
+from bench.bench_build import _make_las
+from bench.bench_backend import _du, _read_all
+from core.oc_build import build_store_from_source
+from core.oc_store import PointStore, StoreMeta
+from core.oc_codecs import GOALS, sample_tiles, benchmark_codecs, choose_codecs
+from core.oc_migrate import migrate_backend
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 3_000_000
+    tmp = tempfile.mkdtemp(prefix="pointai_bench_")
+    try:
+        src = os.path.join(tmp, "src.las")
+        store = os.path.join(tmp, "store.zarr")
+        _make_las(src, n)
+        build_store_from_source(src, store, tile_size=25.0, mode="stream")
+
+        ps = PointStore(store, cache_mb=0)
+        rows = benchmark_codecs(sample_tiles(ps, 0, 32))
+        print(f"punti {n:,} | campione 32 tiles")
+        print(f"{'array':<8}{'codec':<22}{'ratio':>8}{'enc MB/s':>10}{'dec MB/s':>10}")
+        for r in sorted(rows, key=lambda r: (r["array"], -r["ratio"])):
+            print(f"{r['array']:<8}{r['cname'] + '/' + str(r['clevel']) + '/' + r['shuffle']:<22}"
+                  f"{r['ratio']:>8.2f}{r['enc_mbs']:>10.0f}{r['dec_mbs']:>10.0f}")
+
+        print()
+        print(f"{'obiettivo':<10}{'points':<22}{'colors':<22}{'MB':>8}{'lod0 ms':>10}")
+        print(f"{'(default)':<10}{'zstd/3/bitshuffle':<22}{'zstd/3/bitshuffle':<22}{_du(store)/2**20:>8.1f}{_read_all(store)*1000:>10.1f}")
+        meta = ps.read_meta()
+        for goal in GOALS:
+            codecs = choose_codecs(rows, goal)
+            ps.write_meta(StoreMeta(**{**meta.__dict__, "codecs": codecs, "codec_goal": goal}))
+            out = os.path.join(tmp, f"store_{goal}")
+            migrate_backend(store, out, "zarr")
+            t = min(_read_all(out) for _ in range(2))
+            name = {a: f"{c['cname']}/{c['clevel']}/{c['shuffle']}" for a, c in codecs.items()}
+            print(f"{goal:<10}{name.get('points', '-'):<22}{name.get('colors', '-'):<22}{_du(out)/2**20:>8.1f}{t*1000:>10.1f}")
+            shutil.rmtree(out, ignore_errors=True)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""Benchmark scaling della classificazione terreno (PMF) sullo store: 1..N worker.
+
+Ogni passata riclassifica lo store da capo (colonne di tile + overlap, classi nell'array "classes").
+
+Uso (dalla cartella PointAI_v5_6):
+    python -m bench.bench_ground [n_punti]
+"""
+from __future__ import annotations
+import os, sys, time, shutil, tempfile
+
+from bench.bench_build import _make_las
+from core.oc_build import build_store_from_source
+from core.oc_classify import classify_ground
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 3_000_000
+    tmp = tempfile.mkdtemp(prefix="pointai_bench_")
+    try:
+        src = os.path.join(tmp, "src.las")
+        _make_las(src, n)
+        store = os.path.join(tmp, "store")
+        build_store_from_source(src, store, tile_size=25.0, mode="stream")
+        cpus = os.cpu_count() or 1
+        ws = sorted({1, 2, 4, cpus})
+        print(f"punti {n:,} | cpu {cpus}")
+        print(f"{'workers':>8}{'sec':>10}{'speedup':>10}{'ground':>10}")
+        t1 = None
+        for w in ws:
+            t0 = time.perf_counter()
+            r = classify_ground(store, lods=[0], workers=w)
+            dt = time.perf_counter() - t0
+            t1 = t1 or dt
+            print(f"{w:>8}{dt:>10.2f}{t1/dt:>10.2f}{r['ground']:>10,}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Benchmark edit/lettura ops: ops.json riscritto a ogni edit contro il journal append-only ops.jsonl.
+
+Uso (dalla cartella PointAI_v5_6):
+    python -m bench.bench_journal [n_ops]
+"""
+from __future__ import annotations
+import sys, json, time, shutil, tempfile
+from pathlib import Path
+import numpy as np
+
+from core.oc_store import PointStore
+from bench.bench_ops import _random_ops
+
+
+def _legacy_append(root: Path, op: dict):
+    # percorso originale: parse + riscrittura completa di ops.json
+    p = root / "ops.json"
+    data = json.loads(p.read_text(encoding="utf-8")) if p.exists() else {"ops": []}
+    data["ops"].append(op)
+    p.write_text(json.dumps(data, indent=2), encoding="utf-8")
+
+
+def _legacy_read(root: Path) -> list[dict]:
+    return json.loads((root / "ops.json").read_text(encoding="utf-8")).get("ops", [])
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    ops = _random_ops(n, np.random.default_rng(1))
+    tmp = Path(tempfile.mkdtemp(prefix="pointai_bench_"))
+    try:
+        legacy = tmp / "legacy"
+        legacy.mkdir()
+        t0 = time.perf_counter()
+        lat_old = []
+        for op in ops:
+            t = time.perf_counter()
+            _legacy_append(legacy, op)
+            lat_old.append(time.perf_counter() - t)
+        t_old = time.perf_counter() - t0
+
+        ps = PointStore(tmp / "journal.zarr")
+        ps.ensure_ops()
+        t0 = time.perf_counter()
+        lat_new = []
+        for op in ops:
+            t = time.perf_counter()
+            ps.append_op(op)
+            lat_new.append(time.perf_counter() - t)
+        t_new = time.perf_counter() - t0
+        assert ps.read_ops() == _legacy_read(legacy)
+
+        reps = 200
+        t0 = time.perf_counter()
+        for _ in range(reps):
+            _legacy_read(legacy)
+        r_old = (time.perf_counter() - t0)/reps
+        t0 = time.perf_counter()
+        for _ in range(reps):
+            ps.compiled_ops()
+        r_new = (time.perf_counter() - t0)/reps
+
+        print(f"ops {n:,}")
+        print(f"{'':<28}{'ops.json':>12}{'ops.jsonl':>12}")
+        print(f"{'append totale s':<28}{t_old:>12.2f}{t_new:>12.2f}")
+        print(f"{'append ultimo 10% ms':<28}{np.mean(lat_old[-n//10:])*1000:>12.3f}{np.mean(lat_new[-n//10:])*1000:>12.3f}")
+        print(f"{'lettura per query ms':<28}{r_old*1000:>12.3f}{r_new*1000:>12.3f}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
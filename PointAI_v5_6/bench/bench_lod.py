@@ -0,0 +1,55 @@
+"""Benchmark selezione LOD: pick_lod (LOD unico + stride) contro plan_lods (LOD per tile, budget di punti).
+
+Punti letti = somma dei conteggi dei tile decodificati; restituiti = punti nella risposta.
+
+Uso (dalla cartella PointAI_v5_6):
+    python -m bench.bench_lod [n_punti]
+"""
+from __future__ import annotations
+import os, sys, time, shutil, tempfile
+import numpy as np
+
+from bench.bench_build import _make_las
+from core.oc_build import build_store_from_source
+from core.oc_store import PointStore
+from core.oc_query import pick_lod, query_shape, query_budget, plan_lods, _shape_rows
+from core.oc_shapes import SphereShape
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 3_000_000
+    tmp = tempfile.mkdtemp(prefix="pointai_bench_")
+    try:
+        src = os.path.join(tmp, "src.las")
+        store = os.path.join(tmp, "store.zarr")
+        _make_las(src, n)
+        build_store_from_source(src, store, tile_size=25.0, mode="stream", lod_voxels=[0.1, 0.5, 1.0, 2.0])
+
+        eye = np.array([250.0, 250.0, 15.0])
+        shape = SphereShape(eye, 250.0)
+        print(f"punti {n:,}")
+        print(f"{'budget':>10}{'metodo':>10}{'letti':>12}{'restituiti':>12}{'ms':>10}")
+        for budget in (200_000, 1_000_000, 2_000_000):
+            ps = PointStore(store, cache_mb=0)
+            meta = ps.read_meta()
+            ops = ps.compiled_ops()
+
+            lod = pick_lod(meta, budget)
+            read = sum(r[4] for r in _shape_rows(ps, lod, shape, ops))
+            t0 = time.perf_counter()
+            P, _ = query_shape(ps, lod, shape, budget)
+            dt = time.perf_counter() - t0
+            print(f"{budget:>10,}{'pick_lod':>10}{read:>12,}{P.shape[0]:>12,}{dt*1000:>10.1f}")
+
+            plan = plan_lods(ps, shape, budget, eye=eye)
+            read = sum(int(ps.manifest(l).get(f"{t[0][0]}_{t[0][1]}_{t[0][2]}")["count"]) for l, t in plan)
+            t0 = time.perf_counter()
+            P, _ = query_budget(ps, shape, budget, eye=eye)
+            dt = time.perf_counter() - t0
+            print(f"{budget:>10,}{'sse':>10}{read:>12,}{P.shape[0]:>12,}{dt*1000:>10.1f}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Benchmark ordine dei punti nel tile: ordine di ingest (chunk 200k) contro Morton (chunk con bbox).
+
+Dimensione su disco e latenza ROI a freddo (cache disattivata) al variare del raggio:
+con Morton le ROI piccole leggono solo i chunk che intersecano la sfera.
+
+Uso (dalla cartella PointAI_v5_6):
+    python -m bench.bench_morton [n_punti]
+"""
+from __future__ import annotations
+import os, sys, time, shutil, tempfile
+import numpy as np
+
+from bench.bench_build import _make_las
+from bench.bench_backend import _du
+from core.oc_build import build_store_from_source
+from core.oc_store import PointStore
+from core.oc_query import load_roi
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 3_000_000
+    tmp = tempfile.mkdtemp(prefix="pointai_bench_")
+    try:
+        src = os.path.join(tmp, "src.las")
+        _make_las(src, n)
+        stores = {}
+        for order, rows in (("ingest", 200_000), ("morton", 50_000), ("morton", 10_000)):
+            name = f"{order}/{rows // 1000}k"
+            stores[name] = os.path.join(tmp, name.replace("/", "_"))
+            build_store_from_source(src, stores[name], tile_size=100.0, mode="stream", point_order=order, chunk_points=rows)
+
+        rng = np.random.default_rng(0)
+        centers = np.column_stack([rng.uniform(20, 480, (20, 2)), np.full(20, 15.0)])
+        print(f"punti {n:,} | tile 100 m | 20 ROI per raggio, ms medi a freddo")
+        print(f"{'store':<14}{'MB':>8}" + "".join(f"{'r=' + str(r):>10}" for r in (5, 15, 50)))
+        for name, store in stores.items():
+            row = f"{name:<14}{_du(store)/2**20:>8.1f}"
+            for r in (5.0, 15.0, 50.0):
+                t = 0.0
+                for c in centers:
+                    ps = PointStore(store, cache_mb=0)
+                    ps.manifest(0)
+                    t0 = time.perf_counter()
+                    load_roi(ps, 0, c, r, max_points=10**9)
+                    t += time.perf_counter() - t0
+                row += f"{t/len(centers)*1000:>10.1f}"
+            print(row)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
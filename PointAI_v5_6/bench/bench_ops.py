@@ -0,0 +1,94 @@
+"""Benchmark latenza ROI al crescere delle ops (remove_bbox) nel log: 10 -> 10.000.
+
+Confronta le ops compilate con indice spaziale contro la valutazione originale
+(tutte le ops su tutti i punti). Tile in cache: si misura solo il costo delle ops.
+
+Uso (dalla cartella PointAI_v5_6):
+    python -m bench.bench_ops [n_punti]
+"""
+from __future__ import annotations
+import os, sys, time, shutil, tempfile
+import numpy as np
+
+from bench.bench_build import _make_las
+from core.oc_build import build_store_from_source
+from core.oc_store import PointStore
+from core.oc_query import load_roi
+from core.oc_shapes import SphereShape
+
+
+def _apply_ops_naive(points: np.ndarray, ops: list[dict]) -> np.ndarray:
+    # valutazione originale: ogni op su ogni punto, in float64
+    keep = np.ones((points.shape[0],), dtype=bool)
+    for op in ops:
+        xmin,xmax,ymin,ymax,zmin,zmax = map(float, (op["xmin"],op["xmax"],op["ymin"],op["ymax"],op["zmin"],op["zmax"]))
+        rem = (
+            (points[:,0] >= xmin) & (points[:,0] <= xmax) &
+            (points[:,1] >= ymin) & (points[:,1] <= ymax) &
+            (points[:,2] >= zmin) & (points[:,2] <= zmax)
+        )
+        keep &= ~rem
+    return keep
+
+
+def _naive_roi(ps: PointStore, center, radius, ops):
+    shape = SphereShape(center, radius)
+    out = 0
+    for key in ps.list_tiles(0):
+        pts, _ = ps.read_tile(0, *ps.manifest(0).get(key)["ijk"])
+        pts = pts[shape.contains(pts)]
+        out += int(_apply_ops_naive(pts.astype(np.float64), ops).sum())
+    return out
+
+
+def _random_ops(n: int, rng) -> list[dict]:
+    c = rng.uniform([0, 0, 0], [500, 500, 30], (n, 3))
+    e = rng.uniform(0.2, 2.0, (n, 3))
+    return [dict(type="remove_bbox",
+                 xmin=a[0]-b[0], xmax=a[0]+b[0], ymin=a[1]-b[1], ymax=a[1]+b[1], zmin=a[2]-b[2], zmax=a[2]+b[2])
+            for a, b in zip(c, e)]
+
+
+def _timeit(fn, reps: int = 3) -> float:
+    ts = []
+    for _ in range(reps):
+        t0 = time.perf_counter()
+        fn()
+        ts.append(time.perf_counter() - t0)
+    return float(np.median(ts))
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    tmp = tempfile.mkdtemp(prefix="pointai_bench_")
+    try:
+        src = os.path.join(tmp, "src.las")
+        store = os.path.join(tmp, "store.zarr")
+        _make_las(src, n)
+        build_store_from_source(src, store, mode="stream")
+        ps = PointStore(store)
+        center = np.array([250.0, 250.0, 15.0])
+        radius = 120.0
+        rng = np.random.default_rng(1)
+
+        print(f"punti {n:,} | ROI r={radius:.0f}")
+        print(f"{'ops':>8}{'indice ms':>12}{'naive ms':>12}")
+        ops = []
+        for n_ops in (10, 100, 1000, 10_000):
+            for op in _random_ops(n_ops - len(ops), rng):
+                ps.append_op(op)
+                ops.append(op)
+            P, _ = load_roi(ps, 0, center, radius, max_points=10**9)   # warm-up: cache tile + compilazione
+            t_idx = _timeit(lambda: load_roi(ps, 0, center, radius, max_points=10**9))
+            if n_ops <= 1000:
+                assert _naive_roi(ps, center, radius, ops) == P.shape[0]
+                t_naive = f"{_timeit(lambda: _naive_roi(ps, center, radius, ops), reps=1)*1000:12.1f}"
+            else:
+                t_naive = f"{'-':>12}"
+            print(f"{n_ops:>8,}{t_idx*1000:>12.1f}{t_naive}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Benchmark reservoir sampling: loop per-punto vs update vettorizzato.
+
+Uso (dalla cartella PointAI_v5_6):
+    python -m bench.bench_reservoir
+"""
+from __future__ import annotations
+import time
+import numpy as np
+
+from core.stream_loaders import reservoir_update
+
+CHUNK = 250_000
+
+
+def _reservoir_update_loop(res_points, res_colors, seen, chunk_points, chunk_colors, rng) -> int:
+    # implementazione originale (un rng.integers per punto), tenuta come riferimento
+    K = res_points.shape[0]
+    for i in range(chunk_points.shape[0]):
+        seen += 1
+        if seen <= K:
+            res_points[seen-1] = chunk_points[i]
+            if res_colors is not None and chunk_colors is not None:
+                res_colors[seen-1] = chunk_colors[i]
+        else:
+            j = int(rng.integers(1, seen+1))
+            if j <= K:
+                res_points[j-1] = chunk_points[i]
+                if res_colors is not None and chunk_colors is not None:
+                    res_colors[j-1] = chunk_colors[i]
+    return seen
+
+
+def _run(fn, total: int, target: int, seed: int = 7) -> float:
+    rng = np.random.default_rng(seed)
+    src = np.random.default_rng(0)
+    res_pts = np.empty((target, 3), dtype=np.float64)
+    res_cols = np.empty((target, 3), dtype=np.float64)
+    chunk_pts = src.random((CHUNK, 3))
+    chunk_cols = src.random((CHUNK, 3))
+    seen = 0
+    t0 = time.perf_counter()
+    while seen < total:
+        n = min(CHUNK, total - seen)
+        seen = fn(res_pts, res_cols, seen, chunk_pts[:n], chunk_cols[:n], rng)
+    return total / (time.perf_counter() - t0)
+
+
+def _uniformity(total: int, target: int, trials: int = 200) -> float:
+    # frequenza di inclusione per indice sorgente: deve essere ~ target/total ovunque
+    counts = np.zeros(total, dtype=np.int64)
+    src = np.arange(total, dtype=np.float64)[:, None].repeat(3, axis=1)
+    for s in range(trials):
+        rng = np.random.default_rng(s)
+        res = np.empty((target, 3), dtype=np.float64)
+        seen = 0
+        for a in range(0, total, 1000):
+            seen = reservoir_update(res, None, seen, src[a:a+1000], None, rng)
+        counts[res[:, 0].astype(np.int64)] += 1
+    p = target / total
+    freq = counts / trials
+    # rapporto tra dispersione osservata e quella binomiale attesa: ~1.0 se uniforme
+    return float(freq.std() / np.sqrt(p * (1.0 - p) / trials))
+
+
+def main():
+    target = 100_000
+    print(f"{'impl':<12}{'punti':>14}{'punti/s':>16}")
+    loop_n = 1_000_000
+    pps = _run(_reservoir_update_loop, loop_n, target)
+    print(f"{'loop':<12}{loop_n:>14,}{pps:>16,.0f}")
+    for total in (1_000_000, 20_000_000):
+        pps_v = _run(reservoir_update, total, target)
+        print(f"{'vectorized':<12}{total:>14,}{pps_v:>16,.0f}")
+    print(f"speedup ~{pps_v / pps:,.0f}x")
+    print(f"uniformita': std osservata / std binomiale = {_uniformity(10_000, 1_000):.3f} (atteso ~1.0)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Benchmark latenza ROI al variare dei worker (letture a freddo, cache disattivata).
+
+Uso (dalla cartella PointAI_v5_6):
+    python -m bench.bench_roi [n_punti]
+"""
+from __future__ import annotations
+import os, sys, time, shutil, tempfile
+import numpy as np
+
+from bench.bench_build import _make_las
+from core.oc_build import build_store_from_source
+from core.oc_store import PointStore
+from core.oc_query import load_roi
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 3_000_000
+    tmp = tempfile.mkdtemp(prefix="pointai_bench_")
+    try:
+        src = os.path.join(tmp, "src.las")
+        store = os.path.join(tmp, "store.zarr")
+        _make_las(src, n)
+        build_store_from_source(src, store, tile_size=25.0, mode="stream", workers=os.cpu_count() or 1)
+
+        center = np.array([250.0, 250.0, 15.0])
+        cpus = os.cpu_count() or 1
+        print(f"punti {n:,} | cpu {cpus}")
+        print(f"{'radius':>8}{'workers':>9}{'punti':>12}{'ms':>10}{'first tile ms':>15}")
+        for radius in (50.0, 150.0):
+            for w in sorted({1, 2, 4, 8, cpus}):
+                ps = PointStore(store, cache_mb=0)
+                ps.manifest(0)
+                first = []
+                t0 = time.perf_counter()
+                P, _ = load_roi(ps, 0, center, radius, max_points=10**9, workers=w,
+                                on_tile=lambda *a: first or first.append(time.perf_counter()))
+                dt = time.perf_counter() - t0
+                ft = (first[0] - t0) if first else dt
+                print(f"{radius:>8.0f}{w:>9}{P.shape[0]:>12,}{dt*1000:>10.1f}{ft*1000:>15.1f}")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
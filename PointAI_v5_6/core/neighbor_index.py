@@ -0,0 +1,137 @@
+from __future__ import annotations
+import copy
+import numpy as np
+import open3d as o3d
+
+_QUERY_ROWS = 1_000_000   # punti per chiamata di ricerca (limita la RAM temporanea)
+_KNN_GROW_BYTES = 1 << 30 # sovra-ricerca k-NN (crescita geometrica) solo entro questa cache
+
+
+class NeighborIndex:
+    """
+    Indice dei vicini legato a una nuvola: ricerca (open3d.core.nns) costruita una volta e
+    risultati in cache tra un comando e l'altro.
+    - k-NN: distanze ordinate per il k chiesto; k minori sono una slice. Se serve un k maggiore
+      la cache cresce in modo geometrico (almeno 2x, entro _KNN_GROW_BYTES): denoise 20 -> 25 -> 30
+      ricerca una volta sola dopo la prima.
+    - raggio: vicini (CSR) per l'eps massimo chiesto finora; eps minori filtrano le distanze.
+    Una nuvola diversa (altro oggetto o numero di punti) richiede un nuovo indice: vedi matches().
+    """
+
+    def __init__(self, pcd: o3d.geometry.PointCloud):
+        self.pcd = pcd
+        self.points = np.asarray(pcd.points)
+        self.n = int(self.points.shape[0])
+        self._nns = None
+        self._knn: np.ndarray | None = None      # N x k distanze (non al quadrato), self inclusa
+        self._radius = 0.0
+        self._rad: tuple | None = None           # (splits N+1, indices, d2)
+
+    def matches(self, pcd) -> bool:
+        return pcd is self.pcd and len(pcd.points) == self.n
+
+    def rebind(self, pcd: o3d.geometry.PointCloud) -> "NeighborIndex":
+        """Stessa ricerca e cache per una copia con gli stessi punti (es. dbscan_clusters: solo colori nuovi)."""
+        other = copy.copy(self)
+        other.pcd = pcd
+        other.points = np.asarray(pcd.points)
+        return other
+
+    def _search(self):
+        if self._nns is None:
+            self._nns = o3d.core.nns.NearestNeighborSearch(o3d.core.Tensor(np.ascontiguousarray(self.points)))
+        return self._nns
+
+    def knn_distances(self, k: int) -> np.ndarray:
+        """N x min(k, N) distanze dai k vicini piu' vicini (il punto stesso incluso, come KDTreeFlann)."""
+        k = max(1, min(int(k), self.n))
+        if self._knn is None or self._knn.shape[1] < k:
+            kf = k
+            if self._knn is not None:   # k cresce: raddoppia (ricerche successive in cache), se la RAM lo consente
+                kf = min(self.n, max(k, min(2*self._knn.shape[1], _KNN_GROW_BYTES // (4*self.n))))
+            nns = self._search()
+            nns.knn_index()
+            out = np.empty((self.n, kf), dtype=np.float32)
+            for a in range(0, self.n, _QUERY_ROWS):
+                b = min(self.n, a + _QUERY_ROWS)
+                _, d2 = nns.knn_search(o3d.core.Tensor(np.ascontiguousarray(self.points[a:b])), kf)
+                out[a:b] = np.sqrt(d2.numpy())
+            self._knn = out
+        return self._knn[:, :k]
+
+    def radius_neighbors(self, eps: float) -> tuple[np.ndarray, np.ndarray]:
+        """(splits N+1, indices): vicini entro eps di ogni punto (CSR, il punto stesso incluso)."""
+        eps = float(eps)
+        if self._rad is None or eps > self._radius:
+            nns = self._search()
+            nns.fixed_radius_index(eps)
+            counts, idx, d2 = [], [], []
+            for a in range(0, self.n, _QUERY_ROWS):
+                b = min(self.n, a + _QUERY_ROWS)
+                i, d, splits = nns.fixed_radius_search(o3d.core.Tensor(np.ascontiguousarray(self.points[a:b])), eps)
+                counts.append(np.diff(splits.numpy()))
+                idx.append(i.numpy().astype(np.int32))
+                d2.append(d.numpy().astype(np.float32))
+            splits = np.r_[0, np.cumsum(np.concatenate(counts))].astype(np.int64)
+            self._rad = (splits, np.concatenate(idx), np.concatenate(d2))
+            self._radius = eps
+        splits, idx, d2 = self._rad
+        if eps == self._radius:
+            return splits, idx
+        keep = d2 <= np.float32(eps*eps)
+        rows = np.repeat(np.arange(self.n), np.diff(splits))
+        counts = np.bincount(rows[keep], minlength=self.n)
+        return np.r_[0, np.cumsum(counts)].astype(np.int64), idx[keep]
+
+
+def statistical_inliers(index: NeighborIndex, nb_neighbors: int, std_ratio: float) -> np.ndarray:
+    """Indici tenuti da remove_statistical_outlier di Open3D, dalle distanze k-NN in cache."""
+    avg = index.knn_distances(nb_neighbors).mean(axis=1, dtype=np.float64)
+    valid = avg > 0
+    if index.n < 2:
+        return np.flatnonzero(valid)
+    mean = avg[valid].sum() / index.n
+    std = np.sqrt(((avg[valid] - mean)**2).sum() / (index.n - 1))
+    return np.flatnonzero(valid & (avg < mean + std_ratio*std))
+
+
+def dbscan_labels(index: NeighborIndex, eps: float, min_points: int) -> np.ndarray:
+    """
+    Etichette come cluster_dbscan di Open3D (-1 rumore), dai vicini entro eps in cache.
+    Cluster = componenti connesse dei punti core (>= min_points vicini), numerati per indice del
+    primo punto core; un punto di bordo va al cluster con etichetta minore tra quelli che lo raggiungono.
+    """
+    splits, idx = index.radius_neighbors(eps)
+    n = index.n
+    core = np.diff(splits) >= int(min_points)
+    rows = np.repeat(np.arange(n), np.diff(splits))
+
+    # componenti connesse sugli archi core-core: aggancio al minimo + compressione dei cammini
+    e = core[rows] & core[idx]
+    i, j = rows[e], idx[e].astype(np.int64)
+    parent = np.arange(n)
+    while True:
+        pi, pj = parent[i], parent[j]
+        lo, hi = np.minimum(pi, pj), np.maximum(pi, pj)
+        diff = lo != hi
+        if not diff.any():
+            break
+        np.minimum.at(parent, hi[diff], lo[diff])
+        while True:
+            pp = parent[parent]
+            if np.array_equal(pp, parent):
+                break
+            parent = pp
+
+    labels = np.full(n, -1, dtype=np.int64)
+    roots = np.unique(parent[core])          # radice = indice minimo del componente = primo punto core
+    labels[core] = np.searchsorted(roots, parent[core])
+
+    # bordo: etichetta minima tra i core vicini
+    b = ~core[rows] & core[idx]
+    if b.any():
+        border = np.full(n, np.iinfo(np.int64).max)
+        np.minimum.at(border, rows[b], labels[idx[b]])
+        hit = border != np.iinfo(np.int64).max
+        labels[hit] = border[hit]
+    return labels
@@ -0,0 +1,247 @@
+from __future__ import annotations
+from pathlib import Path
+import itertools, shutil
+import threading
+import numpy as np
+import zarr
+
+# Dual-path compression:
+# - Zarr v2: uses numcodecs compressors (e.g., numcodecs.Blosc) via `compressor=`
+# - Zarr v3: uses zarr.codecs via `compressors=` and BytesBytesCodec requirements
+try:
+    from numcodecs import Blosc as _NCBlosc
+except Exception:  # pragma: no cover
+    _NCBlosc = None
+
+try:
+    from zarr.codecs import BloscCodec as _ZBloscCodec  # zarr>=3
+except Exception:  # pragma: no cover
+    _ZBloscCodec = None
+
+
+def _zarr_major() -> int:
+    try:
+        v = getattr(zarr, "__version__", "2.0.0")
+        return int(v.split(".")[0])
+    except Exception:
+        return 2
+
+
+DEFAULT_CODEC = {"cname": "zstd", "clevel": 3, "shuffle": "bitshuffle"}
+
+
+def _make_compressor(cname: str = "zstd", clevel: int = 3, shuffle: str = "bitshuffle"):
+    """Blosc (cname, clevel, shuffle "noshuffle" | "shuffle" | "bitshuffle") per la versione di Zarr installata."""
+    maj = _zarr_major()
+    if maj >= 3 and _ZBloscCodec is not None:
+        # bytes-bytes codec
+        return _ZBloscCodec(cname=cname, clevel=int(clevel), shuffle=shuffle)
+    if _NCBlosc is None:
+        return None
+    modes = {"noshuffle": _NCBlosc.NOSHUFFLE, "shuffle": _NCBlosc.SHUFFLE, "bitshuffle": _NCBlosc.BITSHUFFLE}
+    return _NCBlosc(cname=cname, clevel=int(clevel), shuffle=modes[shuffle])
+
+
+COMP = _make_compressor(**DEFAULT_CODEC)
+ARRAYS = ("points", "colors", "classes")   # classes: codici di classificazione LAS per punto (uint8, opzionale)
+
+
+def _stored_bytes(arr) -> int:
+    try:
+        v = arr.nbytes_stored
+        return int(v() if callable(v) else v)
+    except Exception:
+        return 0
+
+
+def _copy_array_keys(src_store, src_path: str, dst_store, dst_path: str, arr):
+    """Copia metadati e chunk compressi di un array Zarr v2 chiave per chiave (senza listare lo store)."""
+    sep = getattr(arr, "_dimension_separator", None) or "."
+    keys = [".zarray", ".zattrs"]
+    keys += [sep.join(map(str, idx)) for idx in itertools.product(*(range(n) for n in arr.cdata_shape))]
+    for k in keys:
+        try:
+            dst_store[f"{dst_path}/{k}"] = src_store[f"{src_path}/{k}"]
+        except KeyError:
+            pass   # chunk mai scritto / nessun attributo
+
+
+def _merge_ranges(ranges) -> list[tuple[int, int]]:
+    out: list[list[int]] = []
+    for s, e in sorted((int(s), int(e)) for s, e in ranges):
+        if out and s <= out[-1][1]:
+            out[-1][1] = max(out[-1][1], e)
+        else:
+            out.append([s, e])
+    return [(s, e) for s, e in out]
+
+
+class ZarrBackend:
+    """
+    Array Zarr compressi (Blosc): un gruppo per versione del tile, path "lod{n}/tiles/{key}[/{data}]"
+    con gli array "points", "colors" e "classes". codecs: array -> {cname, clevel, shuffle} (StoreMeta.codecs),
+    gli array non elencati usano DEFAULT_CODEC. Ogni array Zarr registra il proprio compressore:
+    tile scritti con codec diversi restano leggibili.
+    """
+    name = "zarr"
+
+    def __init__(self, root: str | Path, codecs: dict | None = None):
+        self.root = Path(root)
+        self.z = zarr.open_group(str(self.root), mode="a")
+        self._lock = threading.Lock()
+        self._comp = {n: _make_compressor(**c) for n, c in (codecs or {}).items()}
+
+    def ensure_lod(self, lod: int):
+        with self._lock:
+            self.z.require_group(f"lod{lod}").require_group("tiles")
+
+    def tile_keys(self, lod: int) -> list[str]:
+        try:
+            return list(self.z[f"lod{lod}/tiles"].group_keys())
+        except KeyError:
+            return []
+
+    def _create_array(self, g, name: str, data: np.ndarray, chunk_rows: int):
+        n = int(len(data)) or 1
+        chunks = (min(int(chunk_rows), n),) + tuple(data.shape[1:])
+        comp = self._comp.get(name, COMP)
+
+        if name in g:
+            del g[name]
+
+        if _zarr_major() >= 3:
+            # Zarr v3 requires shape/dtype and uses `compressors=`
+            kwargs = dict(shape=data.shape, dtype=data.dtype, chunks=chunks, overwrite=True)
+            if comp is not None:
+                kwargs["compressors"] = [comp]
+            arr = g.create_dataset(name, **kwargs)
+            arr[:] = data
+            return arr
+
+        # Zarr v2 path: accepts data= and `compressor=`
+        kwargs = dict(data=data, chunks=chunks, overwrite=True)
+        if comp is not None:
+            kwargs["compressor"] = comp
+        return g.create_dataset(name, **kwargs)
+
+    def write(self, path: str, arrays: dict, chunk_rows: int = 200_000) -> int:
+        """Scrive gli array (None = rimuovi) a chunk di chunk_rows righe; ritorna i byte su disco della versione."""
+        with self._lock:   # require_group concorrenti sullo stesso gruppo nuovo: ContainsGroupError
+            g = self.z.require_group(path)
+        for name, data in arrays.items():
+            if data is not None:
+                self._create_array(g, name, data, chunk_rows)
+            elif name in g:
+                del g[name]
+        return self.stored_bytes(path)
+
+    def stored_bytes(self, path: str) -> int:
+        g = self.z[path]
+        return sum(_stored_bytes(g[n]) for n in ARRAYS if n in g)
+
+    def read(self, path: str, name: str) -> np.ndarray | None:
+        try:
+            return np.asarray(self.z[f"{path}/{name}"])
+        except KeyError:
+            return None
+
+    def read_rows(self, path: str, name: str, ranges) -> np.ndarray | None:
+        """Righe [a, b) concatenate: si decomprimono solo i chunk che le contengono."""
+        try:
+            a = self.z[f"{path}/{name}"]
+        except KeyError:
+            return None
+        return np.concatenate([a[s:e] for s, e in _merge_ranges(ranges)])
+
+    def delete(self, path: str):
+        del self.z[path]
+
+    def copy_from(self, src, src_path: str, dst_path: str) -> int | None:
+        """Copia degli array senza decodifica (chunk compressi cosi' come sono); None se non possibile."""
+        if not isinstance(src, ZarrBackend) or _zarr_major() >= 3:
+            return None
+        with self._lock:
+            g = self.z.require_group(dst_path)
+        sg = src.z[src_path]
+        for n in ARRAYS:
+            if n in g:
+                del g[n]
+            if n in sg:
+                _copy_array_keys(src.z.store, f"{src_path}/{n}", self.z.store, f"{dst_path}/{n}", sg[n])
+        return self.stored_bytes(dst_path)
+
+
+class MmapBackend:
+    """
+    Array non compressi: un file .npy per array ("lod{n}/tiles/{key}[/{data}]/points.npy"),
+    letto con np.load(mmap_mode="r"). Nessuna decompressione: le letture sono mappe read-only
+    sulla page cache del sistema operativo, in cambio di piu' spazio su disco (nessuna compressione).
+    """
+    name = "mmap"
+
+    def __init__(self, root: str | Path, codecs: dict | None = None):
+        self.root = Path(root)   # codecs ignorati: nessuna compressione
+
+    def ensure_lod(self, lod: int):
+        (self.root / f"lod{lod}" / "tiles").mkdir(parents=True, exist_ok=True)
+
+    def tile_keys(self, lod: int) -> list[str]:
+        d = self.root / f"lod{lod}" / "tiles"
+        return [p.name for p in d.iterdir() if p.is_dir()] if d.is_dir() else []
+
+    def write(self, path: str, arrays: dict, chunk_rows: int = 200_000) -> int:
+        d = self.root / path
+        d.mkdir(parents=True, exist_ok=True)
+        for name, data in arrays.items():
+            f = d / f"{name}.npy"
+            if data is None:
+                f.unlink(missing_ok=True)
+                continue
+            tmp = d / f"{name}.npy.tmp"
+            with open(tmp, "wb") as fh:
+                np.save(fh, np.ascontiguousarray(data))
+            tmp.replace(f)
+        return self.stored_bytes(path)
+
+    def stored_bytes(self, path: str) -> int:
+        files = (self.root / path / f"{n}.npy" for n in ARRAYS)
+        return sum(f.stat().st_size for f in files if f.exists())
+
+    def read(self, path: str, name: str) -> np.ndarray | None:
+        f = self.root / path / f"{name}.npy"
+        if not f.exists():
+            return None
+        return np.load(f, mmap_mode="r")
+
+    def read_rows(self, path: str, name: str, ranges) -> np.ndarray | None:
+        a = self.read(path, name)
+        if a is None:
+            return None
+        return np.concatenate([a[s:e] for s, e in _merge_ranges(ranges)])
+
+    def delete(self, path: str):
+        # Windows: file ancora mappati (array in cache) non si possono rimuovere; restano orfani
+        shutil.rmtree(self.root / path, ignore_errors=True)
+
+    def copy_from(self, src, src_path: str, dst_path: str) -> int | None:
+        if not isinstance(src, MmapBackend):
+            return None
+        d = self.root / dst_path
+        d.mkdir(parents=True, exist_ok=True)
+        for n in ARRAYS:
+            f = src.root / src_path / f"{n}.npy"
+            if f.exists():
+                shutil.copyfile(f, d / f"{n}.npy")
+            else:
+                (d / f"{n}.npy").unlink(missing_ok=True)
+        return self.stored_bytes(dst_path)
+
+
+BACKENDS = {b.name: b for b in (ZarrBackend, MmapBackend)}
+
+
+def open_backend(name: str, root: str | Path, codecs: dict | None = None):
+    try:
+        return BACKENDS[name](root, codecs)
+    except KeyError:
+        raise ValueError(f"Backend non supportato: {name}") from None
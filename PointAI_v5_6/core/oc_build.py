@@ -1,14 +1,17 @@
 from __future__ import annotations
-import os, math
+import os, math, shutil
 import numpy as np
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from core.oc_store import PointStore, StoreMeta
-from core.stream_loaders import load_las_laz_reservoir, load_e57_sample
-
-def _tile_indices(points: np.ndarray, tile_size: float, bmin: np.ndarray):
-    rel = (points - bmin) / tile_size
-    return np.floor(rel).astype(np.int32)
+from core.oc_backend import BACKENDS
+from core.oc_tiles import split_by_tile
+from core.oc_parallel import bounded_map
+from core.stream_loaders import (
+    load_las_laz_reservoir, load_e57_sample,
+    las_laz_info, iter_las_laz_chunks, iter_array_chunks
+)
 
 def _voxel_down(points: np.ndarray, colors: np.ndarray | None, voxel: float):
     q = np.floor(points / voxel).astype(np.int64)
@@ -18,14 +21,67 @@ def _voxel_down(points: np.ndarray, colors: np.ndarray | None, voxel: float):
     cols = colors[first] if colors is not None else None
     return pts, cols
 
+def _write_tile(ps: PointStore, lod: int, key, pts: np.ndarray, cols: np.ndarray | None):
+    ps.write_tile(lod, key[0], key[1], key[2], pts, cols)
+
+
+def _write_hierarchy(ps: PointStore, keys_per_lod: list[list[str]]):
+    """
+    Relazioni parent/child tra LOD adiacenti, nel manifest di ogni LOD.
+    Stessa griglia a tutti i LOD e piramide (LOD n+1 sottoinsieme di LOD n): il child di un
+    tile e' lo stesso tile al LOD n-1; il parent puo' mancare se i suoi voxel grossolani
+    sono rappresentati da punti di un tile vicino.
+    """
+    for li, keys in enumerate(keys_per_lod):
+        coarser = set(keys_per_lod[li+1]) if li+1 < len(keys_per_lod) else set()
+        finer = set(keys_per_lod[li-1]) if li > 0 else set()
+        m = ps.manifest(li)
+        for k in keys:
+            m.set_links(k, k if k in coarser else None, [k] if k in finer else [])
+    ps.write_manifests()
+
+
 def build_store_from_source(
     source_path: str,
     store_dir: str,
     tile_size: float = 50.0,
     lod_voxels: list[float] = [0.10, 0.25, 0.50, 1.0],
     max_points_ingest: int = 10_000_000,
-    progress_cb=None
+    progress_cb=None,
+    mode: str = "sample",
+    memory_budget_mb: float = 1024.0,
+    workers: int = 1,
+    encoding: str = "quantized",
+    coord_scale: float = 0.001,
+    color_dtype: str = "uint8",
+    backend: str = "zarr",
+    codecs: dict | None = None,
+    point_order: str = "morton",
+    chunk_points: int = 10_000
 ):
+    """
+    mode="sample": ingest a campione (max_points_ingest) in RAM, poi LOD.
+    mode="stream": full-res tile-first, RAM limitata da memory_budget_mb (vedi _build_streaming).
+    workers: thread per calcolo LOD e compressione/scrittura tile (Blosc rilascia il GIL).
+    encoding="quantized": XYZ interi relativi all'origine tile (passo coord_scale, come LAS),
+    colori color_dtype ("uint8" | "uint16"); encoding="float32": formato v5 originale.
+    backend: "zarr" (Blosc) | "mmap" (.npy non compressi, letture senza decompressione).
+    codecs: array -> {cname, clevel, shuffle} (es. da core.oc_codecs.tune_codecs su uno store simile).
+    point_order="morton": punti del tile in ordine di Morton, a chunk di chunk_points righe con bbox
+    nel manifest (le ROI piccole leggono solo i chunk che toccano); "ingest": ordine di lettura.
+    """
+    workers = max(1, int(workers))
+    if encoding == "quantized":
+        enc = dict(point_encoding="quantized", coord_scale=float(coord_scale), color_encoding=str(color_dtype))
+    elif encoding == "float32":
+        enc = dict(point_encoding="float32", coord_scale=None, color_encoding="float32")
+    else:
+        raise ValueError(f"Encoding non supportato: {encoding}")
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend non supportato: {backend}")
+    if point_order not in ("morton", "ingest"):
+        raise ValueError(f"Ordinamento non supportato: {point_order}")
+    enc.update(backend=backend, codecs=codecs, point_order=point_order, chunk_points=max(1, int(chunk_points)))
     os.makedirs(store_dir, exist_ok=True)
     ps = PointStore(store_dir)
 
@@ -35,6 +91,11 @@ def build_store_from_source(
         if progress_cb:
             progress_cb(float(p), str(m))
 
+    if mode == "stream":
+        return _build_streaming(ps, source_path, tile_size, lod_voxels, memory_budget_mb, workers, enc, cb)
+    if mode != "sample":
+        raise ValueError(f"Modalita' build non supportata: {mode}")
+
     cb(1.0, "Ingest: caricamento campione ...")
     if ext in (".las", ".laz"):
         pts, cols = load_las_laz_reservoir(
@@ -72,30 +133,177 @@ def build_store_from_source(
         tile_size=float(tile_size),
         lod_voxel_sizes=[float(v) for v in lod_voxels],
         has_rgb=(cols is not None),
+        lod_pyramid=True,
+        **enc,
     )
     ps.write_meta(meta)
     ps.ensure_ops()
+    ps.reset_manifests(len(lod_voxels))
 
-    for li, voxel in enumerate(lod_voxels):
-        cb(20.0 + li*(70.0/len(lod_voxels)), f"LOD{li}: voxel {voxel} ...")
-        lod_pts, lod_cols = _voxel_down(pts, cols, voxel)
+    for li in range(len(lod_voxels)):
+        ps.ensure_lod(li)
 
-        idx = _tile_indices(lod_pts, tile_size, bmin)
-        buckets = defaultdict(list)
-        for i in range(lod_pts.shape[0]):
-            key = (int(idx[i,0]), int(idx[i,1]), int(idx[i,2]))
-            buckets[key].append(i)
+    span = 70.0/len(lod_voxels)
+    keys_per_lod = []
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        # piramide: LOD n+1 = voxel_down(LOD n); il LOD successivo si calcola mentre si scrivono i tile
+        nxt = ex.submit(_voxel_down, pts, cols, lod_voxels[0])
+        for li, voxel in enumerate(lod_voxels):
+            base = 20.0 + li*span
+            cb(base, f"LOD{li}: voxel {voxel} ...")
+            lod_pts, lod_cols = nxt.result()
+            if li + 1 < len(lod_voxels):
+                nxt = ex.submit(_voxel_down, lod_pts, lod_cols, lod_voxels[li+1])
 
-        total_tiles = len(buckets) if buckets else 1
-        for ti, (k, inds) in enumerate(buckets.items()):
-            tile_pts = lod_pts[inds].astype(np.float32)
-            tile_cols = lod_cols[inds].astype(np.float32) if lod_cols is not None else None
-            ps.write_tile(li, k[0], k[1], k[2], tile_pts, tile_cols)
-            base = 20.0 + li*(70.0/len(lod_voxels))
-            span = (70.0/len(lod_voxels))
-            cb(base + (ti/total_tiles)*span, f"LOD{li}: tile {ti+1}/{total_tiles}")
+            groups = list(split_by_tile(lod_pts, tile_size, bmin, lod_cols))
+            total_tiles = len(groups) if groups else 1
+            futs = [ex.submit(_write_tile, ps, li, k, tp, tc) for k, tp, tc in groups]
+            for ti, f in enumerate(as_completed(futs)):
+                f.result()
+                cb(base + ((ti+1)/total_tiles)*span, f"LOD{li}: tile {ti+1}/{total_tiles}")
+            keys_per_lod.append([ps._tile_key(*k) for k, _, _ in groups])
 
-        cb(20.0 + (li+1)*(70.0/len(lod_voxels)), f"LOD{li}: scritto {len(buckets)} tiles ({lod_pts.shape[0]:,} punti)")
+            cb(20.0 + (li+1)*span, f"LOD{li}: scritto {len(groups)} tiles ({lod_pts.shape[0]:,} punti)")
 
+    _write_hierarchy(ps, keys_per_lod)
     cb(100.0, f"Store creato in: {store_dir}")
     return store_dir
+
+
+class _TileSpill:
+    """Buffer per-tile su disco: i chunk vengono instradati ai tile e scaricati
+    in file append-only quando la RAM bufferizzata supera il budget."""
+
+    def __init__(self, spill_dir: str, has_rgb: bool, budget_bytes: int):
+        self.dir = spill_dir
+        self.budget = max(1, int(budget_bytes))
+        fields = [("xyz", "<f8", (3,))]
+        if has_rgb:
+            fields.append(("rgb", "<f4", (3,)))
+        self.dtype = np.dtype(fields)
+        self.has_rgb = has_rgb
+        self.buffers = defaultdict(list)
+        self.counts = defaultdict(int)
+        self.buffered = 0
+        os.makedirs(self.dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.dir, f"{key[0]}_{key[1]}_{key[2]}.bin")
+
+    def add(self, pts: np.ndarray, cols: np.ndarray | None, tile_size: float, bmin: np.ndarray):
+        for key, tp, tc in split_by_tile(pts, tile_size, bmin, cols):
+            rec = np.empty(tp.shape[0], dtype=self.dtype)
+            rec["xyz"] = tp
+            if self.has_rgb:
+                rec["rgb"] = tc
+            self.buffers[key].append(rec)
+            self.counts[key] += rec.shape[0]
+            self.buffered += rec.nbytes
+        if self.buffered >= self.budget:
+            self.flush()
+
+    def flush(self):
+        for key, recs in self.buffers.items():
+            with open(self._path(key), "ab") as f:
+                for r in recs:
+                    r.tofile(f)
+        self.buffers.clear()
+        self.buffered = 0
+
+    def read(self, key):
+        return np.fromfile(self._path(key), dtype=self.dtype)
+
+    def cleanup(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def _build_streaming(ps: PointStore, source_path: str, tile_size: float, lod_voxels: list[float],
+                     memory_budget_mb: float, workers: int, enc: dict, cb):
+    """
+    Build full-res: legge la sorgente a chunk e instrada ogni punto al proprio tile
+    (spill su disco), poi finalizza i tile (LOD calcolati per-tile), `workers` alla volta.
+    Picco RAM ~ memory_budget_mb + workers * tile piu' grande.
+    """
+    ext = os.path.splitext(source_path)[1].lower()
+    cb(1.0, "Stream: lettura header ...")
+    if ext in (".las", ".laz"):
+        info = las_laz_info(source_path)
+        total = info["count"]
+        bmin = info["bounds_min"]
+        has_rgb = info["has_rgb"]
+        chunks = iter_las_laz_chunks(source_path)
+    else:
+        # E57/PLY/...: nessuna lettura a chunk disponibile, la sorgente viene letta intera
+        if ext == ".e57":
+            pts, cols = load_e57_sample(source_path, target_points=2**62)
+        else:
+            import open3d as o3d
+            pcd = o3d.io.read_point_cloud(source_path)
+            pts = np.asarray(pcd.points).astype(np.float64)
+            cols = np.asarray(pcd.colors).astype(np.float64) if pcd.has_colors() else None
+        total = int(pts.shape[0])
+        bmin = pts.min(axis=0)
+        has_rgb = cols is not None
+        chunks = iter_array_chunks(pts, cols)
+
+    # origine della griglia tile = bmin dell'header; bmax reale aggiornato in streaming
+    spill = _TileSpill(os.path.join(str(ps.root), "_spill"), has_rgb, int(memory_budget_mb * 1024 * 1024))
+    bmax = np.full(3, -np.inf)
+    read = 0
+    try:
+        for pts, cols in chunks:
+            if pts.shape[0] == 0:
+                continue
+            bmax = np.maximum(bmax, pts.max(axis=0))
+            spill.add(pts, cols, tile_size, bmin)
+            read += pts.shape[0]
+            cb(1.0 + 59.0*min(1.0, read/max(1, total)), f"Stream: letti {read:,}/{total:,} punti | tiles {len(spill.counts)}")
+        spill.flush()
+        if read == 0:
+            raise ValueError("Nuvola punti vuota.")
+
+        meta = StoreMeta(
+            version=5,
+            crs=None,
+            bounds_min=np.asarray(bmin, dtype=np.float64).tolist(),
+            bounds_max=bmax.tolist(),
+            tile_size=float(tile_size),
+            lod_voxel_sizes=[float(v) for v in lod_voxels],
+            has_rgb=has_rgb,
+            lod_pyramid=True,
+            **enc,
+        )
+        ps.write_meta(meta)
+        ps.ensure_ops()
+        ps.reset_manifests(len(lod_voxels))
+
+        for li in range(len(lod_voxels)):
+            ps.ensure_lod(li)
+
+        def finalize(key):
+            rec = spill.read(key)
+            tpts = rec["xyz"]
+            tcols = rec["rgb"] if has_rgb else None
+            counts = []
+            lp, lc = tpts, tcols
+            for li, voxel in enumerate(lod_voxels):
+                lp, lc = _voxel_down(lp, lc, voxel)
+                _write_tile(ps, li, key, lp, lc)
+                counts.append(lp.shape[0])
+            return rec.shape[0], counts
+
+        keys = list(spill.counts.keys())
+        lod_counts = [0]*len(lod_voxels)
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            for ti, (_, (n, counts)) in enumerate(bounded_map(ex, finalize, keys, workers)):
+                lod_counts = [a + b for a, b in zip(lod_counts, counts)]
+                cb(60.0 + 39.0*(ti+1)/len(keys), f"Stream: tile {ti+1}/{len(keys)} ({n:,} punti)")
+        # ogni tile sorgente esiste a tutti i LOD (voxel_down di un tile non vuoto e' non vuoto)
+        tkeys = [ps._tile_key(*k) for k in keys]
+        _write_hierarchy(ps, [tkeys]*len(lod_voxels))
+    finally:
+        spill.cleanup()
+
+    summary = ", ".join(f"LOD{li} {n:,}" for li, n in enumerate(lod_counts))
+    cb(100.0, f"Store creato in: {ps.root} ({len(keys)} tiles | {summary})")
+    return str(ps.root)
@@ -0,0 +1,69 @@
+from __future__ import annotations
+from collections import OrderedDict
+import threading
+import numpy as np
+
+
+class TileCache:
+    """
+    Cache LRU dei tile decodificati, con budget in byte.
+    Chiave: (lod, tile key, versione tile). Gli array in cache sono read-only:
+    chi li riceve deve copiarli prima di modificarli.
+    """
+
+    def __init__(self, max_bytes: int = 512 * 1024 * 1024):
+        self.max_bytes = int(max_bytes)
+        self._items: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _size(value) -> int:
+        return sum(a.nbytes for a in value if isinstance(a, np.ndarray))
+
+    def get(self, key):
+        with self._lock:
+            v = self._items.get(key)
+            if v is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return v
+
+    def put(self, key, value):
+        size = self._size(value)
+        if size > self.max_bytes:
+            return
+        for a in value:
+            if isinstance(a, np.ndarray):
+                a.setflags(write=False)
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.bytes -= self._size(old)
+            self._items[key] = value
+            self.bytes += size
+            while self.bytes > self.max_bytes and self._items:
+                _, ev = self._items.popitem(last=False)
+                self.bytes -= self._size(ev)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._items),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,402 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+import math, shutil, tempfile
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from core.oc_store import PointStore
+from core.oc_parallel import bounded_map
+
+# codici di classificazione LAS (array "classes" dei tile)
+NEVER_CLASSIFIED = 0
+UNCLASSIFIED = 1
+GROUND = 2
+NOISE = 7
+
+_QUERY_ROWS = 1_000_000   # punti per chiamata di ricerca (limita la RAM temporanea)
+
+
+def _knn_distances(data: np.ndarray, query: np.ndarray, k: int) -> np.ndarray:
+    """len(query) x k distanze (non al quadrato) dai k punti di `data` piu' vicini, crescenti."""
+    import open3d as o3d   # solo per gli outlier: classify_ground non richiede Open3D
+    nns = o3d.core.nns.NearestNeighborSearch(o3d.core.Tensor(np.ascontiguousarray(data)))
+    nns.knn_index()
+    out = np.empty((query.shape[0], k), dtype=np.float64)
+    for a in range(0, query.shape[0], _QUERY_ROWS):
+        b = min(query.shape[0], a + _QUERY_ROWS)
+        _, d2 = nns.knn_search(o3d.core.Tensor(np.ascontiguousarray(query[a:b])), k)
+        out[a:b] = np.sqrt(d2.numpy())
+    return out
+
+
+def _alive(ps: PointStore, lod: int, ops, e: dict):
+    """(points float32 del tile, maschera keep delle sole op geometriche | None = tutti)."""
+    pts, _ = ps.read_tile(lod, *e["ijk"])
+    return pts, ops.evaluate(pts, e["bmin"], e["bmax"])
+
+
+def _region(ps: PointStore, lod: int, ops, mn: np.ndarray, mx: np.ndarray) -> np.ndarray:
+    """Punti (float64, op geometriche applicate) di tutti i tile dentro [mn, mx]: tile + halo."""
+    m = ps.manifest(lod)
+    parts = []
+    for key in m.query_box(mn, mx):
+        e = m.get(key)
+        pts, keep = _alive(ps, lod, ops, e)
+        if keep is not None:
+            pts = pts[keep]
+        if not ((np.asarray(e["bmin"]) >= mn).all() and (np.asarray(e["bmax"]) <= mx).all()):
+            pts = pts[((pts >= mn) & (pts <= mx)).all(axis=1)]
+        parts.append(pts)
+    return np.concatenate(parts).astype(np.float64) if parts else np.empty((0, 3))
+
+
+def _knn_streamed(ps: PointStore, lod: int, ops, q: np.ndarray, k: int) -> np.ndarray:
+    """
+    Come _knn_distances su tutto il LOD, ma un tile alla volta: tile in ordine di distanza del bbox,
+    stop quando nessun tile rimasto puo' avere punti piu' vicini del k-esimo trovato. Per pochi punti
+    isolati (RAM = un tile); le colonne oltre i punti del LOD restano +inf.
+    """
+    m = ps.manifest(lod)
+    keys, _, bmin, bmax, count = m.arrays()
+    live = np.flatnonzero(count > 0)
+    bmin, bmax = bmin[live], bmax[live]
+    out = np.empty((q.shape[0], k))
+    step = max(1, 2_000_000 // max(1, live.size))   # righe di q per blocco (matrice q x tile limitata)
+    for a in range(0, q.shape[0], step):
+        qb = q[a:a + step]
+        gap = np.maximum(bmin[None] - qb[:, None], 0.0) + np.maximum(qb[:, None] - bmax[None], 0.0)
+        bd = np.sqrt((gap*gap).sum(axis=2))
+        best = np.full((qb.shape[0], k), np.inf)
+        for t in np.argsort(bd.min(axis=0), kind="stable"):
+            if bd[:, t].min() > best[:, -1].max():
+                break
+            act = bd[:, t] <= best[:, -1]
+            if not act.any():
+                continue
+            pts, keep = _alive(ps, lod, ops, m.get(keys[live[t]]))
+            if keep is not None:
+                pts = pts[keep]
+            if pts.shape[0] == 0:
+                continue
+            d = _knn_distances(pts.astype(np.float64), qb[act], min(k, pts.shape[0]))
+            best[act] = np.sort(np.hstack([best[act], d]), axis=1)[:, :k]
+        out[a:a + step] = best
+    return out
+
+
+def _tile_avg_distances(ps: PointStore, lod: int, ops, e: dict, k: int, halo: float, max_halo: float, lo, hi):
+    """
+    Distanza media dai k vicini (il punto stesso incluso, come remove_statistical_outlier) dei punti vivi
+    del tile, cercati nel tile + halo. Un punto e' esatto se il suo k-esimo vicino e' piu' vicino del bordo
+    della regione caricata (oltre il bordo potrebbero esserci punti piu' vicini); gli altri vengono
+    ricercati con halo doppio, fino a max_halo (RAM: al piu' tile + max_halo per lato); i punti ancora
+    incerti (isolati: rumore, ritorni sparsi) passano a _knn_streamed. Ritorna (keep, avg per punto vivo).
+    """
+    pts, keep = _alive(ps, lod, ops, e)
+    q = (pts if keep is None else pts[keep]).astype(np.float64)
+    avg = np.zeros(q.shape[0])
+    todo = np.arange(q.shape[0])
+    bmin, bmax = np.asarray(e["bmin"]), np.asarray(e["bmax"])
+    h = min(float(halo), float(max_halo))
+    while todo.size:
+        mn, mx = bmin - h, bmax + h
+        data = _region(ps, lod, ops, mn, mx)
+        kk = min(k, data.shape[0])
+        d = _knn_distances(data, q[todo], kk)
+        qt = q[todo]
+        room = np.minimum(np.where(mn <= lo, np.inf, qt - mn), np.where(mx >= hi, np.inf, mx - qt)).min(axis=1)
+        ok = d[:, -1] <= room if kk == k else np.isinf(room)
+        avg[todo[ok]] = d[ok].mean(axis=1)
+        todo = todo[~ok]
+        if todo.size and h >= max_halo:
+            d = _knn_streamed(ps, lod, ops, q[todo], k)
+            found = np.isfinite(d)   # meno di k punti nel LOD: media sui vicini trovati, come KDTreeFlann
+            avg[todo] = np.where(found, d, 0.0).sum(axis=1) / np.maximum(found.sum(axis=1), 1)
+            break
+        h = min(2.0*h, float(max_halo))
+    return keep, avg
+
+
+def classify_outliers(store_dir: str, nb_neighbors: int = 20, std_ratio: float = 2.0, lods=None,
+                      halo: float | None = None, max_halo: float | None = None, workers: int = 1,
+                      cache_mb: float = 512.0, apply: bool = True, progress_cb=None) -> dict:
+    """
+    Statistical outlier removal (stessi criteri di remove_statistical_outlier di Open3D) su tutto lo
+    store, tile per tile in parallelo: RAM limitata da tile + max_halo, mai la nuvola intera.
+    1) per ogni tile, distanza media dai nb_neighbors vicini cercati anche nei tile adiacenti
+       (halo iniziale `halo`, default tile_size/20, raddoppiato dove serve fino a max_halo, default
+       tile_size; oltre, ricerca un tile alla volta: risultato identico alla nuvola intera);
+       distanze su file temporanei nello store, somme per media/deviazione globali.
+    2) soglia mean + std_ratio*std del LOD; i punti sopra vanno in classe 7 (noise) nell'array
+       "classes" del tile, quelli tornati sotto soglia da 7 a 1 (unclassified), le altre classi restano.
+    Si considerano i punti rimasti dopo le op geometriche (bbox/zrange/remove_bbox), non quelle per
+    classe: rilanciare con altri parametri riclassifica anche il rumore gia' nascosto.
+    lods: LOD da classificare (None = tutti, ognuno con le proprie statistiche).
+    apply: aggiunge al journal {"type": "remove_class", "classes": [7]} se non c'e' gia' (undo lo annulla).
+    """
+    def cb(p, m):
+        if progress_cb:
+            progress_cb(float(p), str(m))
+
+    k = max(1, int(nb_neighbors))
+    std_ratio = float(std_ratio)
+    ps = PointStore(store_dir, cache_mb=cache_mb)
+    meta = ps.read_meta()
+    ps.ensure_ops()
+    ops = ps.compiled_ops()
+    lods = list(range(len(meta.lod_voxel_sizes))) if lods is None else [int(l) for l in lods]
+    halo = float(meta.tile_size)/20.0 if halo is None else float(halo)
+    max_halo = float(meta.tile_size) if max_halo is None else float(max_halo)
+    workers = max(1, int(workers))
+    stats = {"tiles": 0, "points": 0, "noise": 0, "op_seq": None}
+
+    spill = tempfile.mkdtemp(prefix="sor_", dir=ps.root)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            for li, lod in enumerate(lods):
+                m = ps.manifest(lod)
+                keys, _, bmin, bmax, count = m.arrays()
+                todo = [keys[i] for i in np.flatnonzero(count > 0) if not ops.drops_tile(bmin[i], bmax[i])]
+                if not todo:
+                    continue
+                lo, hi = bmin[count > 0].min(axis=0), bmax[count > 0].max(axis=0)
+
+                def pass1(key, lod=lod, lo=lo, hi=hi):
+                    keep, avg = _tile_avg_distances(ps, lod, ops, m.get(key), k, halo, max_halo, lo, hi)
+                    np.save(f"{spill}/{lod}_{key}.npy", avg)
+                    if keep is not None:
+                        np.save(f"{spill}/{lod}_{key}_keep.npy", keep)
+                    v = avg[avg > 0]
+                    return avg.shape[0], v.shape[0], float(v.sum()), float((v*v).sum())
+
+                n = nv = 0
+                s1 = s2 = 0.0
+                for ti, (_, (a, b, c, d)) in enumerate(bounded_map(ex, pass1, todo, 2*workers)):
+                    n, nv, s1, s2 = n + a, nv + b, s1 + c, s2 + d
+                    cb(100.0*(li + 0.8*(ti+1)/len(todo))/len(lods), f"Outlier LOD{lod}: vicini tile {ti+1}/{len(todo)}")
+                if n == 0:
+                    continue
+                # come Open3D: media sui punti con distanza > 0 divisa per tutti i punti, deviazione su n-1
+                mean = s1 / n
+                std = np.sqrt(max(0.0, s2 - 2.0*mean*s1 + nv*mean*mean) / (n - 1)) if n > 1 else 0.0
+                thr = mean + std_ratio*std
+
+                def pass2(key, lod=lod):
+                    e = m.get(key)
+                    avg = np.load(f"{spill}/{lod}_{key}.npy")
+                    try:
+                        keep = np.load(f"{spill}/{lod}_{key}_keep.npy")
+                    except FileNotFoundError:
+                        keep = None
+                    noise = ~((avg > 0) & (avg < thr)) if n > 1 else ~(avg > 0)
+                    prev = ps.read_tile_classes(lod, *e["ijk"])
+                    cur = prev.copy()
+                    rows = np.flatnonzero(keep) if keep is not None else np.arange(cur.shape[0])
+                    sub = cur[rows]
+                    sub[noise] = NOISE
+                    sub[~noise & (sub == NOISE)] = UNCLASSIFIED
+                    cur[rows] = sub
+                    if not np.array_equal(cur, prev):
+                        ps.write_tile_classes(lod, *e["ijk"], cur)
+                    return int(noise.sum())
+
+                for ti, (_, r) in enumerate(bounded_map(ex, pass2, todo, 2*workers)):
+                    stats["noise"] += r
+                    cb(100.0*(li + 0.8 + 0.2*(ti+1)/len(todo))/len(lods), f"Outlier LOD{lod}: classi tile {ti+1}/{len(todo)}")
+                ps.save_manifest(lod)
+                stats["tiles"] += len(todo)
+                stats["points"] += n
+    finally:
+        shutil.rmtree(spill, ignore_errors=True)
+
+    ps.journal.mark_classified(method="outliers", lods=lods, nb_neighbors=k, std_ratio=std_ratio)
+    if apply and not any(op.get("type") == "remove_class" and NOISE in op.get("classes", [])
+                         for op in ps.pending_ops()):
+        stats["op_seq"] = ps.append_op({"type": "remove_class", "classes": [NOISE]})
+    cb(100.0, f"Outlier: {stats['noise']:,} punti noise su {stats['points']:,} ({stats['tiles']} tiles)")
+    return stats
+
+
+# ---------- terreno: progressive morphological filter (Zhang et al. 2003) ----------
+def pmf_windows(cell: float = 1.0, max_window: float = 33.0, slope: float = 1.0,
+                initial_distance: float = 0.15, max_distance: float = 2.5) -> list[tuple[int, float]]:
+    """[(finestra in celle, soglia di quota)]: finestre esponenziali 2*2^k+1 fino a max_window metri, come PDAL filters.pmf."""
+    out: list[tuple[int, float]] = []
+    k = 0
+    while 2*2**k + 1 <= max_window / cell:
+        w = 2*2**k + 1
+        ht = initial_distance if not out else slope*(w - out[-1][0])*cell + initial_distance
+        out.append((w, min(ht, max_distance)))
+        k += 1
+    return out
+
+
+def _cells(pts: np.ndarray, origin: np.ndarray, cell: float) -> np.ndarray:
+    return np.floor((pts[:, :2].astype(np.float64) - origin) / cell).astype(np.int64)
+
+
+def _min_raster(c: np.ndarray, z: np.ndarray):
+    """(cella [2] dell'angolo, griglia della quota minima per cella; +inf = cella vuota)."""
+    c0 = c.min(axis=0)
+    shape = c.max(axis=0) - c0 + 1
+    flat = (c[:, 0] - c0[0])*shape[1] + (c[:, 1] - c0[1])
+    order = np.argsort(flat, kind="stable")
+    f = flat[order]
+    starts = np.flatnonzero(np.r_[True, f[1:] != f[:-1]])
+    grid = np.full(int(shape[0]*shape[1]), np.inf)
+    grid[f[starts]] = np.minimum.reduceat(z[order].astype(np.float64), starts)
+    return c0, grid.reshape(shape)
+
+
+def _window(a: np.ndarray, w: int, fill: float, fn) -> np.ndarray:
+    """min/max su finestra quadrata w x w (separabile), bordo = fill."""
+    r = w // 2
+    p = np.pad(a, r, constant_values=fill)
+    return fn(sliding_window_view(fn(sliding_window_view(p, w, axis=0), axis=-1), w, axis=1), axis=-1)
+
+
+def pmf_ground_cells(grid: np.ndarray, windows) -> np.ndarray:
+    """
+    Celle di terreno della griglia di quote minime (+inf = vuota). Per ogni finestra: apertura
+    (erosione min + dilatazione max) sulle sole celle ancora terreno, le celle sopra l'apertura di
+    piu' della soglia escono. L'esito di una cella dipende solo dalle celle entro sum(w-1) (pmf_reach).
+    """
+    valid = np.isfinite(grid)
+    z = grid.copy()
+    for w, ht in windows:
+        eroded = _window(z, w, np.inf, np.min)
+        opened = _window(np.where(valid, eroded, -np.inf), w, -np.inf, np.max)
+        valid &= (z - opened) < ht
+        z[~valid] = np.inf
+    return valid
+
+
+def pmf_reach(windows) -> int:
+    return int(sum(w - 1 for w, _ in windows))
+
+
+def _ground_tile(ps: PointStore, lod: int, ops, e: dict):
+    """(points, classes, punti usati per il terreno: rimasti dopo le op geometriche e non noise)."""
+    pts, keep = _alive(ps, lod, ops, e)
+    cls = ps.read_tile_classes(lod, *e["ijk"])
+    use = cls != NOISE
+    if keep is not None:
+        use &= keep
+    return pts, cls, use
+
+
+def classify_ground(store_dir: str, cell: float = 1.0, max_window: float = 33.0, slope: float = 1.0,
+                    initial_distance: float = 0.15, max_distance: float = 2.5, lods=None, workers: int = 1,
+                    cache_mb: float = 512.0, progress_cb=None) -> dict:
+    """
+    Terreno su tutto lo store con un progressive morphological filter (parametri come PDAL filters.pmf),
+    per colonne di tile (stessi ix, iy) in parallelo:
+    1) per colonna, griglia XY (passo `cell`, allineata a bounds_min) della quota minima dei punti,
+       salvata su file temporaneo nello store;
+    2) per colonna, mosaico delle griglie entro pmf_reach celle (overlap con le colonne vicine: esito
+       identico alla griglia dell'intero LOD), aperture progressive, poi ogni punto in una cella di
+       terreno e entro initial_distance dalla sua quota minima -> classe 2 (ground), gli altri -> 1.
+    RAM limitata da colonna + overlap (griglie, non punti). Esclusi i punti rimossi dalle op geometriche
+    e quelli in classe 7 (classify_outliers prima); le classi diverse da 0/1/2 restano invariate.
+    Per vedere solo il terreno / solo gli oggetti: op {"type": "remove_class", "classes": [1]} / [2].
+    lods: LOD da classificare (None = tutti).
+    """
+    def cb(p, m):
+        if progress_cb:
+            progress_cb(float(p), str(m))
+
+    windows = pmf_windows(cell, max_window, slope, initial_distance, max_distance)
+    if not windows:
+        raise ValueError(f"max_window ({max_window}) deve coprire almeno 3 celle da {cell}")
+    reach = pmf_reach(windows)
+    ps = PointStore(store_dir, cache_mb=cache_mb)
+    meta = ps.read_meta()
+    ps.ensure_ops()
+    ops = ps.compiled_ops()
+    origin = np.asarray(meta.bounds_min[:2], dtype=np.float64)
+    lods = list(range(len(meta.lod_voxel_sizes))) if lods is None else [int(l) for l in lods]
+    ring = math.ceil((reach + 1)*cell / float(meta.tile_size)) + 1   # colonne vicine da controllare
+    workers = max(1, int(workers))
+    stats = {"tiles": 0, "points": 0, "ground": 0, "windows": [w for w, _ in windows]}
+
+    spill = tempfile.mkdtemp(prefix="pmf_", dir=ps.root)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            for li, lod in enumerate(lods):
+                m = ps.manifest(lod)
+                columns: dict[tuple, list[str]] = {}
+                for key in m.keys():
+                    e = m.get(key)
+                    if e["count"] > 0 and not ops.drops_tile(e["bmin"], e["bmax"]):
+                        columns.setdefault(tuple(e["ijk"][:2]), []).append(key)
+                if not columns:
+                    continue
+
+                def pass1(col, lod=lod):
+                    cs, zs = [], []
+                    for key in columns[col]:
+                        pts, _, use = _ground_tile(ps, lod, ops, m.get(key))
+                        cs.append(_cells(pts[use], origin, cell))
+                        zs.append(pts[use, 2])
+                    c = np.concatenate(cs)
+                    if c.shape[0] == 0:
+                        return None
+                    c0, grid = _min_raster(c, np.concatenate(zs))
+                    np.save(f"{spill}/{lod}_{col[0]}_{col[1]}.npy", grid)
+                    return c0
+
+                rasters: dict[tuple, tuple] = {}
+                for ci, (col, c0) in enumerate(bounded_map(ex, pass1, list(columns), 2*workers)):
+                    if c0 is not None:
+                        rasters[col] = (c0, f"{spill}/{lod}_{col[0]}_{col[1]}.npy")
+                    cb(100.0*(li + 0.4*(ci+1)/len(columns))/len(lods), f"Terreno LOD{lod}: griglie {ci+1}/{len(columns)}")
+
+                def pass2(col, lod=lod):
+                    if col not in rasters:
+                        return 0, 0
+                    c0 = rasters[col][0]
+                    c1 = c0 + np.load(rasters[col][1], mmap_mode="r").shape - 1
+                    a0, a1 = c0 - reach, c1 + reach
+                    grid = np.full(tuple(a1 - a0 + 1), np.inf)
+                    for dx in range(-ring, ring + 1):
+                        for dy in range(-ring, ring + 1):
+                            r = rasters.get((col[0] + dx, col[1] + dy))
+                            if r is None:
+                                continue
+                            g = np.load(r[1], mmap_mode="r")
+                            lo, hi = np.maximum(r[0], a0), np.minimum(r[0] + g.shape - 1, a1)
+                            if (lo > hi).any():
+                                continue
+                            dst = grid[lo[0]-a0[0]:hi[0]-a0[0]+1, lo[1]-a0[1]:hi[1]-a0[1]+1]
+                            np.minimum(dst, g[lo[0]-r[0][0]:hi[0]-r[0][0]+1, lo[1]-r[0][1]:hi[1]-r[0][1]+1], out=dst)
+                    ground_cells = pmf_ground_cells(grid, windows)
+
+                    n = n_ground = 0
+                    for key in columns[col]:
+                        e = m.get(key)
+                        pts, cls, use = _ground_tile(ps, lod, ops, e)
+                        c = _cells(pts, origin, cell) - a0
+                        c = np.clip(c, 0, np.array(grid.shape) - 1)   # righe non usate (op/noise) possono cadere fuori
+                        zmin = grid[c[:, 0], c[:, 1]]
+                        ground = use & ground_cells[c[:, 0], c[:, 1]] & (pts[:, 2] - zmin <= initial_distance)
+                        rows = use & (cls <= GROUND)
+                        cur = cls.copy()
+                        cur[rows] = np.where(ground[rows], GROUND, UNCLASSIFIED)
+                        if not np.array_equal(cur, cls):
+                            ps.write_tile_classes(lod, *e["ijk"], cur)
+                        n += int(use.sum())
+                        n_ground += int(ground.sum())
+                    return n, n_ground
+
+                for ci, (_, (n, g)) in enumerate(bounded_map(ex, pass2, list(columns), 2*workers)):
+                    stats["points"] += n
+                    stats["ground"] += g
+                    cb(100.0*(li + 0.4 + 0.6*(ci+1)/len(columns))/len(lods), f"Terreno LOD{lod}: colonne {ci+1}/{len(columns)}")
+                ps.save_manifest(lod)
+                stats["tiles"] += sum(len(v) for v in columns.values())
+    finally:
+        shutil.rmtree(spill, ignore_errors=True)
+
+    ps.journal.mark_classified(method="ground_pmf", lods=lods, cell=float(cell), windows=stats["windows"])
+    cb(100.0, f"Terreno: {stats['ground']:,} punti ground su {stats['points']:,} ({stats['tiles']} tiles)")
+    return stats
@@ -0,0 +1,109 @@
+from __future__ import annotations
+import time
+import numpy as np
+from numcodecs import Blosc
+
+from core.oc_store import PointStore, StoreMeta
+
+GOALS = ("smallest", "fastest", "balanced")
+_SHUFFLE = {"noshuffle": Blosc.NOSHUFFLE, "shuffle": Blosc.SHUFFLE, "bitshuffle": Blosc.BITSHUFFLE}
+
+# (cname, livelli); ogni combinazione con i tre shuffle
+CANDIDATES = [
+    ("zstd", (1, 3, 5, 9)),
+    ("lz4", (1, 5, 9)),
+    ("lz4hc", (5, 9)),
+    ("blosclz", (5,)),
+    ("zlib", (5,)),
+]
+
+
+def candidate_codecs(candidates=None) -> list[dict]:
+    return [{"cname": c, "clevel": int(lv), "shuffle": sh}
+            for c, levels in (candidates or CANDIDATES) for lv in levels for sh in _SHUFFLE]
+
+
+def sample_tiles(ps: PointStore, lod: int = 0, n_tiles: int = 32) -> dict[str, list[np.ndarray]]:
+    """Array codificati (come salvati) di n_tiles tile non vuoti presi a passo fisso sulle key del manifest."""
+    m = ps.manifest(lod)
+    keys = [k for k in sorted(m.keys()) if m.get(k)["count"] > 0]
+    if not keys:
+        raise ValueError(f"Nessun tile al LOD{lod}")
+    pick = [keys[i] for i in np.linspace(0, len(keys) - 1, min(int(n_tiles), len(keys))).astype(int)]
+    out: dict[str, list[np.ndarray]] = {}
+    for key in dict.fromkeys(pick):
+        pts, cols = ps.read_tile_raw(lod, *m.get(key)["ijk"])
+        for name, a in (("points", pts), ("colors", cols)):
+            if a is not None:
+                out.setdefault(name, []).append(np.ascontiguousarray(a))
+    return out
+
+
+def benchmark_codecs(arrays: dict[str, list[np.ndarray]], candidates=None, repeat: int = 2) -> list[dict]:
+    """
+    Per array e codec: ratio (raw/compresso) e throughput encode/decode in MB/s di dati raw,
+    un tile alla volta (come i chunk Zarr). Tempo migliore su `repeat` passate.
+    """
+    rows = []
+    for name, tiles in arrays.items():
+        raw = sum(a.nbytes for a in tiles)
+        for c in candidate_codecs(candidates):
+            codec = Blosc(cname=c["cname"], clevel=c["clevel"], shuffle=_SHUFFLE[c["shuffle"]])
+            t_enc = t_dec = float("inf")
+            for _ in range(max(1, int(repeat))):
+                t0 = time.perf_counter()
+                enc = [codec.encode(a) for a in tiles]
+                t1 = time.perf_counter()
+                for b in enc:
+                    codec.decode(b)
+                t2 = time.perf_counter()
+                t_enc, t_dec = min(t_enc, t1 - t0), min(t_dec, t2 - t1)
+            stored = sum(len(b) for b in enc)
+            rows.append(dict(c, array=name, raw=raw, stored=stored, ratio=raw / max(1, stored),
+                             enc_mbs=raw / 2**20 / max(t_enc, 1e-9), dec_mbs=raw / 2**20 / max(t_dec, 1e-9)))
+    return rows
+
+
+def _score(r: dict, goal: str, disk_mbs: float) -> float:
+    if goal == "smallest":
+        return r["ratio"] + 1e-6 * r["dec_mbs"]
+    if goal == "fastest":
+        return r["dec_mbs"]
+    # balanced: tempo di lettura stimato per MB raw = lettura disco del compresso + decompressione
+    return -(1.0 / r["ratio"] / disk_mbs + 1.0 / r["dec_mbs"])
+
+
+def choose_codecs(rows: list[dict], goal: str = "balanced", disk_mbs: float = 1000.0) -> dict:
+    """
+    Codec migliore per array secondo goal:
+    "smallest" ratio massimo (archivio), "fastest" decode piu' veloce (interattivo),
+    "balanced" minimo tempo di lettura stimato con disco da disk_mbs MB/s.
+    """
+    if goal not in GOALS:
+        raise ValueError(f"Obiettivo non supportato: {goal} ({', '.join(GOALS)})")
+    best: dict[str, dict] = {}
+    for r in rows:
+        cur = best.get(r["array"])
+        if cur is None or _score(r, goal, disk_mbs) > _score(cur, goal, disk_mbs):
+            best[r["array"]] = r
+    return {n: {"cname": r["cname"], "clevel": r["clevel"], "shuffle": r["shuffle"]} for n, r in best.items()}
+
+
+def tune_codecs(store_dir: str, goal: str = "balanced", n_tiles: int = 32, disk_mbs: float = 1000.0,
+                candidates=None, progress_cb=None) -> dict:
+    """
+    Benchmark sui tile campione dello store e scelta dei codec per array, registrata in
+    StoreMeta.codecs / codec_goal. Vale per i tile scritti da qui in poi (compattazione, export);
+    per ricomprimere i tile esistenti: core.oc_migrate.migrate_backend(store, nuova_cartella, "zarr").
+    Ritorna {"codecs", "rows"}.
+    """
+    if progress_cb:
+        progress_cb(0.0, f"Codec: campione di {n_tiles} tiles ...")
+    ps = PointStore(store_dir, cache_mb=0)
+    meta = ps.read_meta()
+    rows = benchmark_codecs(sample_tiles(ps, 0, n_tiles), candidates)
+    codecs = choose_codecs(rows, goal, disk_mbs)
+    ps.write_meta(StoreMeta(**{**meta.__dict__, "codecs": codecs, "codec_goal": goal}))
+    if progress_cb:
+        progress_cb(100.0, "Codec: " + ", ".join(f"{n} {c['cname']}/{c['clevel']}/{c['shuffle']}" for n, c in codecs.items()))
+    return {"codecs": codecs, "rows": rows}
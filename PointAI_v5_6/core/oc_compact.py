@@ -0,0 +1,106 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import numpy as np
+
+from core.oc_store import PointStore
+from core.oc_ops import compile_ops
+from core.oc_parallel import bounded_map
+
+
+def _affected_tiles(ps: PointStore, lod: int, ops) -> list[tuple]:
+    """Tile del LOD su cui le ops hanno effetto (dal solo bbox del manifest)."""
+    keys, ijk, bmin, bmax, count = ps.manifest(lod).arrays()
+    return [(tuple(int(v) for v in ijk[i]), bmin[i], bmax[i])
+            for i in np.flatnonzero(count > 0) if ops.touches_tile(bmin[i], bmax[i])]
+
+
+def _compact_tile(ps: PointStore, lod: int, ops, data: str, tile):
+    """(punti rimossi, versione sostituita | None)."""
+    ijk, bmin, bmax = tile
+    pts, _ = ps.read_tile(lod, *ijk)
+    cls = ps.read_tile_classes(lod, *ijk) if ops.needs_classes else None
+    keep = ops.evaluate(pts, bmin, bmax, cls)
+    if keep is None:
+        return 0, None
+    prev = ps.write_tile_filtered(lod, *ijk, keep, data)
+    return int(pts.shape[0] - np.count_nonzero(keep)), prev
+
+
+def compact_ops(store_dir: str, workers: int = 1, progress_cb=None) -> dict:
+    """
+    Materializza le ops dopo il watermark nei tile che toccano (tutti i LOD).
+    Ogni tile modificato riceve una nuova versione nel sottogruppo "c{gen}"; gli array
+    originali restano su disco (rollback_compaction). Poi il journal registra il nuovo
+    watermark e le letture applicano solo le ops aggiunte dopo (undo non puo' scendere sotto).
+    Le ops sono filtri idempotenti: un'interruzione prima dell'aggiornamento del watermark
+    lascia lo store corretto (le ops vengono solo riapplicate a tile gia' filtrati). Le versioni
+    sostituite di una compattazione precedente si eliminano solo dopo il watermark: fino ad allora
+    i manifest su disco (e quelli in memoria di altri PointStore) possono ancora usarle.
+    """
+    def cb(p, m):
+        if progress_cb:
+            progress_cb(float(p), str(m))
+
+    ps = PointStore(store_dir)
+    meta = ps.read_meta()
+    ps.ensure_ops()
+    _, all_ops, start = ps.journal.state()
+    end = len(all_ops)
+    ops = compile_ops(all_ops[start:end])
+    if len(ops) == 0:
+        cb(100.0, "Compattazione: nessuna op da materializzare")
+        return {"watermark": start, "tiles": 0, "removed": 0}
+
+    gen = max((int(c["gen"]) for c in ps.journal.compactions()), default=0) + 1
+    data = f"c{gen}"
+    n_lods = len(meta.lod_voxel_sizes)
+    tiles, removed = 0, 0
+    superseded = []
+    workers = max(1, int(workers))
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        for lod in range(n_lods):
+            todo = _affected_tiles(ps, lod, ops)
+            fn = lambda t, lod=lod: _compact_tile(ps, lod, ops, data, t)
+            for ti, (t, (r, prev)) in enumerate(bounded_map(ex, fn, todo, 2*workers)):
+                removed += r
+                if prev:
+                    superseded.append((lod, t[0], prev))
+                cb(100.0*(lod + (ti+1)/len(todo))/n_lods, f"Compattazione LOD{lod}: tile {ti+1}/{len(todo)}")
+            tiles += len(todo)
+            ps.save_manifest(lod)
+
+    # watermark per ultimo: ops aggiunte durante la compattazione restano dopo `end`
+    ps.journal.mark_compacted(end, gen=gen, start=start, tiles=tiles, removed=removed,
+                              time=datetime.now().isoformat(timespec="seconds"))
+    for lod, ijk, prev in superseded:
+        ps.delete_tile_version(lod, *ijk, prev)
+    cb(100.0, f"Compattazione completata: {end - start} ops, {tiles} tiles, {removed:,} punti rimossi")
+    return {"watermark": end, "tiles": tiles, "removed": removed}
+
+
+def rollback_compaction(store_dir: str, progress_cb=None) -> int:
+    """Torna ai tile originali (watermark 0, tutte le ops riapplicate in lettura) ed elimina le versioni compattate."""
+    ps = PointStore(store_dir)
+    meta = ps.read_meta()
+    restored = 0
+    dropped = []
+    n_lods = len(meta.lod_voxel_sizes)
+    for lod in range(n_lods):
+        m = ps.manifest(lod)
+        for key in m.keys():
+            e = m.get(key)
+            data = e.get("data")
+            if data and m.restore_base(key):
+                restored += 1
+                dropped.append((lod, e["ijk"], data))
+        ps.save_manifest(lod)
+        if progress_cb:
+            progress_cb(100.0*(lod+1)/n_lods, f"Rollback LOD{lod}: {restored} tiles ripristinati")
+
+    ps.ensure_ops()
+    ps.journal.mark_rollback()
+    # versioni compattate eliminate solo quando nessun manifest (su disco o ricaricato) le usa piu'
+    for lod, ijk, data in dropped:
+        ps.delete_tile_version(lod, *ijk, data)
+    return restored
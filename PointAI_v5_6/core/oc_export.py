@@ -1,57 +1,293 @@
 from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+import os
 import numpy as np
-import open3d as o3d
-from core.oc_store import PointStore
-from core.oc_ops import apply_ops
+from core.oc_store import PointStore, StoreMeta
+from core.oc_shapes import OUTSIDE, PARTIAL, INSIDE
+from core.oc_parallel import bounded_map
 
-def export_filtered_ply(store_dir: str, out_path: str, lod: int = 0, max_points: int | None = None, progress_cb=None):
-    ps = PointStore(store_dir)
-    ps.ensure_ops()
-    ops = ps.read_ops()
+# Vertex come Open3D (write_point_cloud): XYZ double, RGB uchar
+_XYZ = [("x", "<f8"), ("y", "<f8"), ("z", "<f8")]
+_RGB = [("red", "u1"), ("green", "u1"), ("blue", "u1")]
+_COUNT_WIDTH = 20   # spazio riservato nell'header per il numero di vertici, riscritto a fine export
 
-    tiles = ps.list_tiles(lod)
-    pts_all = []
-    cols_all = []
 
-    for i, key in enumerate(tiles):
-        g = ps.z[f"lod{lod}/tiles/{key}"]
-        pts = np.asarray(g["points"])
-        cols = np.asarray(g["colors"]) if "colors" in g else None
+def iter_filtered_tiles(ps: PointStore, lod: int = 0, exact: bool = False):
+    """
+    Yield (tile key, points, colors) con le ops applicate, un tile alla volta in ordine di key.
+    exact: coordinate float64 decodificate dagli interi (le ops si valutano comunque sui float32
+    di read_tile, quindi la selezione coincide con quella delle query ROI).
+    """
+    ops = ps.compiled_ops()
+    m = ps.manifest(lod)
+    for key in m.keys():
+        e = m.get(key)
+        if e["count"] == 0 or ops.drops_tile(e["bmin"], e["bmax"]):
+            yield key, None, None
+            continue
+        if exact:
+            out, cols = ps.read_tile_exact(lod, *e["ijk"])
+            pts = out.astype(np.float32)
+        else:
+            pts, cols = ps.read_tile(lod, *e["ijk"])
+            out = pts
+        cls = ps.read_tile_classes(lod, *e["ijk"]) if ops.needs_classes else None
+        keep = ops.evaluate(pts, e["bmin"], e["bmax"], cls)
+        if keep is not None:
+            out = out[keep]
+            if cols is not None:
+                cols = cols[keep]
+        yield key, out, cols
 
-        keep = apply_ops(pts.astype(np.float64), ops)
-        pts = pts[keep]
-        if cols is not None:
-            cols = cols[keep]
 
-        if pts.size:
-            pts_all.append(pts)
-            if cols is not None:
-                cols_all.append(cols)
+class _Subsample:
+    """
+    max_points in un solo passaggio, senza conoscere il conteggio dopo i filtri.
+    Per ogni tile: tasso = budget rimasto / punti stimati nei tile ancora da leggere, applicato con passo
+    frazionario e fase continua tra i tile. Stima = conteggi del manifest (0 per i tile che le ops scartano
+    interi) x frazione di punti sopravvissuta alle ops nei tile gia' letti: il tasso si corregge man mano.
+    Escono al piu' max_points punti; meno se le ops scartano di piu' negli ultimi tile letti, oppure
+    il budget finisce prima dell'ultimo tile se i filtri sono concentrati nei primi.
+    """
+
+    def __init__(self, total: int, max_points: int | None):
+        self.limit = None if max_points is None else int(max_points)
+        self.left = int(total)   # punti (manifest) dei tile non ancora letti
+        self.read = 0            # punti (manifest) dei tile letti ...
+        self.kept = 0            # ... e quanti ne restano dopo le ops
+        self.phase = 0.0
+        self.taken = 0
+
+    def select(self, n: int, count: int) -> np.ndarray | None:
+        """Indici da tenere tra gli n punti filtrati di un tile con `count` punti nel manifest (None = tutti)."""
+        if self.limit is None:
+            self.taken += n
+            return None
+        ratio = self.kept/self.read if self.read else 1.0
+        rate = min(1.0, max(0, self.limit - self.taken) / max(1.0, self.left*ratio))
+        self.left -= int(count)
+        self.read += int(count)
+        self.kept += int(n)
+        g = self.phase + rate*np.arange(n + 1)
+        f = np.floor(g)
+        sel = np.flatnonzero(f[1:] > f[:-1])[:max(0, self.limit - self.taken)]
+        self.phase = float(g[-1] - f[-1])
+        self.taken += sel.shape[0]
+        return sel
+
+    @property
+    def full(self) -> bool:
+        return self.limit is not None and self.taken >= self.limit
+
 
-        if progress_cb and len(tiles):
-            progress_cb((i+1)/len(tiles)*100.0, f"Export: tile {i+1}/{len(tiles)}")
+def _iter_export(ps: PointStore, lod: int, max_points: int | None, progress_cb, what: str):
+    """Tile filtrati e sottocampionati (points float64, colors) per gli export in streaming."""
+    m = ps.manifest(lod)
+    n_tiles = len(m)
+    ops = ps.compiled_ops()
+    # limite superiore dai soli manifest (nessuna lettura): i tile scartati interi dalle ops non contano
+    upper = {key: 0 if ops.drops_tile(e["bmin"], e["bmax"]) else int(e["count"])
+             for key, e in ((key, m.get(key)) for key in m.keys())}
+    sub = _Subsample(sum(upper.values()), max_points)
+    for i, (key, pts, cols) in enumerate(iter_filtered_tiles(ps, lod, exact=True)):
+        n = 0 if pts is None else pts.shape[0]
+        sel = sub.select(n, upper[key])
+        if n:
+            if sel is not None:
+                pts = pts[sel]
+                cols = cols[sel] if cols is not None else None
+            if pts.shape[0]:
+                yield pts, cols
+        if progress_cb and n_tiles:
+            progress_cb((i+1)/n_tiles*100.0, f"{what}: tile {i+1}/{n_tiles} ({sub.taken:,} punti)")
+        if sub.full:
+            break
 
-    if not pts_all:
-        raise ValueError("Nessun punto da esportare (dopo filtri).")
 
-    P = np.concatenate(pts_all, axis=0)
-    C = np.concatenate(cols_all, axis=0) if cols_all else None
+def _remove_partial(out_path: str):
+    if os.path.exists(out_path):
+        os.remove(out_path)
 
-    if max_points is not None and P.shape[0] > int(max_points):
-        step = int(np.ceil(P.shape[0]/int(max_points)))
-        idx = np.arange(0, P.shape[0], step)[:int(max_points)]
-        P = P[idx]
-        if C is not None:
-            C = C[idx]
 
-    pcd = o3d.geometry.PointCloud()
-    pcd.points = o3d.utility.Vector3dVector(P.astype(np.float64))
-    if C is not None:
-        pcd.colors = o3d.utility.Vector3dVector(C.astype(np.float64))
+def _ply_header(has_rgb: bool) -> tuple[bytes, int]:
+    """(header, offset del campo count)."""
+    head = "ply\nformat binary_little_endian 1.0\ncomment PointAI out-of-core export\nelement vertex "
+    props = "".join(f"property double {n}\n" for n, _ in _XYZ)
+    if has_rgb:
+        props += "".join(f"property uchar {n}\n" for n, _ in _RGB)
+    body = " "*_COUNT_WIDTH + "\n" + props + "end_header\n"
+    return (head + body).encode("ascii"), len(head)
 
-    if not o3d.io.write_point_cloud(out_path, pcd):
-        raise RuntimeError("write_point_cloud failed")
+
+def export_filtered_ply(store_dir: str, out_path: str, lod: int = 0, max_points: int | None = None, progress_cb=None):
+    """
+    Export PLY binario (little-endian) in streaming: un tile alla volta, RAM costante.
+    Il numero di vertici viene riscritto nell'header alla fine.
+    max_points: sottocampionamento in un solo passaggio (_Subsample), mai oltre il budget; con ops
+    concentrate negli ultimi tile l'export puo' restare sotto.
+    """
+    ps = PointStore(store_dir, cache_mb=0)   # ogni tile letto una volta: niente cache LRU
+    ps.ensure_ops()
+    has_rgb = bool(ps.read_meta().has_rgb)
+    dtype = np.dtype(_XYZ + (_RGB if has_rgb else []))
+
+    header, count_at = _ply_header(has_rgb)
+    written = 0
+    try:
+        with open(out_path, "wb") as f:
+            f.write(header)
+            for pts, cols in _iter_export(ps, lod, max_points, progress_cb, "Export"):
+                rec = np.empty(pts.shape[0], dtype=dtype)
+                rec["x"], rec["y"], rec["z"] = pts[:, 0], pts[:, 1], pts[:, 2]
+                if has_rgb:
+                    c = np.zeros((pts.shape[0], 3), dtype=np.uint8) if cols is None else \
+                        np.rint(np.clip(cols, 0.0, 1.0)*255.0).astype(np.uint8)
+                    rec["red"], rec["green"], rec["blue"] = c[:, 0], c[:, 1], c[:, 2]
+                f.write(rec.tobytes())
+                written += rec.shape[0]
+
+            if written == 0:
+                raise ValueError("Nessun punto da esportare (dopo filtri).")
+            f.seek(count_at)
+            f.write(str(written).ljust(_COUNT_WIDTH).encode("ascii"))
+    except BaseException:
+        _remove_partial(out_path)
+        raise
 
     if progress_cb:
         progress_cb(100.0, f"Export completato: {out_path}")
     return out_path
+
+
+def export_filtered_las(store_dir: str, out_path: str, lod: int = 0, max_points: int | None = None,
+                        progress_cb=None, batch_points: int = 2_000_000, parallel: bool = True):
+    """
+    Export LAS/LAZ (compressione da estensione .laz) in streaming, a batch di ~batch_points punti.
+    LAZ: ogni batch e' compresso da lazrs (LazrsParallel) con i chunk da 50k punti su tutti i core,
+    scritti in coda allo stesso file. Scala/offset dallo store (coord_scale, bounds_min).
+    """
+    import laspy
+
+    ps = PointStore(store_dir, cache_mb=0)
+    ps.ensure_ops()
+    meta = ps.read_meta()
+    has_rgb = bool(meta.has_rgb)
+    compress = out_path.lower().endswith(".laz")
+
+    header = laspy.LasHeader(point_format=2 if has_rgb else 0, version="1.2")
+    header.scales = np.full(3, float(meta.coord_scale) if meta.coord_scale else 0.001)
+    header.offsets = np.floor(np.asarray(meta.bounds_min, dtype=np.float64))
+    backend = None
+    if compress:
+        avail = laspy.LazBackend.detect_available()
+        if not avail:
+            raise RuntimeError("Nessun backend LAZ disponibile (pip install lazrs)")
+        backend = laspy.LazBackend.LazrsParallel if parallel and laspy.LazBackend.LazrsParallel in avail else avail[0]
+
+    def flush(w, P, C):
+        pts = np.concatenate(P)
+        rec = laspy.ScaleAwarePointRecord.zeros(pts.shape[0], header=header)
+        rec.x, rec.y, rec.z = pts[:, 0], pts[:, 1], pts[:, 2]
+        if has_rgb:
+            c = np.concatenate(C)
+            c = np.rint(np.clip(c, 0.0, 1.0)*65535.0).astype(np.uint16)
+            rec.red, rec.green, rec.blue = c[:, 0], c[:, 1], c[:, 2]
+        w.write_points(rec)
+        return pts.shape[0]
+
+    written = 0
+    try:
+        with laspy.open(out_path, mode="w", header=header, do_compress=compress, laz_backend=backend) as w:
+            P, C, n = [], [], 0
+            for pts, cols in _iter_export(ps, lod, max_points, progress_cb, "Export LAS"):
+                P.append(pts)
+                if has_rgb:
+                    C.append(cols if cols is not None else np.zeros((pts.shape[0], 3), dtype=np.float32))
+                n += pts.shape[0]
+                if n >= batch_points:
+                    written += flush(w, P, C)
+                    P, C, n = [], [], 0
+            if n:
+                written += flush(w, P, C)
+            if written == 0:
+                raise ValueError("Nessun punto da esportare (dopo filtri).")
+    except BaseException:
+        _remove_partial(out_path)
+        raise
+
+    if progress_cb:
+        progress_cb(100.0, f"Export completato: {out_path} ({written:,} punti)")
+    return out_path
+
+
+def export_substore(store_dir: str, out_dir: str, shape=None, workers: int = 1, progress_cb=None) -> dict:
+    """
+    Export di una regione filtrata come nuovo PointStore (stessa griglia tile, tutti i LOD, ops applicate).
+    shape: BoxShape/SphereShape/FrustumShape (None = tutto lo store).
+    Tile interamente dentro la forma e non toccati dalle ops: chunk compressi copiati cosi' come sono.
+    Gli altri: array codificati filtrati (nessuna ri-quantizzazione) e ricompressi.
+    """
+    def cb(p, m):
+        if progress_cb:
+            progress_cb(float(p), str(m))
+
+    src = PointStore(store_dir, cache_mb=0)
+    src.ensure_ops()
+    meta = src.read_meta()
+    ops = src.compiled_ops()
+    n_lods = len(meta.lod_voxel_sizes)
+
+    dst = PointStore(out_dir, cache_mb=0)
+    dst.write_meta(StoreMeta(**meta.__dict__))
+    dst.reset_manifests(n_lods)
+    dst.ensure_ops()
+
+    def run(lod, t):
+        ijk, cls, bmin, bmax = t
+        if cls == INSIDE and not ops.touches_tile(bmin, bmax):
+            dst.copy_tile_from(src, lod, *ijk)
+            return "copied", 0
+        enc, cols = src.read_tile_raw(lod, *ijk)
+        classes = src.read_tile_raw_classes(lod, *ijk)
+        pts = src.decode_points(*ijk, enc)
+        m = shape.contains(pts) if cls == PARTIAL else np.ones(pts.shape[0], dtype=bool)
+        keep = ops.evaluate(pts, bmin, bmax, classes)
+        if keep is not None:
+            m &= keep
+        if not m.any():
+            return "empty", 0
+        dst.write_tile_encoded(lod, *ijk, enc[m], cols[m] if cols is not None else None,
+                               classes[m] if classes is not None else None)
+        return "filtered", int(pts.shape[0] - np.count_nonzero(m))
+
+    stats = {"copied": 0, "filtered": 0, "empty": 0, "removed": 0}
+    workers = max(1, int(workers))
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        for lod in range(n_lods):
+            keys, ijk, bmin, bmax, count = src.manifest(lod).arrays()
+            if not keys:
+                continue
+            cls = shape.classify_boxes(bmin, bmax) if shape is not None else np.full(len(keys), INSIDE, dtype=np.int8)
+            tiles = [(tuple(int(v) for v in ijk[i]), int(cls[i]), bmin[i], bmax[i])
+                     for i in np.flatnonzero((cls != OUTSIDE) & (count > 0))
+                     if not ops.drops_tile(bmin[i], bmax[i])]
+            for ti, (_, (kind, removed)) in enumerate(bounded_map(ex, lambda t, lod=lod: run(lod, t), tiles, 2*workers)):
+                stats[kind] += 1
+                stats["removed"] += removed
+                cb(100.0*(lod + (ti+1)/len(tiles))/n_lods, f"Sub-store LOD{lod}: tile {ti+1}/{len(tiles)}")
+
+    # parent/children solo verso tile presenti nel nuovo store
+    for lod in range(n_lods):
+        m = dst.manifest(lod)
+        up = dst.manifest(lod+1) if lod+1 < n_lods else None
+        down = dst.manifest(lod-1) if lod > 0 else None
+        for key in m.keys():
+            e = src.manifest(lod).get(key)
+            if "parent" not in e and "children" not in e:
+                continue
+            parent = e.get("parent") if up is not None and e.get("parent") in up else None
+            children = [c for c in e.get("children", []) if down is not None and c in down]
+            m.set_links(key, parent, children)
+    dst.write_manifests()
+    cb(100.0, f"Sub-store creato in: {out_dir} ({stats['copied']} tiles copiati, {stats['filtered']} filtrati)")
+    return stats
@@ -0,0 +1,166 @@
+from __future__ import annotations
+from pathlib import Path
+import json
+import os
+import threading
+
+
+class OpsJournal:
+    """
+    Log delle ops append-only (ops.jsonl): una riga JSON per record, con "seq" crescente.
+      {"seq", "kind": "op", "op": {...}}     nuova op (scarta le ops annullate non ripristinate)
+      {"seq", "kind": "undo"} / "redo"       spostano il cursore, la storia resta
+      {"seq", "kind": "compact", "watermark", ...} / {"seq", "kind": "rollback"}
+      {"seq", "kind": "classify", ...}       classificazione per punto riscritta (core.oc_classify)
+    Lo stato (ops attive = ops[:cursor]) e' tenuto in memoria: in lettura si fa solo uno stat
+    del file e si parsano le righe nuove (scritte da un altro PointStore sullo stesso store).
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._ops: list[dict] = []
+        self._cursor = 0
+        self._watermark = 0
+        self._compactions: list[dict] = []
+        self._seq = 0
+        self._tiles_seq = 0   # seq dell'ultimo record che ha cambiato le versioni dei tile (compact/rollback/classify)
+        self._offset = 0
+        self._stamp = None
+        self._active: list[dict] | None = None
+
+    # ---------- replay ----------
+    def _apply(self, rec: dict):
+        kind = rec.get("kind")
+        if kind == "op":
+            del self._ops[self._cursor:]
+            self._ops.append(rec["op"])
+            self._cursor += 1
+        elif kind == "undo":
+            self._cursor = max(self._watermark, self._cursor - 1)
+        elif kind == "redo":
+            self._cursor = min(len(self._ops), self._cursor + 1)
+        elif kind == "compact":
+            self._watermark = int(rec["watermark"])
+            self._compactions.append({k: v for k, v in rec.items() if k not in ("seq", "kind")})
+        elif kind == "rollback":
+            self._watermark = 0
+            self._compactions = []
+        self._seq = int(rec.get("seq", self._seq + 1))
+        if kind in ("compact", "rollback", "classify"):
+            self._tiles_seq = self._seq
+        self._active = None
+
+    def refresh(self):
+        """Allinea lo stato al file: nulla se invariato, solo la coda se e' cresciuto."""
+        with self._lock:
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                self._reset()
+                return
+            stamp = (st.st_mtime_ns, st.st_size)
+            if stamp == self._stamp:
+                return
+            if st.st_size < self._offset:
+                self._reset()   # file riscritto/troncato: replay completo
+            with open(self.path, "rb") as f:
+                f.seek(self._offset)
+                tail = f.read()
+            end = tail.rfind(b"\n") + 1   # riga finale incompleta: si rilegge al prossimo refresh
+            for line in tail[:end].splitlines():
+                if line.strip():
+                    self._apply(json.loads(line))
+            self._offset += end
+            self._stamp = stamp if end == len(tail) else None
+
+    def _append(self, rec: dict) -> int:
+        with self._lock:
+            self.refresh()
+            rec = {"seq": self._seq + 1, **rec}
+            line = (json.dumps(rec, separators=(",", ":")) + "\n").encode("utf-8")
+            with open(self.path, "ab") as f:
+                f.write(line)
+            self._apply(rec)
+            self._offset += len(line)
+            st = os.stat(self.path)
+            self._stamp = (st.st_mtime_ns, st.st_size) if st.st_size == self._offset else None
+            return self._seq
+
+    # ---------- scrittura ----------
+    def append(self, op: dict) -> int:
+        return self._append({"kind": "op", "op": op})
+
+    def undo(self) -> bool:
+        with self._lock:
+            self.refresh()
+            if self._cursor <= 0:
+                return False
+            if self._cursor <= self._watermark:
+                raise ValueError("Undo oltre la compattazione: eseguire prima rollback_compaction")
+            self._append({"kind": "undo"})
+            return True
+
+    def redo(self) -> bool:
+        with self._lock:
+            self.refresh()
+            if self._cursor >= len(self._ops):
+                return False
+            self._append({"kind": "redo"})
+            return True
+
+    def mark_compacted(self, watermark: int, **info) -> int:
+        return self._append({"kind": "compact", "watermark": int(watermark), **info})
+
+    def mark_rollback(self) -> int:
+        return self._append({"kind": "rollback"})
+
+    def mark_classified(self, **info) -> int:
+        return self._append({"kind": "classify", **info})
+
+    # ---------- lettura ----------
+    def state(self) -> tuple[int, list[dict], int]:
+        """(seq, ops attive, watermark): seq identifica lo stato (chiave per le cache)."""
+        with self._lock:
+            self.refresh()
+            if self._active is None:
+                self._active = self._ops[:self._cursor]
+            return self._seq, self._active, self._watermark
+
+    def ops(self) -> list[dict]:
+        return list(self.state()[1])
+
+    def watermark(self) -> int:
+        return self.state()[2]
+
+    def tiles_seq(self) -> int:
+        """Cambia quando compattazione/rollback/classificazione riscrivono i manifest: chi li ha in memoria li ricarica."""
+        with self._lock:
+            self.refresh()
+            return self._tiles_seq
+
+    def compactions(self) -> list[dict]:
+        with self._lock:
+            self.refresh()
+            return list(self._compactions)
+
+    def can_undo(self) -> bool:
+        with self._lock:
+            self.refresh()
+            return self._cursor > self._watermark
+
+    def can_redo(self) -> bool:
+        with self._lock:
+            self.refresh()
+            return self._cursor < len(self._ops)
+
+    # ---------- migrazione ----------
+    def import_legacy(self, data: dict):
+        """Converte un ops.json ({"ops": [...], "watermark", "compactions"}) in record del journal."""
+        for op in data.get("ops", []):
+            self.append(op)
+        for c in data.get("compactions", []):
+            self.mark_compacted(**c)
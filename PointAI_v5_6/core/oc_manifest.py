@@ -0,0 +1,136 @@
+from __future__ import annotations
+from pathlib import Path
+import json
+import threading
+import numpy as np
+
+
+class TileManifest:
+    """
+    Indice dei tile di un LOD: key -> {ijk, count, bmin, bmax, nbytes, version, parent, children, data, base, chunks}.
+    `version` cresce a ogni riscrittura del tile (invalida le cache dei tile decodificati).
+    Scritto a build time (manifest_lod{n}.json) e caricato una volta; le query spaziali
+    lavorano su array numpy e non toccano la gerarchia Zarr.
+    """
+
+    def __init__(self, entries: dict | None = None):
+        self.entries: dict[str, dict] = dict(entries or {})
+        self._lock = threading.Lock()
+        self._arrays = None
+
+    # ---------- persistenza ----------
+    @classmethod
+    def load(cls, path: str | Path) -> "TileManifest":
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+        return cls(data.get("tiles", {}))
+
+    def save(self, path: str | Path):
+        with self._lock:
+            data = {"tiles": self.entries}
+            Path(path).write_text(json.dumps(data), encoding="utf-8")
+
+    # ---------- aggiornamento ----------
+    def update(self, key: str, ijk, count: int, bmin, bmax, nbytes: int, data: str | None = None, chunks=None):
+        """
+        data: sottogruppo con i dati correnti del tile (compattazione ops), None = array originali.
+        Alla prima compattazione le statistiche originali restano in "base" per il rollback.
+        chunks: bbox [xmin, ymin, zmin, xmax, ymax, zmax] di ogni chunk di righe (tile con piu' chunk).
+        """
+        with self._lock:
+            e = self.entries.get(key)
+            version = int(e.get("version", 0)) + 1 if e is not None else 0
+            e = self.entries.setdefault(key, {})
+            if data is None:
+                e.pop("data", None)
+                e.pop("base", None)
+            else:
+                if "data" not in e and "count" in e:
+                    e["base"] = {n: e[n] for n in ("count", "bmin", "bmax", "nbytes", "chunks") if n in e}
+                e["data"] = data
+            e.update(
+                version=version,
+                ijk=[int(v) for v in ijk],
+                count=int(count),
+                bmin=[float(v) for v in bmin],
+                bmax=[float(v) for v in bmax],
+                nbytes=int(nbytes),
+            )
+            if chunks is not None and len(chunks) > 1:
+                e["chunks"] = [[float(v) for v in c] for c in chunks]
+            else:
+                e.pop("chunks", None)
+            self._arrays = None
+
+    def restore_base(self, key: str) -> bool:
+        """Torna agli array originali del tile (rollback della compattazione)."""
+        with self._lock:
+            e = self.entries.get(key)
+            if e is None or "data" not in e:
+                return False
+            e.pop("chunks", None)
+            e.update(e.pop("base", {}))
+            e.pop("data")
+            e["version"] = int(e.get("version", 0)) + 1
+            self._arrays = None
+            return True
+
+    def touch(self, key: str, nbytes: int):
+        """Array del tile riscritti sul posto (es. classificazione): nuova version, stessi punti."""
+        with self._lock:
+            e = self.entries[key]
+            e["nbytes"] = int(nbytes)
+            e["version"] = int(e.get("version", 0)) + 1
+
+    def set_links(self, key: str, parent: str | None, children: list[str]):
+        with self._lock:
+            if key in self.entries:
+                self.entries[key]["parent"] = parent
+                self.entries[key]["children"] = list(children)
+
+    def remove(self, key: str):
+        with self._lock:
+            self.entries.pop(key, None)
+            self._arrays = None
+
+    # ---------- query ----------
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: str) -> dict | None:
+        return self.entries.get(key)
+
+    def keys(self) -> list[str]:
+        return sorted(self.entries.keys())
+
+    def arrays(self):
+        """(keys, ijk Mx3 int64, bmin Mx3, bmax Mx3, count M) in ordine di key."""
+        a = self._arrays
+        if a is None:
+            with self._lock:
+                keys = sorted(self.entries.keys())
+                ent = [self.entries[k] for k in keys]
+                a = (
+                    keys,
+                    np.array([e["ijk"] for e in ent], dtype=np.int64).reshape(-1, 3),
+                    np.array([e["bmin"] for e in ent], dtype=np.float64).reshape(-1, 3),
+                    np.array([e["bmax"] for e in ent], dtype=np.float64).reshape(-1, 3),
+                    np.array([e["count"] for e in ent], dtype=np.int64),
+                )
+                self._arrays = a
+        return a
+
+    def query_box(self, mn, mx) -> list[str]:
+        """Key dei tile il cui bbox stretto interseca [mn, mx]."""
+        keys, _, bmin, bmax, count = self.arrays()
+        if not keys:
+            return []
+        mn = np.asarray(mn, dtype=np.float64)
+        mx = np.asarray(mx, dtype=np.float64)
+        hit = (bmin <= mx).all(axis=1) & (bmax >= mn).all(axis=1) & (count > 0)
+        return [keys[i] for i in np.flatnonzero(hit)]
+
+    def total_points(self) -> int:
+        return int(sum(e["count"] for e in self.entries.values()))
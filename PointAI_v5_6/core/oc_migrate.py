@@ -0,0 +1,72 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import shutil
+
+from core.oc_store import PointStore, StoreMeta
+from core.oc_backend import ARRAYS, BACKENDS
+from core.oc_parallel import bounded_map
+
+
+def migrate_backend(store_dir: str, out_dir: str, backend: str = "mmap", workers: int = 1, progress_cb=None) -> dict:
+    """
+    Copia lo store in out_dir con un altro backend (StoreMeta.backend), es. "zarr" -> "mmap".
+    Gli array codificati passano cosi' come sono (nessuna ri-quantizzazione), con tutte le versioni
+    dei tile (originali + compattazione): journal ops, undo/redo e rollback restano validi.
+    """
+    def cb(p, m):
+        if progress_cb:
+            progress_cb(float(p), str(m))
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend non supportato: {backend}")
+    if Path(out_dir).resolve() == Path(store_dir).resolve():
+        raise ValueError("La migrazione scrive un nuovo store: out_dir deve essere diverso da store_dir")
+
+    src = PointStore(store_dir, cache_mb=0)
+    src.ensure_ops()
+    meta = src.read_meta()
+    n_lods = len(meta.lod_voxel_sizes)
+
+    dst = PointStore(out_dir, cache_mb=0)
+    dst.write_meta(StoreMeta(**{**meta.__dict__, "backend": backend}))
+    dst.reset_manifests(n_lods)
+
+    def copy(lod, key):
+        e = src.manifest(lod).get(key)
+        ijk = e["ijk"]
+        # originali prima: update(data=...) ne sposta le statistiche in "base"
+        versions = [(None, e.get("base", e))] + ([(e["data"], e)] if e.get("data") else [])
+        n_src = n_dst = 0
+        for data, st in versions:
+            path = src._tile_path(lod, *ijk, data)
+            arrays = {n: src.backend.read(path, n) for n in ARRAYS}
+            nbytes = dst.backend.write(path, arrays, chunk_rows=int(meta.chunk_points))
+            dst.manifest(lod).update(key, ijk, st["count"], st["bmin"], st["bmax"], nbytes, data=data,
+                                     chunks=st.get("chunks"))
+            n_src += src.backend.stored_bytes(path)
+            n_dst += nbytes
+        return n_src, n_dst
+
+    stats = {"tiles": 0, "bytes_src": 0, "bytes_dst": 0}
+    workers = max(1, int(workers))
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        for lod in range(n_lods):
+            dst.ensure_lod(lod)
+            m = src.manifest(lod)
+            keys = m.keys()
+            for ki, (key, (n_src, n_dst)) in enumerate(bounded_map(ex, lambda k, lod=lod: copy(lod, k), keys, 2*workers)):
+                stats["tiles"] += 1
+                stats["bytes_src"] += n_src
+                stats["bytes_dst"] += n_dst
+                cb(100.0*(lod + (ki+1)/len(keys))/n_lods, f"Migrazione LOD{lod}: tile {ki+1}/{len(keys)}")
+            dm = dst.manifest(lod)
+            for key in keys:
+                e = m.get(key)
+                if "parent" in e or "children" in e:
+                    dm.set_links(key, e.get("parent"), e.get("children", []))
+    dst.write_manifests()
+    shutil.copyfile(src.journal.path, dst.journal.path)
+
+    cb(100.0, f"Migrazione completata: {out_dir} (backend {backend}, {stats['tiles']} tiles)")
+    return stats
@@ -1,29 +1,251 @@
 from __future__ import annotations
 import numpy as np
 
-def apply_ops(points: np.ndarray, ops: list[dict]) -> np.ndarray:
+_INF = np.inf
+# confronti sempre in doppia precisione (anche con punti float32), come l'apply_ops originale
+_CMP64 = (np.float64, np.float64, np.bool_)
+
+
+def _op_box(op: dict):
+    """(modo, lo[3], hi[3]) dell'op; modo "keep" (bbox/zrange) o "remove" (remove_bbox). None se ignota."""
+    t = op.get("type")
+    if t == "zrange":
+        lo = np.array([-_INF, -_INF, float(op["zmin"])])
+        hi = np.array([_INF, _INF, float(op["zmax"])])
+        return "keep", lo, hi
+    if t in ("bbox", "remove_bbox"):
+        xmin,xmax,ymin,ymax,zmin,zmax = map(float, (op["xmin"],op["xmax"],op["ymin"],op["ymax"],op["zmin"],op["zmax"]))
+        return ("keep" if t == "bbox" else "remove"), np.array([xmin, ymin, zmin]), np.array([xmax, ymax, zmax])
+    return None
+
+
+def _op_classes(op: dict) -> list[int]:
+    """Codici LAS scartati da un'op remove_class ({"type": "remove_class", "classes": [7]}); [] per le altre."""
+    if op.get("type") != "remove_class":
+        return []
+    return [int(c) for c in op["classes"]]
+
+
+_CELL_OFF = np.int64(1 << 31)
+
+
+def _pack_cells(cx: np.ndarray, cy: np.ndarray) -> np.ndarray:
+    return ((cx + _CELL_OFF) << 32) | ((cy + _CELL_OFF) & 0xFFFFFFFF)
+
+
+def _expand_rects(c0: np.ndarray, c1: np.ndarray):
+    """Rettangoli di celle [c0, c1] (Kx2) -> (indice rettangolo, chiave cella) per ogni cella coperta."""
+    ny = c1[:, 1] - c0[:, 1] + 1
+    nc = (c1[:, 0] - c0[:, 0] + 1) * ny
+    owner = np.repeat(np.arange(nc.shape[0]), nc)
+    k = np.arange(int(nc.sum())) - np.repeat(np.cumsum(nc) - nc, nc)
+    nyr = ny[owner]
+    return owner, _pack_cells(c0[owner, 0] + k // nyr, c0[owner, 1] + k % nyr)
+
+
+def _lookup_runs(sorted_keys: np.ndarray, keys: np.ndarray):
+    """Per ogni chiave, tutte le posizioni uguali in sorted_keys: (indice chiave, posizione)."""
+    a = np.searchsorted(sorted_keys, keys, side="left")
+    cnt = np.searchsorted(sorted_keys, keys, side="right") - a
+    owner = np.repeat(np.arange(keys.shape[0]), cnt)
+    pos = np.repeat(a - (np.cumsum(cnt) - cnt), cnt) + np.arange(int(cnt.sum()))
+    return owner, pos
+
+
+class _OpsGrid:
+    """
+    Griglia uniforme XY sulle op remove_bbox: una op che non interseca il tile non ha effetto,
+    quindi per ogni tile si testano solo quelle delle celle coperte. Le op "keep" (bbox/zrange)
+    scartano cio' che e' fuori, quindi restano sempre candidate, come le remove troppo grandi.
+    Celle -> op salvate come array ordinati (lookup con searchsorted, niente dict per cella).
+    """
+
+    MAX_CELLS_PER_OP = 64
+    MAX_CELLS_PER_QUERY = 4096
+
+    def __init__(self, lo: np.ndarray, hi: np.ndarray, remove: np.ndarray):
+        n = lo.shape[0]
+        self.n = n
+        self.cell = 1.0
+        self.gridded = np.zeros(n, dtype=bool)
+        self.c0 = np.zeros((n, 2), dtype=np.int64)
+        self.c1 = np.zeros((n, 2), dtype=np.int64)
+        self.keys = np.empty(0, dtype=np.int64)
+        self.key_ops = np.empty(0, dtype=np.int64)
+
+        rem = np.flatnonzero(remove & np.isfinite(lo[:, :2]).all(axis=1) & np.isfinite(hi[:, :2]).all(axis=1))
+        if rem.size:
+            ext = np.maximum(hi[rem, :2] - lo[rem, :2], 0.0)
+            span = float((hi[rem, :2].max(axis=0) - lo[rem, :2].min(axis=0)).max())
+            self.cell = max(float(np.median(ext))*2.0, span/1024.0, 1e-6)
+            c0 = np.floor(lo[rem, :2]/self.cell).astype(np.int64)
+            c1 = np.floor(hi[rem, :2]/self.cell).astype(np.int64)
+            small = (c1 - c0 + 1).prod(axis=1) <= self.MAX_CELLS_PER_OP
+            rem, c0, c1 = rem[small], c0[small], c1[small]
+            self.gridded[rem] = True
+            self.c0[rem] = c0
+            self.c1[rem] = c1
+            owner, keys = _expand_rects(c0, c1)
+            order = np.argsort(keys, kind="stable")
+            self.keys = keys[order]
+            self.key_ops = rem[owner[order]]
+        self.always = np.flatnonzero(~self.gridded)
+
+    def candidates(self, bmin: np.ndarray, bmax: np.ndarray) -> np.ndarray:
+        """Indici (crescenti = ordine del log) delle op da confrontare col bbox."""
+        if self.keys.size == 0:
+            return self.always
+        if not (np.isfinite(bmin[:2]).all() and np.isfinite(bmax[:2]).all()):
+            return np.arange(self.n, dtype=np.int64)
+        c0 = np.floor(bmin[:2]/self.cell).astype(np.int64)[None]
+        c1 = np.floor(bmax[:2]/self.cell).astype(np.int64)[None]
+        if int((c1 - c0 + 1).prod()) > self.MAX_CELLS_PER_QUERY:
+            return np.arange(self.n, dtype=np.int64)
+        _, keys = _expand_rects(c0, c1)
+        _, pos = _lookup_runs(self.keys, keys)
+        return np.unique(np.concatenate([self.always, self.key_ops[pos]]))
+
+    def remove_hits(self, points: np.ndarray, ops: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+        """
+        Indici dei punti dentro almeno una delle op remove (griglia) `ops`, tutto vettorizzato:
+        punti ordinati per cella, join cella-op, test solo sulle coppie (op, punto) della stessa cella.
+        """
+        pc = np.floor(points[:, :2] / self.cell).astype(np.int64)
+        pk = _pack_cells(pc[:, 0], pc[:, 1])
+        order = np.argsort(pk, kind="stable")
+        owner, keys = _expand_rects(self.c0[ops], self.c1[ops])
+        kown, pos = _lookup_runs(pk[order], keys)
+        op = ops[owner[kown]]
+        pi = order[pos]
+        p = points[pi]
+        hit = ((p >= lo[op]) & (p <= hi[op])).all(axis=1)
+        return pi[hit]
+
+
+class CompiledOps:
+    """
+    Ops compilate una volta e valutate per tile.
+    Ogni op viene prima confrontata col bbox del tile: se tiene o scarta tutto il tile
+    non si fa lavoro per-punto; altrimenti si testano solo gli assi su cui il tile
+    attraversa i limiti dell'op, con maschere in-place (pochi temporanei).
+    Le op remove_bbox sono indicizzate in una griglia XY (_OpsGrid): ogni tile vede solo
+    quelle che lo intersecano, anche con migliaia di edit nel log.
+    Le op remove_class lavorano sulla classificazione per punto (PointStore.read_tile_classes):
+    non dipendono dal bbox, quindi toccano ogni tile e vanno valutate con `classes`.
+    """
+
+    BATCH_MIN = 8
+
+    def __init__(self, ops: list[dict]):
+        self.ops = list(ops or [])
+        boxes = [b for b in (_op_box(op) for op in self.ops) if b is not None]
+        self.n = len(boxes)
+        self.remove = np.array([m == "remove" for m, _, _ in boxes], dtype=bool)
+        self.lo = np.array([lo for _, lo, _ in boxes], dtype=np.float64).reshape(-1, 3)
+        self.hi = np.array([hi for _, _, hi in boxes], dtype=np.float64).reshape(-1, 3)
+        self.index = _OpsGrid(self.lo, self.hi, self.remove)
+        codes = sorted({c for op in self.ops for c in _op_classes(op)})
+        self.drop_classes = np.zeros(256, dtype=bool)
+        self.drop_classes[codes] = True
+        self.needs_classes = bool(codes)
+
+    def __len__(self) -> int:
+        return self.n + int(self.needs_classes)
+
+    def _classify(self, bmin, bmax):
+        """
+        (scarta tutto il tile, indici op parziali, assi per op con tile gia' dentro i limiti).
+        Solo le op candidate dall'indice (in ordine di log) vengono confrontate col bbox.
+        """
+        bmin = np.asarray(bmin, dtype=np.float64)
+        bmax = np.asarray(bmax, dtype=np.float64)
+        cand = self.index.candidates(bmin, bmax)
+        lo, hi, rem = self.lo[cand], self.hi[cand], self.remove[cand]
+        # per asse: tile interamente dentro [lo, hi] / interamente fuori
+        ax_in = (bmin >= lo) & (bmax <= hi)
+        ax_out = (bmax < lo) | (bmin > hi)
+        inside = ax_in.all(axis=1)
+        outside = ax_out.any(axis=1)
+        drop = bool((rem & inside).any() or (~rem & outside).any())
+        part = np.flatnonzero(~(inside | outside))
+        return drop, cand[part], ax_in[part]
+
+    def drops_tile(self, bmin, bmax) -> bool:
+        """True se le ops scartano tutti i punti nel bbox: il tile non va nemmeno letto."""
+        return self.n > 0 and self._classify(bmin, bmax)[0]
+
+    def touches_tile(self, bmin, bmax) -> bool:
+        """True se le ops possono cambiare i punti nel bbox (tile da riscrivere in compattazione)."""
+        if self.needs_classes:
+            return True
+        if self.n == 0:
+            return False
+        drop, partial, _ = self._classify(bmin, bmax)
+        return drop or partial.size > 0
+
+    def evaluate(self, points: np.ndarray, bmin=None, bmax=None, classes: np.ndarray | None = None) -> np.ndarray | None:
+        """
+        Maschera keep (bool) per `points`, o None se tutti i punti restano.
+        bmin/bmax: bbox del tile (se noti permettono lo short-circuit per-op).
+        classes: codici LAS per punto, richiesti se needs_classes (None = nessun punto classificato).
+        """
+        keep = self._evaluate_boxes(points, bmin, bmax)
+        if not self.needs_classes or classes is None or points.shape[0] == 0:
+            return keep
+        drop = self.drop_classes[np.asarray(classes, dtype=np.uint8)]
+        if not drop.any():
+            return keep
+        if keep is None:
+            return ~drop
+        keep &= ~drop
+        return keep
+
+    def _evaluate_boxes(self, points: np.ndarray, bmin, bmax) -> np.ndarray | None:
+        n = points.shape[0]
+        if self.n == 0 or n == 0:
+            return None
+        if bmin is None or bmax is None:
+            bmin = np.full(3, -_INF)
+            bmax = np.full(3, _INF)
+        drop, partial, ax_in = self._classify(bmin, bmax)
+        if drop:
+            return np.zeros(n, dtype=bool)
+        if partial.size == 0:
+            return None
+
+        lo, hi = self.lo, self.hi
+        keep = np.ones(n, dtype=bool)
+
+        # molte remove piccole sul tile: join punti/op per cella invece di un passaggio per op
+        batch = self.remove[partial] & self.index.gridded[partial]
+        if int(batch.sum()) >= self.BATCH_MIN:
+            keep[self.index.remove_hits(points, partial[batch], lo, hi)] = False
+            partial, ax_in = partial[~batch], ax_in[~batch]
+
+        hit = np.empty(n, dtype=bool)
+        tmp = np.empty(n, dtype=bool)
+        for j, i in enumerate(partial):
+            axes = np.flatnonzero(~ax_in[j])
+            hit.fill(True)
+            for a in axes:
+                col = points[:, a]
+                np.greater_equal(col, lo[i, a], out=tmp, signature=_CMP64)
+                hit &= tmp
+                np.less_equal(col, hi[i, a], out=tmp, signature=_CMP64)
+                hit &= tmp
+            if self.remove[i]:
+                np.logical_not(hit, out=hit)
+            keep &= hit
+        return keep
+
+
+def compile_ops(ops: list[dict]) -> CompiledOps:
+    return CompiledOps(ops)
+
+
+def apply_ops(points: np.ndarray, ops: list[dict], classes: np.ndarray | None = None) -> np.ndarray:
     """Return boolean keep mask for points."""
-    if not ops:
+    keep = compile_ops(ops).evaluate(points, classes=classes)
+    if keep is None:
         return np.ones((points.shape[0],), dtype=bool)
-    keep = np.ones((points.shape[0],), dtype=bool)
-    for op in ops:
-        t = op.get("type")
-        if t == "zrange":
-            zmin = float(op["zmin"]); zmax = float(op["zmax"])
-            keep &= (points[:,2] >= zmin) & (points[:,2] <= zmax)
-        elif t == "bbox":
-            xmin,xmax,ymin,ymax,zmin,zmax = map(float, (op["xmin"],op["xmax"],op["ymin"],op["ymax"],op["zmin"],op["zmax"]))
-            keep &= (
-                (points[:,0] >= xmin) & (points[:,0] <= xmax) &
-                (points[:,1] >= ymin) & (points[:,1] <= ymax) &
-                (points[:,2] >= zmin) & (points[:,2] <= zmax)
-            )
-        elif t == "remove_bbox":
-            xmin,xmax,ymin,ymax,zmin,zmax = map(float, (op["xmin"],op["xmax"],op["ymin"],op["ymax"],op["zmin"],op["zmax"]))
-            rem = (
-                (points[:,0] >= xmin) & (points[:,0] <= xmax) &
-                (points[:,1] >= ymin) & (points[:,1] <= ymax) &
-                (points[:,2] >= zmin) & (points[:,2] <= zmax)
-            )
-            keep &= ~rem
     return keep
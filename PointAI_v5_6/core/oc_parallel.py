@@ -0,0 +1,23 @@
+from __future__ import annotations
+from concurrent.futures import Executor, FIRST_COMPLETED, wait
+
+
+def bounded_map(ex: Executor, fn, items, window: int):
+    """
+    Come ex.map ma con al massimo `window` task in volo (RAM limitata);
+    yield (item, risultato) in ordine di completamento.
+    """
+    it = iter(items)
+    pending = {}
+    while True:
+        while len(pending) < max(1, int(window)):
+            try:
+                item = next(it)
+            except StopIteration:
+                break
+            pending[ex.submit(fn, item)] = item
+        if not pending:
+            return
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for f in done:
+            yield pending.pop(f), f.result()
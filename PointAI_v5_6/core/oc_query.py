@@ -1,66 +1,118 @@
 from __future__ import annotations
+import heapq
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from core.oc_store import PointStore
-from core.oc_ops import apply_ops
+from core.oc_shapes import SphereShape, OUTSIDE, PARTIAL
+from core.oc_parallel import bounded_map
 
 def pick_lod(meta, max_points: int) -> int:
+    """LOD unico per tutta la query da soglie fisse (vecchio criterio; vedi plan_lods)."""
     if max_points <= 300_000:
         return len(meta.lod_voxel_sizes) - 1
     if max_points <= 1_000_000:
         return max(0, len(meta.lod_voxel_sizes) - 2)
     return 0
 
-def load_roi(ps: PointStore, lod: int, center: np.ndarray, radius: float, max_points: int = 2_000_000):
-    meta = ps.read_meta()
-    bmin = np.array(meta.bounds_min, dtype=np.float64)
-    tile = meta.tile_size
-    ops = ps.read_ops()
-
-    c = center
-    r = float(radius)
-    mn = c - r
-    mx = c + r
-
-    i0 = np.floor((mn - bmin)/tile).astype(int)
-    i1 = np.floor((mx - bmin)/tile).astype(int)
-
-    pts_list = []
-    col_list = []
-
-    for ix in range(i0[0], i1[0]+1):
-        for iy in range(i0[1], i1[1]+1):
-            for iz in range(i0[2], i1[2]+1):
-                if not ps.tile_exists(lod, ix, iy, iz):
-                    continue
-                pts, cols = ps.read_tile(lod, ix, iy, iz)
-
-                m = (
-                    (pts[:,0] >= mn[0]) & (pts[:,0] <= mx[0]) &
-                    (pts[:,1] >= mn[1]) & (pts[:,1] <= mx[1]) &
-                    (pts[:,2] >= mn[2]) & (pts[:,2] <= mx[2])
-                )
-                pts = pts[m]
-                if cols is not None:
-                    cols = cols[m]
-                if pts.size == 0:
-                    continue
-
-                keep = apply_ops(pts.astype(np.float64), ops)
-                pts = pts[keep]
-                if cols is not None:
-                    cols = cols[keep]
-                if pts.size == 0:
-                    continue
-
-                pts_list.append(pts)
-                if cols is not None:
-                    col_list.append(cols)
-
-    if not pts_list:
+def load_roi(ps: PointStore, lod: int | None, center: np.ndarray, radius: float, max_points: int = 2_000_000,
+             shape=None, workers: int = 1, on_tile=None, eye=None):
+    """
+    ROI sferica (center, radius); `shape` (BoxShape/SphereShape/FrustumShape) la sostituisce.
+    lod=None: LOD scelto per tile (plan_lods) dal punto di vista `eye` (default: centro ROI).
+    """
+    if shape is None:
+        shape = SphereShape(center, radius)
+    if lod is None:
+        return query_budget(ps, shape, max_points, eye=eye, workers=workers, on_tile=on_tile)
+    return query_shape(ps, lod, shape, max_points, workers=workers, on_tile=on_tile)
+
+def _shape_rows(ps: PointStore, lod: int, shape, ops):
+    """[(ijk, cls, bmin, bmax, count)] dei tile del LOD da leggere per `shape`."""
+    keys, ijk, bmin, bmax, count = ps.manifest(lod).arrays()
+    if not keys:
+        return []
+    cls = shape.classify_boxes(bmin, bmax)
+    return [(tuple(int(v) for v in ijk[i]), int(cls[i]), bmin[i], bmax[i], int(count[i]))
+            for i in np.flatnonzero((cls != OUTSIDE) & (count > 0))
+            if not ops.drops_tile(bmin[i], bmax[i])]
+
+def _shape_tiles(ps: PointStore, lod: int, shape, ops):
+    return [r[:4] for r in _shape_rows(ps, lod, shape, ops)]
+
+def _read_partial(ps: PointStore, lod: int, shape, ijk):
+    """Tile PARTIAL: solo i chunk il cui bbox (manifest) interseca `shape`. (points, colors, chunk letti | None = tutti)"""
+    boxes = ps.manifest(lod).get(f"{ijk[0]}_{ijk[1]}_{ijk[2]}").get("chunks")
+    if not boxes:
+        return ps.read_tile(lod, *ijk) + (None,)
+    b = np.asarray(boxes, dtype=np.float64)
+    sel = np.flatnonzero(shape.classify_boxes(b[:, :3], b[:, 3:]) != OUTSIDE)
+    if sel.size == len(boxes):
+        return ps.read_tile(lod, *ijk) + (None,)
+    if sel.size == 0:
+        return np.empty((0, 3), dtype=np.float32), None, sel
+    return ps.read_tile_chunks(lod, *ijk, sel) + (sel,)
+
+def _load_tile(ps: PointStore, lod: int, shape, ops, tile):
+    ijk, cls, bmin, bmax = tile
+    pts, cols, chunks = _read_partial(ps, lod, shape, ijk) if cls == PARTIAL else ps.read_tile(lod, *ijk) + (None,)
+    classes = ps.read_tile_classes(lod, *ijk, chunks) if ops.needs_classes and pts.size else None
+
+    if cls == PARTIAL:
+        m = shape.contains(pts)
+        pts = pts[m]
+        if cols is not None:
+            cols = cols[m]
+        if classes is not None:
+            classes = classes[m]
+        if pts.size == 0:
+            return pts, cols
+
+    keep = ops.evaluate(pts, bmin, bmax, classes)
+    if keep is not None:
+        pts = pts[keep]
+        if cols is not None:
+            cols = cols[keep]
+    return pts, cols
+
+def iter_shape(ps: PointStore, lod: int, shape, workers: int = 4):
+    """
+    Generator: yield (ijk, points, colors) per tile, in ordine di completamento.
+    Lettura/decompressione/filtri su `workers` thread (Blosc rilascia il GIL),
+    al massimo 2*workers tile in volo.
+    """
+    ops = ps.compiled_ops()
+    tiles = _shape_tiles(ps, lod, shape, ops)
+    workers = max(1, int(workers))
+    if workers == 1:
+        for t in tiles:
+            pts, cols = _load_tile(ps, lod, shape, ops, t)
+            yield t[0], pts, cols
+        return
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        for t, (pts, cols) in bounded_map(ex, lambda t: _load_tile(ps, lod, shape, ops, t), tiles, 2*workers):
+            yield t[0], pts, cols
+
+def query_shape(ps: PointStore, lod: int, shape, max_points: int = 2_000_000, workers: int = 1, on_tile=None):
+    """
+    Punti del LOD dentro `shape`, ops applicate.
+    Tile classificati dal bbox del manifest: OUTSIDE non letti, INSIDE senza test per-punto.
+    on_tile(ijk, points, colors): risultati parziali man mano che i tile arrivano.
+    """
+    parts = {}
+    for ijk, pts, cols in iter_shape(ps, lod, shape, workers):
+        if pts.size == 0:
+            continue
+        parts[ijk] = (pts, cols)
+        if on_tile is not None:
+            on_tile(ijk, pts, cols)
+
+    if not parts:
         return np.empty((0,3), dtype=np.float32), None
 
-    P = np.concatenate(pts_list, axis=0)
-    C = np.concatenate(col_list, axis=0) if col_list else None
+    # ordine deterministico (per tile) indipendente dal completamento dei thread
+    ordered = [parts[k] for k in sorted(parts)]
+    P = np.concatenate([p for p, _ in ordered], axis=0)
+    C = np.concatenate([c for _, c in ordered], axis=0) if ordered[0][1] is not None else None
 
     if P.shape[0] > max_points:
         step = int(np.ceil(P.shape[0]/max_points))
@@ -69,3 +121,115 @@ def load_roi(ps: PointStore, lod: int, center: np.ndarray, radius: float, max_po
         if C is not None:
             C = C[idx]
     return P, C
+
+
+def _eye_of(shape) -> np.ndarray:
+    eye = getattr(shape, "eye", None)
+    if eye is not None:
+        return eye
+    c = getattr(shape, "center", None)
+    if c is not None:
+        return c
+    mn, mx = shape.bounds()
+    return (np.asarray(mn) + np.asarray(mx)) / 2.0
+
+def plan_lods(ps: PointStore, shape, max_points: int, eye=None, fov_deg: float = 60.0, screen_px: int = 1080,
+              max_error_px: float = 1.0) -> list[tuple[int, tuple]]:
+    """
+    LOD per tile (stessa griglia a tutti i LOD) entro un budget di punti, dai soli manifest.
+    Errore geometrico del tile al LOD l = lod_voxel_sizes[l]; errore a schermo (pixel) =
+    voxel / distanza(eye, bbox) * screen_px / (2 tan(fov/2)).
+    Si parte dal LOD piu' grossolano (tile in ordine di errore; chi non entra nel budget rimasto
+    viene saltato, i successivi piu' piccoli possono ancora entrare) e si raffina sempre il tile
+    con errore a schermo maggiore, finche' il raffinamento entra nel budget e l'errore e' sopra
+    max_error_px (il dettaglio cresce avvicinandosi a eye). Il raffinamento e' a priorita' stretta:
+    se il tile con errore maggiore non entra ci si ferma, anche se tile meno importanti entrerebbero
+    (niente dettaglio lontano mentre quello vicino resta grossolano; parte del budget resta libera).
+    I conteggi del manifest sono prima di ops e forma: il budget non viene mai superato, quindi
+    nessun punto letto va poi scartato.
+    Ritorna [(lod, (ijk, cls, bmin, bmax)), ...] pronti per _load_tile.
+    """
+    meta = ps.meta or ps.read_meta()
+    voxels = [max(float(v), 1e-9) for v in meta.lod_voxel_sizes]
+    ops = ps.compiled_ops()
+    eye = np.asarray(_eye_of(shape) if eye is None else eye, dtype=np.float64)
+    k = float(screen_px) / (2.0*np.tan(np.radians(fov_deg)/2.0))
+    min_dist = 0.1*float(meta.tile_size)
+
+    # regione (ijk) -> {lod: (count, tile)}
+    regions: dict[tuple, dict[int, tuple]] = {}
+    dist: dict[tuple, float] = {}
+    for lod in range(len(voxels)):
+        for r in _shape_rows(ps, lod, shape, ops):
+            ijk, _, bmin, bmax, n = r
+            regions.setdefault(ijk, {})[lod] = (n, r[:4])
+            d = float(np.linalg.norm(eye - np.clip(eye, bmin, bmax)))
+            dist[ijk] = min(dist.get(ijk, np.inf), max(d, min_dist))
+
+    def count(ijk, lod):
+        c = regions[ijk].get(lod)
+        return c[0] if c else 0
+
+    def err(ijk, lod):
+        return voxels[lod] / dist[ijk] * k
+
+    coarse = len(voxels) - 1
+    level: dict[tuple, int] = {}
+    used = 0
+    for ijk in sorted(regions, key=lambda r: -err(r, coarse)):
+        c = count(ijk, coarse)
+        if used + c > max_points:
+            continue   # tile troppo grande per il budget rimasto: i successivi possono entrare
+        level[ijk] = coarse
+        used += c
+
+    heap = [(-err(r, coarse), r) for r in level if coarse > 0]
+    heapq.heapify(heap)
+    while heap:
+        e, ijk = heapq.heappop(heap)
+        if -e <= max_error_px:
+            break
+        lod = level[ijk]
+        delta = count(ijk, lod - 1) - count(ijk, lod)
+        if used + delta > max_points:
+            break   # priorita' stretta (vedi docstring): nessun tile con errore minore viene raffinato prima di questo
+        level[ijk] = lod - 1
+        used += delta
+        if lod - 1 > 0:
+            heapq.heappush(heap, (-err(ijk, lod - 1), ijk))
+
+    return [(lod, regions[ijk][lod][1]) for ijk, lod in sorted(level.items()) if lod in regions[ijk]]
+
+def iter_plan(ps: PointStore, shape, plan: list[tuple[int, tuple]], workers: int = 4):
+    """Come iter_shape ma su un piano multi-LOD: yield (lod, ijk, points, colors)."""
+    ops = ps.compiled_ops()
+    workers = max(1, int(workers))
+    if workers == 1:
+        for lod, t in plan:
+            pts, cols = _load_tile(ps, lod, shape, ops, t)
+            yield lod, t[0], pts, cols
+        return
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        fn = lambda item: _load_tile(ps, item[0], shape, ops, item[1])
+        for (lod, t), (pts, cols) in bounded_map(ex, fn, plan, 2*workers):
+            yield lod, t[0], pts, cols
+
+def query_budget(ps: PointStore, shape, max_points: int = 2_000_000, eye=None, workers: int = 1, on_tile=None, **sse):
+    """
+    Punti dentro `shape` con LOD scelto per tile (plan_lods) entro max_points: piu' dettaglio
+    vicino a `eye`, nessuno stride a posteriori. sse: fov_deg, screen_px, max_error_px.
+    """
+    plan = plan_lods(ps, shape, max_points, eye=eye, **sse)
+    parts = {}
+    for lod, ijk, pts, cols in iter_plan(ps, shape, plan, workers):
+        if pts.size == 0:
+            continue
+        parts[ijk] = (pts, cols)
+        if on_tile is not None:
+            on_tile(ijk, pts, cols)
+    if not parts:
+        return np.empty((0,3), dtype=np.float32), None
+    ordered = [parts[k] for k in sorted(parts)]
+    P = np.concatenate([p for p, _ in ordered], axis=0)
+    C = np.concatenate([c for _, c in ordered], axis=0) if ordered[0][1] is not None else None
+    return P, C
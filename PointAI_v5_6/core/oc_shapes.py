@@ -0,0 +1,130 @@
+from __future__ import annotations
+import numpy as np
+
+# Classificazione tile (bbox) rispetto a una forma di query
+OUTSIDE, PARTIAL, INSIDE = 0, 1, 2
+
+
+def _boxes(bmin, bmax):
+    return (np.atleast_2d(np.asarray(bmin, dtype=np.float64)),
+            np.atleast_2d(np.asarray(bmax, dtype=np.float64)))
+
+
+class BoxShape:
+    """Box allineato agli assi [mn, mx] (estremi inclusi)."""
+
+    def __init__(self, mn, mx):
+        self.mn = np.asarray(mn, dtype=np.float64)
+        self.mx = np.asarray(mx, dtype=np.float64)
+
+    def bounds(self):
+        return self.mn, self.mx
+
+    def classify_boxes(self, bmin, bmax) -> np.ndarray:
+        bmin, bmax = _boxes(bmin, bmax)
+        out = np.full(bmin.shape[0], PARTIAL, dtype=np.int8)
+        out[((bmin >= self.mn) & (bmax <= self.mx)).all(axis=1)] = INSIDE
+        out[((bmax < self.mn) | (bmin > self.mx)).any(axis=1)] = OUTSIDE
+        return out
+
+    def contains(self, points: np.ndarray) -> np.ndarray:
+        m = (points[:, 0] >= self.mn[0]) & (points[:, 0] <= self.mx[0])
+        m &= (points[:, 1] >= self.mn[1]) & (points[:, 1] <= self.mx[1])
+        m &= (points[:, 2] >= self.mn[2]) & (points[:, 2] <= self.mx[2])
+        return m
+
+
+class SphereShape:
+    def __init__(self, center, radius: float):
+        self.center = np.asarray(center, dtype=np.float64)
+        self.radius = float(radius)
+
+    def bounds(self):
+        return self.center - self.radius, self.center + self.radius
+
+    def classify_boxes(self, bmin, bmax) -> np.ndarray:
+        bmin, bmax = _boxes(bmin, bmax)
+        r2 = self.radius * self.radius
+        near = np.clip(self.center, bmin, bmax) - self.center
+        far = np.maximum(np.abs(bmin - self.center), np.abs(bmax - self.center))
+        out = np.full(bmin.shape[0], PARTIAL, dtype=np.int8)
+        out[(far*far).sum(axis=1) <= r2] = INSIDE
+        out[(near*near).sum(axis=1) > r2] = OUTSIDE
+        return out
+
+    def contains(self, points: np.ndarray) -> np.ndarray:
+        d = points - self.center
+        return np.einsum("ij,ij->i", d, d) <= self.radius * self.radius
+
+
+class FrustumShape:
+    """
+    Frustum come intersezione di semispazi n.p + d >= 0 (planes: Kx4).
+    Con i bbox dei tile il test e' conservativo: PARTIAL puo' includere tile esterni vicini agli spigoli.
+    """
+
+    def __init__(self, planes, corners=None, eye=None):
+        self.planes = np.asarray(planes, dtype=np.float64).reshape(-1, 4)
+        self.corners = None if corners is None else np.asarray(corners, dtype=np.float64)
+        self.eye = None if eye is None else np.asarray(eye, dtype=np.float64)
+
+    @classmethod
+    def from_camera(cls, eye, target, up=(0.0, 0.0, 1.0), fov_deg: float = 60.0, aspect: float = 1.0,
+                    near: float = 0.1, far: float = 1000.0) -> "FrustumShape":
+        eye = np.asarray(eye, dtype=np.float64)
+        f = np.asarray(target, dtype=np.float64) - eye
+        f /= np.linalg.norm(f)
+        r = np.cross(f, np.asarray(up, dtype=np.float64))
+        if np.linalg.norm(r) < 1e-12:
+            r = np.cross(f, np.array([0.0, 1.0, 0.0]))
+        r /= np.linalg.norm(r)
+        u = np.cross(r, f)
+
+        th = np.tan(np.radians(fov_deg) / 2.0)   # verticale
+        tw = th * float(aspect)
+        corners = []
+        for dist in (near, far):
+            c = eye + f*dist
+            for sx in (-1, 1):
+                for sy in (-1, 1):
+                    corners.append(c + r*(sx*tw*dist) + u*(sy*th*dist))
+
+        def plane(n, p):
+            n = n / np.linalg.norm(n)
+            return np.r_[n, -np.dot(n, p)]
+
+        planes = [
+            plane(f, eye + f*near),
+            plane(-f, eye + f*far),
+            plane(f*tw + r, eye),    # sinistro
+            plane(f*tw - r, eye),    # destro
+            plane(f*th + u, eye),    # basso
+            plane(f*th - u, eye),    # alto
+        ]
+        return cls(np.array(planes), np.array(corners), eye)
+
+    def bounds(self):
+        if self.corners is None:
+            raise ValueError("Frustum senza vertici: bounds non disponibili")
+        return self.corners.min(axis=0), self.corners.max(axis=0)
+
+    def classify_boxes(self, bmin, bmax) -> np.ndarray:
+        bmin, bmax = _boxes(bmin, bmax)
+        n = self.planes[:, :3]
+        d = self.planes[:, 3]
+        # p-vertex (piu' avanti lungo n) e n-vertex (piu' indietro) di ogni box per ogni piano: MxK
+        pos = n >= 0
+        pv = np.where(pos[None, :, :], bmax[:, None, :], bmin[:, None, :])
+        nv = np.where(pos[None, :, :], bmin[:, None, :], bmax[:, None, :])
+        sp = (pv * n[None]).sum(axis=2) + d
+        sn = (nv * n[None]).sum(axis=2) + d
+        out = np.full(bmin.shape[0], PARTIAL, dtype=np.int8)
+        out[(sn >= 0).all(axis=1)] = INSIDE
+        out[(sp < 0).any(axis=1)] = OUTSIDE
+        return out
+
+    def contains(self, points: np.ndarray) -> np.ndarray:
+        m = np.ones(points.shape[0], dtype=bool)
+        for a, b, c, d in self.planes:
+            m &= (points[:, 0]*a + points[:, 1]*b + points[:, 2]*c + d) >= 0
+        return m
@@ -1,44 +1,16 @@
 from __future__ import annotations
 from dataclasses import dataclass
 from pathlib import Path
-import json
+import json, math
+import threading
 import numpy as np
-import zarr
-
-# Dual-path compression:
-# - Zarr v2: uses numcodecs compressors (e.g., numcodecs.Blosc) via `compressor=`
-# - Zarr v3: uses zarr.codecs via `compressors=` and BytesBytesCodec requirements
-try:
-    from numcodecs import Blosc as _NCBlosc
-except Exception:  # pragma: no cover
-    _NCBlosc = None
-
-try:
-    from zarr.codecs import BloscCodec as _ZBloscCodec  # zarr>=3
-except Exception:  # pragma: no cover
-    _ZBloscCodec = None
-
-
-def _zarr_major() -> int:
-    try:
-        v = getattr(zarr, "__version__", "2.0.0")
-        return int(v.split(".")[0])
-    except Exception:
-        return 2
-
-
-def _make_compressor():
-    maj = _zarr_major()
-    if maj >= 3 and _ZBloscCodec is not None:
-        # bytes-bytes codec
-        return _ZBloscCodec(cname="zstd", clevel=3, shuffle="bitshuffle")
-    if _NCBlosc is None:
-        return None
-    return _NCBlosc(cname="zstd", clevel=3, shuffle=_NCBlosc.BITSHUFFLE)
-
-
-COMP = _make_compressor()
 
+from core.oc_backend import open_backend
+from core.oc_manifest import TileManifest
+from core.oc_cache import TileCache
+from core.oc_ops import CompiledOps, compile_ops
+from core.oc_journal import OpsJournal
+from core.oc_tiles import morton_order
 
 @dataclass
 class StoreMeta:
@@ -49,16 +21,53 @@ class StoreMeta:
     tile_size: float
     lod_voxel_sizes: list[float]
     has_rgb: bool
+    lod_pyramid: bool = False  # True: LOD n+1 derivato da LOD n (parent/child nel manifest)
+    # encoding tile: "float32" (store v5 originali) | "quantized" (interi relativi all'origine tile, stile LAS)
+    point_encoding: str = "float32"
+    coord_scale: float | None = None
+    color_encoding: str = "float32"  # "float32" (0..1) | "uint8" | "uint16"
+    backend: str = "zarr"   # storage array dei tile: "zarr" (Blosc) | "mmap" (.npy non compressi, core.oc_backend)
+    codecs: dict | None = None   # array -> {cname, clevel, shuffle} (core.oc_codecs.tune_codecs); None = zstd 3 bitshuffle
+    codec_goal: str | None = None
+    point_order: str = "ingest"     # "ingest" | "morton" (punti del tile ordinati lungo la curva di Morton)
+    chunk_points: int = 200_000     # righe per chunk; con piu' chunk il manifest ha il bbox di ognuno
 
 
 class PointStore:
-    def __init__(self, root: str | Path):
+    def __init__(self, root: str | Path, cache_mb: float = 512.0):
         self.root = Path(root)
-        self.z = zarr.open_group(str(self.root), mode="a")
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._backend = None
         self.meta: StoreMeta | None = None
+        self._manifests: dict[int, TileManifest] = {}
+        self._manifest_lock = threading.Lock()
+        self._group_lock = threading.Lock()
+        self.cache = TileCache(int(cache_mb * 1024 * 1024))
+        self.journal = OpsJournal(self.root / "ops.jsonl")
+        self._compiled_ops: tuple[int, CompiledOps] | None = None
+        self._tiles_seq: int | None = None   # journal.tiles_seq() dei manifest in memoria
+
+    @property
+    def backend(self):
+        """Backend degli array (da meta.json; "zarr" per store nuovi o senza campo backend)."""
+        b = self._backend
+        if b is None:
+            with self._group_lock:
+                b = self._backend
+                if b is None:
+                    meta = self._meta() if self.meta or (self.root / "meta.json").exists() else None
+                    b = self._backend = open_backend(meta.backend if meta else "zarr", self.root,
+                                                     meta.codecs if meta else None)
+        return b
+
+    @property
+    def z(self):
+        """Gruppo Zarr radice (solo backend "zarr")."""
+        return self.backend.z
 
     def write_meta(self, meta: StoreMeta):
         self.meta = meta
+        self._backend = None   # backend/codecs dal nuovo meta
         (self.root / "meta.json").write_text(json.dumps(meta.__dict__, indent=2), encoding="utf-8")
 
     def read_meta(self) -> StoreMeta:
@@ -67,79 +76,401 @@ class PointStore:
         return self.meta
 
     def ensure_ops(self):
-        p = self.root / "ops.json"
-        if not p.exists():
-            p.write_text(json.dumps({"ops": []}, indent=2), encoding="utf-8")
+        """Crea il journal ops.jsonl; uno store con il vecchio ops.json viene migrato (ops.json.bak)."""
+        if self.journal.path.exists():
+            return
+        legacy = self.root / "ops.json"
+        tmp = self.journal.path.with_suffix(".jsonl.tmp")
+        tmp.unlink(missing_ok=True)
+        j = OpsJournal(tmp)
+        if legacy.exists():
+            j.import_legacy(json.loads(legacy.read_text(encoding="utf-8")))
+        tmp.touch()
+        tmp.replace(self.journal.path)
+        if legacy.exists():
+            legacy.replace(legacy.with_suffix(".json.bak"))
+
+    def append_op(self, op: dict) -> int:
+        """Aggiunge un'op in coda al journal (O(1)); ritorna il seq del record."""
+        self.ensure_ops()
+        return self.journal.append(op)
 
-    def append_op(self, op: dict):
+    def undo_op(self) -> bool:
         self.ensure_ops()
-        p = self.root / "ops.json"
-        data = json.loads(p.read_text(encoding="utf-8"))
-        data["ops"].append(op)
-        p.write_text(json.dumps(data, indent=2), encoding="utf-8")
+        return self.journal.undo()
+
+    def redo_op(self) -> bool:
+        self.ensure_ops()
+        return self.journal.redo()
 
     def read_ops(self) -> list[dict]:
+        """Ops attive (fino al cursore undo/redo)."""
+        self.ensure_ops()
+        return self.journal.ops()
+
+    def ops_watermark(self) -> int:
+        """Numero di ops gia' materializzate nei tile (compattazione): non vanno riapplicate in lettura."""
         self.ensure_ops()
-        return json.loads((self.root / "ops.json").read_text(encoding="utf-8")).get("ops", [])
+        return self.journal.watermark()
+
+    def pending_ops(self) -> list[dict]:
+        self.ensure_ops()
+        _, ops, wm = self.journal.state()
+        return ops[wm:]
+
+    def compiled_ops(self) -> CompiledOps:
+        """
+        Ops dopo il watermark, compilate (con indice spaziale); ricompilate solo quando cambia il seq del journal.
+        Se intanto un altro PointStore ha compattato (rollback, classificazione) lo store, i manifest in memoria
+        puntano ancora alle versioni precedenti dei tile: vengono ricaricati insieme al nuovo watermark.
+        """
+        self.ensure_ops()
+        tiles_seq = self.journal.tiles_seq()
+        if self._tiles_seq is not None and tiles_seq != self._tiles_seq:
+            with self._manifest_lock:
+                self._manifests = {}
+                self._tiles_seq = None
+            self.cache.clear()
+        seq, ops, wm = self.journal.state()
+        cached = self._compiled_ops
+        if cached is not None and cached[0] == seq:
+            return cached[1]
+        c = compile_ops(ops[wm:])
+        self._compiled_ops = (seq, c)
+        return c
 
     def _tile_key(self, ix: int, iy: int, iz: int) -> str:
         return f"{ix}_{iy}_{iz}"
 
-    def tile_group(self, lod: int, ix: int, iy: int, iz: int, create: bool = True):
-        g = self.z.require_group(f"lod{lod}").require_group("tiles")
-        key = self._tile_key(ix, iy, iz)
-        return g.require_group(key) if create else g[key]
+    def _tile_path(self, lod: int, ix: int, iy: int, iz: int, data: str | None = None) -> str:
+        return f"lod{lod}/tiles/{self._tile_key(ix, iy, iz)}" + (f"/{data}" if data else "")
+
+    def ensure_lod(self, lod: int):
+        self.backend.ensure_lod(lod)
+
+    def delete_tile_version(self, lod: int, ix: int, iy: int, iz: int, data: str):
+        """Rimuove la versione `data` del tile (compattazione/rollback); gli array originali restano."""
+        self.backend.delete(self._tile_path(lod, ix, iy, iz, data))
 
     def tile_exists(self, lod: int, ix: int, iy: int, iz: int) -> bool:
-        try:
-            tiles = self.z[f"lod{lod}/tiles"]
-            return self._tile_key(ix, iy, iz) in tiles
-        except Exception:
-            return False
-
-    def _create_array(self, tg, name: str, data: np.ndarray):
-        maj = _zarr_major()
-        n = int(len(data)) or 1
-        chunks = (min(200_000, n), data.shape[1])
-
-        if name in tg:
-            del tg[name]
-
-        if maj >= 3:
-            # Zarr v3 requires shape/dtype and uses `compressors=`
-            kwargs = dict(shape=data.shape, dtype=data.dtype, chunks=chunks, overwrite=True)
-            if COMP is not None:
-                kwargs["compressors"] = [COMP]
-            arr = tg.create_dataset(name, **kwargs)
-            arr[:] = data
-            return arr
-
-        # Zarr v2 path: accepts data= and `compressor=`
-        kwargs = dict(data=data, chunks=chunks, overwrite=True)
-        if COMP is not None:
-            kwargs["compressor"] = COMP
-        return tg.create_dataset(name, **kwargs)
+        return self._tile_key(ix, iy, iz) in self.manifest(lod)
 
-    def write_tile(self, lod: int, ix: int, iy: int, iz: int, points: np.ndarray, colors: np.ndarray | None):
-        tg = self.tile_group(lod, ix, iy, iz, create=True)
-        pts = points.astype(np.float32, copy=False)
-        self._create_array(tg, "points", pts)
-        if colors is not None:
-            cols = colors.astype(np.float32, copy=False)
-            self._create_array(tg, "colors", cols)
+    # ---------- manifest ----------
+    def _manifest_path(self, lod: int) -> Path:
+        return self.root / f"manifest_lod{lod}.json"
+
+    def manifest(self, lod: int) -> TileManifest:
+        """Manifest del LOD (caricato una volta; ricostruito dai tile per store senza manifest)."""
+        m = self._manifests.get(lod)
+        if m is not None:
+            return m
+        with self._manifest_lock:
+            m = self._manifests.get(lod)
+            if m is None:
+                if self._tiles_seq is None:
+                    # letto prima dei manifest: una compattazione nel mezzo causa solo una ricarica in piu'
+                    self._tiles_seq = self.journal.tiles_seq() if self.journal.path.exists() else 0
+                p = self._manifest_path(lod)
+                if p.exists():
+                    m = TileManifest.load(p)
+                else:
+                    m = self._scan_manifest(lod)
+                    if len(m):
+                        m.save(p)
+                self._manifests[lod] = m
+        return m
+
+    def _scan_manifest(self, lod: int) -> TileManifest:
+        # store creati prima del manifest: un passaggio completo sui tile
+        m = TileManifest()
+        for key in self.backend.tile_keys(lod):
+            ix, iy, iz = (int(v) for v in key.split("_"))
+            path = self._tile_path(lod, ix, iy, iz)
+            raw = self.backend.read(path, "points")
+            if raw is None:
+                continue
+            pts = self._decode_points(ix, iy, iz, raw)
+            self._update_manifest(m, key, (ix, iy, iz), pts, self.backend.stored_bytes(path))
+        return m
+
+    def _update_manifest(self, m: TileManifest, key: str, ijk, pts: np.ndarray, nbytes: int):
+        if pts.shape[0]:
+            m.update(key, ijk, pts.shape[0], pts.min(axis=0), pts.max(axis=0), nbytes)
+        else:
+            m.update(key, ijk, 0, [0.0]*3, [0.0]*3, nbytes)
+
+    def reset_manifests(self, n_lods: int):
+        """Manifest vuoti per un nuovo build (i tile di build precedenti non vengono piu' indicizzati)."""
+        with self._manifest_lock:
+            self._manifests = {lod: TileManifest() for lod in range(int(n_lods))}
+        self.cache.clear()
+
+    def write_manifests(self):
+        for lod, m in list(self._manifests.items()):
+            m.save(self._manifest_path(lod))
+
+    def save_manifest(self, lod: int):
+        self.manifest(lod).save(self._manifest_path(lod))
+
+    def query_tiles(self, lod: int, mn, mx) -> list[tuple[int, int, int]]:
+        """Tile (ix, iy, iz) con bbox che interseca [mn, mx], dal manifest."""
+        m = self.manifest(lod)
+        return [tuple(m.get(k)["ijk"]) for k in m.query_box(mn, mx)]
+
+    # ---------- encoding ----------
+    def _meta(self) -> StoreMeta:
+        return self.meta or self.read_meta()
+
+    def _tile_origin(self, ix: int, iy: int, iz: int) -> np.ndarray:
+        meta = self._meta()
+        return np.asarray(meta.bounds_min, dtype=np.float64) + np.array([ix, iy, iz], dtype=np.float64)*float(meta.tile_size)
+
+    def _encode_points(self, ix: int, iy: int, iz: int, points: np.ndarray) -> np.ndarray:
+        meta = self._meta()
+        if meta.point_encoding != "quantized" or not meta.coord_scale:
+            return points.astype(np.float32, copy=False)
+        scale = float(meta.coord_scale)
+        qdt = np.uint16 if math.ceil(float(meta.tile_size)/scale) <= np.iinfo(np.uint16).max else np.uint32
+        q = np.rint((points - self._tile_origin(ix, iy, iz)) / scale)
+        if q.size and (q.min() < 0 or q.max() > np.iinfo(qdt).max):
+            # punti fuori dal tile (scritture manuali): tile salvato in float32, read_tile lo riconosce dal dtype
+            return points.astype(np.float32, copy=False)
+        return q.astype(qdt)
+
+    def _encode_colors(self, colors: np.ndarray) -> np.ndarray:
+        enc = self._meta().color_encoding
+        c = np.asarray(colors)
+        if enc == "uint8":
+            if c.dtype == np.uint8:
+                return c
+            if c.dtype == np.uint16:
+                return (c >> 8).astype(np.uint8)
+            return np.rint(np.clip(c, 0.0, 1.0)*255.0).astype(np.uint8)
+        if enc == "uint16":
+            if c.dtype == np.uint16:
+                return c
+            if c.dtype == np.uint8:
+                return c.astype(np.uint16)*257
+            return np.rint(np.clip(c, 0.0, 1.0)*65535.0).astype(np.uint16)
+        return c.astype(np.float32, copy=False)
+
+    def _decode_points(self, ix: int, iy: int, iz: int, raw: np.ndarray, dtype=np.float32) -> np.ndarray:
+        if raw.dtype.kind == "f":
+            return raw.astype(dtype, copy=False)
+        scale = float(self._meta().coord_scale)
+        return (raw*scale + self._tile_origin(ix, iy, iz)).astype(dtype, copy=False)
+
+    def decode_points(self, ix: int, iy: int, iz: int, raw: np.ndarray, dtype=np.float32) -> np.ndarray:
+        """Coordinate assolute da array codificati (read_tile_raw)."""
+        return self._decode_points(ix, iy, iz, raw, dtype)
+
+    @staticmethod
+    def _decode_colors(raw: np.ndarray | None) -> np.ndarray | None:
+        if raw is None or raw.dtype.kind == "f":
+            return raw
+        return raw.astype(np.float32) / float(np.iinfo(raw.dtype).max)
+
+    def _read_arrays(self, lod: int, ix: int, iy: int, iz: int):
+        """(points, colors) codificati della versione corrente del tile: originali o ultima compattazione."""
+        e = self.manifest(lod).get(self._tile_key(ix, iy, iz))
+        path = self._tile_path(lod, ix, iy, iz, e.get("data") if e else None)
+        raw = self.backend.read(path, "points")
+        if raw is None:
+            raise KeyError(f"Tile mancante: {path}")
+        return raw, self.backend.read(path, "colors")
+
+    def _chunk_bounds(self, ijk, enc: np.ndarray) -> list | None:
+        """bbox [min, max] di ogni chunk di righe (dai valori codificati, come il bbox del tile)."""
+        rows = int(self._meta().chunk_points)
+        if enc.shape[0] <= rows:
+            return None
+        starts = np.arange(0, enc.shape[0], rows)
+        mn = self._decode_points(*ijk, np.minimum.reduceat(enc, starts, axis=0))
+        mx = self._decode_points(*ijk, np.maximum.reduceat(enc, starts, axis=0))
+        return np.hstack([mn, mx]).tolist()
+
+    def _write_encoded(self, lod: int, ijk, enc: np.ndarray, cols: np.ndarray | None, data: str | None,
+                       classes: np.ndarray | None = None):
+        nbytes = self.backend.write(self._tile_path(lod, *ijk, data), {"points": enc, "colors": cols, "classes": classes},
+                                    chunk_rows=int(self._meta().chunk_points))
+        # bbox dai valori codificati: coincide con quello dei punti restituiti da read_tile
+        ext = np.stack([enc.min(axis=0), enc.max(axis=0)]) if enc.shape[0] else enc
+        pts = self._decode_points(*ijk, ext)
+        m = self.manifest(lod)
+        key = self._tile_key(*ijk)
+        if pts.shape[0]:
+            m.update(key, ijk, enc.shape[0], pts.min(axis=0), pts.max(axis=0), nbytes, data=data,
+                     chunks=self._chunk_bounds(ijk, enc))
         else:
-            if "colors" in tg:
-                del tg["colors"]
+            m.update(key, ijk, 0, [0.0]*3, [0.0]*3, nbytes, data=data)
+
+    def write_tile(self, lod: int, ix: int, iy: int, iz: int, points: np.ndarray, colors: np.ndarray | None):
+        """
+        points: coordinate assolute (float32/float64); colors: 0..1 float o uint8/uint16.
+        point_order "morton": righe riordinate lungo la curva di Morton (chunk compatti nello spazio).
+        """
+        enc = self._encode_points(ix, iy, iz, points)
+        cols = self._encode_colors(colors) if colors is not None else None
+        if self._meta().point_order == "morton" and enc.shape[0] > 1:
+            o = morton_order(enc)
+            enc = enc[o]
+            cols = cols[o] if cols is not None else None
+        self._write_encoded(lod, (ix, iy, iz), enc, cols, None)
+
+    def write_tile_encoded(self, lod: int, ix: int, iy: int, iz: int, enc: np.ndarray, cols: np.ndarray | None,
+                           classes: np.ndarray | None = None):
+        """Scrive array gia' codificati (stesso encoding dello store), es. da read_tile_raw di un altro store."""
+        self._write_encoded(lod, (ix, iy, iz), enc, cols, None, classes)
+
+    def write_tile_filtered(self, lod: int, ix: int, iy: int, iz: int, keep: np.ndarray, data: str) -> str | None:
+        """
+        Nuova versione del tile con i soli punti `keep`, nel sottogruppo `data`.
+        Copia gli array gia' codificati (nessuna ri-quantizzazione); gli originali restano per il rollback.
+        Ritorna la versione intermedia sostituita (da eliminare con delete_tile_version solo dopo aver
+        salvato il manifest: fino ad allora quello su disco la usa ancora), o None.
+        """
+        raw, rcols = self._read_arrays(lod, ix, iy, iz)
+        rcls = self._read_classes(lod, ix, iy, iz)
+        enc = raw[keep]
+        cols = rcols[keep] if rcols is not None else None
+        prev = self.manifest(lod).get(self._tile_key(ix, iy, iz)).get("data")
+        self._write_encoded(lod, (ix, iy, iz), enc, cols, data, rcls[keep] if rcls is not None else None)
+        return prev if prev and prev != data else None   # per il rollback servono solo gli originali
 
     def read_tile(self, lod: int, ix: int, iy: int, iz: int):
-        tg = self.tile_group(lod, ix, iy, iz, create=False)
-        pts = np.asarray(tg["points"])
-        cols = np.asarray(tg["colors"]) if "colors" in tg else None
+        """(points float32, colors float32 0..1) decodificati; passano dalla cache LRU (array read-only)."""
+        key = self._tile_key(ix, iy, iz)
+        e = self.manifest(lod).get(key)
+        ck = (lod, key, int(e.get("version", 0)) if e else 0)
+        hit = self.cache.get(ck)
+        if hit is not None:
+            return hit
+        raw, rcols = self._read_arrays(lod, ix, iy, iz)
+        pts = self._decode_points(ix, iy, iz, raw)
+        cols = self._decode_colors(rcols)
+        self.cache.put(ck, (pts, cols))
         return pts, cols
 
+    def read_tile_chunks(self, lod: int, ix: int, iy: int, iz: int, chunks):
+        """
+        (points, colors) decodificati delle sole righe dei chunk `chunks` (indici nei bbox "chunks"
+        del manifest), in ordine di chunk. Si leggono/decomprimono solo quei chunk; ogni chunk passa
+        dalla cache LRU, un tile gia' in cache viene solo affettato.
+        """
+        key = self._tile_key(ix, iy, iz)
+        e = self.manifest(lod).get(key)
+        ck = (lod, key, int(e.get("version", 0)))
+        rows, n = int(self._meta().chunk_points), int(e["count"])
+        span = {int(c): (int(c)*rows, min(n, (int(c)+1)*rows)) for c in chunks}
+        full = self.cache.get(ck)
+        if full is not None:
+            idx = np.concatenate([np.arange(a, b) for a, b in span.values()])
+            return full[0][idx], (full[1][idx] if full[1] is not None else None)
+
+        parts = {c: self.cache.get(ck + (c,)) for c in span}
+        missing = sorted(c for c, hit in parts.items() if hit is None)
+        if missing:
+            path = self._tile_path(lod, ix, iy, iz, e.get("data"))
+            ranges = [span[c] for c in missing]
+            pts = self._decode_points(ix, iy, iz, self.backend.read_rows(path, "points", ranges))
+            cols = self._decode_colors(self.backend.read_rows(path, "colors", ranges))
+            off = 0
+            for c in missing:   # read_rows restituisce i range in ordine crescente
+                a, b = span[c]
+                sl = slice(off, off + b - a)
+                parts[c] = (pts[sl], cols[sl] if cols is not None else None)
+                self.cache.put(ck + (c,), parts[c])
+                off += b - a
+        ordered = [parts[c] for c in span]
+        P = np.concatenate([p for p, _ in ordered])
+        C = np.concatenate([c for _, c in ordered]) if ordered[0][1] is not None else None
+        return P, C
+
+    # ---------- classificazione ----------
+    def _read_classes(self, lod: int, ix: int, iy: int, iz: int, ranges=None) -> np.ndarray | None:
+        e = self.manifest(lod).get(self._tile_key(ix, iy, iz))
+        path = self._tile_path(lod, ix, iy, iz, e.get("data") if e else None)
+        if ranges is None:
+            return self.backend.read(path, "classes")
+        return self.backend.read_rows(path, "classes", ranges)
+
+    def read_tile_classes(self, lod: int, ix: int, iy: int, iz: int, chunks=None) -> np.ndarray:
+        """
+        Codici di classificazione LAS (uint8) per riga della versione corrente del tile, 0 = mai
+        classificato (tile senza array "classes"). chunks: solo le righe di quei chunk, come read_tile_chunks.
+        """
+        key = self._tile_key(ix, iy, iz)
+        e = self.manifest(lod).get(key)
+        n = int(e["count"])
+        ck = (lod, key, int(e.get("version", 0)), "classes")
+        hit = self.cache.get(ck)
+        if hit is None and chunks is None:
+            cls = self._read_classes(lod, ix, iy, iz)
+            hit = (np.zeros(n, dtype=np.uint8) if cls is None else np.asarray(cls),)
+            self.cache.put(ck, hit)
+        if chunks is None:
+            return hit[0]
+        rows = int(self._meta().chunk_points)
+        ranges = [(int(c)*rows, min(n, (int(c)+1)*rows)) for c in chunks]
+        if hit is not None:
+            return np.concatenate([hit[0][a:b] for a, b in ranges])
+        cls = self._read_classes(lod, ix, iy, iz, ranges)
+        if cls is None:
+            return np.zeros(sum(b - a for a, b in ranges), dtype=np.uint8)
+        # read_rows restituisce i range in ordine crescente: riordina come `chunks`
+        off = np.cumsum([0] + [b - a for a, b in sorted(ranges)])
+        pos = {r: off[i] for i, r in enumerate(sorted(ranges))}
+        return np.concatenate([cls[pos[r]:pos[r] + r[1] - r[0]] for r in ranges])
+
+    def write_tile_classes(self, lod: int, ix: int, iy: int, iz: int, classes: np.ndarray):
+        """Classificazione per riga nella versione corrente del tile (punti invariati, nuova version nel manifest)."""
+        key = self._tile_key(ix, iy, iz)
+        e = self.manifest(lod).get(key)
+        classes = np.asarray(classes, dtype=np.uint8)
+        if classes.shape != (int(e["count"]),):
+            raise ValueError(f"classes: attese {e['count']} righe, ricevute {classes.shape}")
+        nbytes = self.backend.write(self._tile_path(lod, ix, iy, iz, e.get("data")), {"classes": classes},
+                                    chunk_rows=int(self._meta().chunk_points))
+        self.manifest(lod).touch(key, nbytes)
+
+    def read_tile_raw(self, lod: int, ix: int, iy: int, iz: int):
+        """(points, colors) come salvati (interi quantizzati / uint8), senza cache (backend mmap: mappe read-only)."""
+        return self._read_arrays(lod, ix, iy, iz)
+
+    def read_tile_raw_classes(self, lod: int, ix: int, iy: int, iz: int) -> np.ndarray | None:
+        """Array "classes" come salvato, senza cache; None se il tile non e' mai stato classificato."""
+        return self._read_classes(lod, ix, iy, iz)
+
+    def read_tile_exact(self, lod: int, ix: int, iy: int, iz: int):
+        """Come read_tile ma coordinate float64 (nessun arrotondamento a float32 per coordinate grandi), senza cache."""
+        raw, cols = self.read_tile_raw(lod, ix, iy, iz)
+        return self.decode_points(ix, iy, iz, raw, np.float64), self._decode_colors(cols)
+
+    def copy_tile_from(self, src: "PointStore", lod: int, ix: int, iy: int, iz: int):
+        """
+        Copia un tile da `src` (stesso encoding) senza decodificare: con lo stesso backend i dati
+        su disco vengono copiati cosi' come sono (chunk compressi Zarr v2 / file .npy);
+        altrimenti gli array codificati vengono riscritti nel backend di destinazione.
+        """
+        key = self._tile_key(ix, iy, iz)
+        e = src.manifest(lod).get(key)
+        nbytes = self.backend.copy_from(src.backend, src._tile_path(lod, ix, iy, iz, e.get("data")),
+                                        self._tile_path(lod, ix, iy, iz))
+        if nbytes is None:
+            self.write_tile_encoded(lod, ix, iy, iz, *src.read_tile_raw(lod, ix, iy, iz),
+                                    classes=src.read_tile_raw_classes(lod, ix, iy, iz))
+            return
+        self.manifest(lod).update(key, e["ijk"], e["count"], e["bmin"], e["bmax"], nbytes, chunks=e.get("chunks"))
+
+    def cache_stats(self) -> dict:
+        return self.cache.stats()
+
+    def lod_hierarchy(self, lod: int) -> tuple[dict, dict]:
+        """(parent, children): tile key -> tile key al LOD lod+1 / lista di tile key al LOD lod-1."""
+        m = self.manifest(lod)
+        parent = {k: e.get("parent") for k, e in m.entries.items() if "parent" in e}
+        children = {k: e.get("children", []) for k, e in m.entries.items() if "children" in e}
+        return parent, children
+
     def list_tiles(self, lod: int):
-        try:
-            tiles = self.z[f"lod{lod}/tiles"]
-            return list(tiles.group_keys())
-        except Exception:
-            return []
+        return self.manifest(lod).keys()
@@ -0,0 +1,134 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import numpy as np
+
+from core.oc_store import PointStore
+from core.oc_shapes import INSIDE
+from core.oc_query import plan_lods, _load_tile
+
+
+class TileStreamer:
+    """
+    Streaming dei tile guidato dalla camera, indipendente da Qt.
+    update(eye, shape) ripianifica (plan_lods: LOD per tile entro il budget di punti) su un thread
+    dedicato, l'ultima richiesta vince. I tile mancanti si caricano in background, prima i LOD
+    grossolani e poi per distanza da eye. poll() restituisce le modifiche per la vista:
+    (aggiunti [((lod, ijk), points, colors)], rimossi [(lod, ijk)]).
+    Un tile che cambia LOD resta visibile finche' non arriva il nuovo; i tile usciti dalla vista
+    vengono rimossi subito. I tile si mostrano interi (nessun taglio alla forma): piccoli
+    movimenti della camera non richiedono riletture.
+    origin: punti restituiti in float32 relativi a origin, decodificati in float64 (read_tile_exact):
+    con coordinate grandi (UTM) resta la precisione della quantizzazione. None = float32 assoluti (read_tile).
+    """
+
+    def __init__(self, ps: PointStore, point_budget: int = 3_000_000, workers: int = 4, origin=None, **sse):
+        self.ps = ps
+        self.point_budget = int(point_budget)
+        self.origin = None if origin is None else np.asarray(origin, dtype=np.float64)
+        self.sse = sse
+        self._plan_ex = ThreadPoolExecutor(max_workers=1)
+        self._load_ex = ThreadPoolExecutor(max_workers=max(1, int(workers)))
+        self._lock = threading.Lock()
+        self._gen = 0
+        self._target: dict[tuple, int] = {}      # ijk -> lod voluto
+        self._shown: dict[tuple, int] = {}       # ijk -> lod visibile
+        self._pending: dict[tuple, object] = {}  # (lod, ijk) -> Future
+        self._ready: list = []
+        self._evict: list[tuple] = []
+        self._closed = False
+
+    # ---------- pianificazione ----------
+    def update(self, eye, shape):
+        """Nuova posizione camera: ripianifica in background (non blocca la UI)."""
+        with self._lock:
+            if self._closed:
+                return
+            self._gen += 1
+            gen = self._gen
+        self._plan_ex.submit(self._replan, gen, np.asarray(eye, dtype=np.float64), shape)
+
+    def _replan(self, gen: int, eye: np.ndarray, shape):
+        if gen != self._gen:
+            return
+        plan = plan_lods(self.ps, shape, self.point_budget, eye=eye, **self.sse)
+        order = sorted(plan, key=lambda p: (-p[0], float(np.linalg.norm(eye - np.clip(eye, p[1][2], p[1][3])))))
+        with self._lock:
+            if gen != self._gen or self._closed:
+                return
+            self._target = {t[0]: lod for lod, t in plan}
+            for ijk, lod in list(self._shown.items()):
+                if ijk not in self._target:
+                    self._evict.append((lod, ijk))
+                    del self._shown[ijk]
+            for key, fut in list(self._pending.items()):
+                if self._target.get(key[1]) != key[0] and fut.cancel():
+                    del self._pending[key]
+            ready = {key for key, _, _ in self._ready}
+            for lod, t in order:
+                key = (lod, t[0])
+                if self._shown.get(t[0]) == lod or key in self._pending or key in ready:
+                    continue
+                tile = (t[0], INSIDE, t[2], t[3])
+                fut = self._load_ex.submit(self._load, lod, tile)
+                self._pending[key] = fut
+
+    def _load(self, lod: int, tile):
+        # errore di lettura: il tile esce da _pending (busy() si libera) e il prossimo update lo riprova
+        try:
+            pts, cols = self._read(lod, tile)
+            with self._lock:
+                self._ready.append(((lod, tile[0]), pts, cols))
+        finally:
+            with self._lock:
+                self._pending.pop((lod, tile[0]), None)
+
+    def _read(self, lod: int, tile):
+        ops = self.ps.compiled_ops()
+        if self.origin is None:
+            return _load_tile(self.ps, lod, None, ops, tile)
+        ijk, _, bmin, bmax = tile
+        exact, cols = self.ps.read_tile_exact(lod, *ijk)
+        classes = self.ps.read_tile_classes(lod, *ijk) if ops.needs_classes and exact.size else None
+        keep = ops.evaluate(exact.astype(np.float32), bmin, bmax, classes)   # ops sui float32 come _load_tile
+        if keep is not None:
+            exact = exact[keep]
+            cols = cols[keep] if cols is not None else None
+        return (exact - self.origin).astype(np.float32), cols
+
+    # ---------- risultati ----------
+    def poll(self, max_tiles: int | None = None):
+        """Modifiche da applicare alla vista dall'ultimo poll (al piu' max_tiles tile aggiunti)."""
+        added, removed = [], []
+        with self._lock:
+            removed, self._evict = self._evict, []
+            ready = self._ready if max_tiles is None else self._ready[:max_tiles]
+            self._ready = [] if max_tiles is None else self._ready[max_tiles:]
+            for (lod, ijk), pts, cols in ready:
+                if self._target.get(ijk) != lod:
+                    continue   # piano cambiato mentre il tile era in lettura
+                old = self._shown.get(ijk)
+                if old == lod:
+                    continue   # gia' in vista (caricato due volte)
+                if old is not None:
+                    removed.append((old, ijk))
+                self._shown[ijk] = lod
+                if pts.shape[0]:
+                    added.append(((lod, ijk), pts, cols))
+        return added, removed
+
+    def busy(self) -> bool:
+        with self._lock:
+            return bool(self._pending or self._ready)
+
+    def shown_points(self) -> int:
+        with self._lock:
+            shown = dict(self._shown)
+        return sum(int(self.ps.manifest(lod).get(f"{i}_{j}_{k}")["count"]) for (i, j, k), lod in shown.items())
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._gen += 1
+        self._plan_ex.shutdown(wait=False, cancel_futures=True)
+        self._load_ex.shutdown(wait=False, cancel_futures=True)
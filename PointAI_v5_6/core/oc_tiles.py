@@ -0,0 +1,90 @@
+from __future__ import annotations
+import numpy as np
+
+# Chiave tile impacchettata in int64: 21 bit per asse (indici in [-2^20, 2^20)).
+_KEY_BITS = 21
+_KEY_OFF = 1 << (_KEY_BITS - 1)
+_KEY_MASK = (1 << _KEY_BITS) - 1
+
+
+def tile_indices(points: np.ndarray, tile_size: float, bmin: np.ndarray) -> np.ndarray:
+    rel = (points - bmin) / tile_size
+    return np.floor(rel).astype(np.int32)
+
+
+def pack_tile_keys(idx: np.ndarray) -> np.ndarray:
+    """Nx3 indici tile -> N chiavi int64 (ordinamento = ordine lessicografico ix, iy, iz)."""
+    q = idx.astype(np.int64) + _KEY_OFF
+    return (q[:, 0] << (2*_KEY_BITS)) | (q[:, 1] << _KEY_BITS) | q[:, 2]
+
+
+def unpack_tile_keys(packed: np.ndarray) -> np.ndarray:
+    packed = np.asarray(packed, dtype=np.int64)
+    out = np.empty((packed.shape[0], 3), dtype=np.int64)
+    out[:, 0] = (packed >> (2*_KEY_BITS)) & _KEY_MASK
+    out[:, 1] = (packed >> _KEY_BITS) & _KEY_MASK
+    out[:, 2] = packed & _KEY_MASK
+    return out - _KEY_OFF
+
+
+def group_by_tile(idx: np.ndarray):
+    """
+    Group-by tile con un solo argsort.
+    Ritorna (order, keys Mx3, offsets M+1): i punti del tile i sono order[offsets[i]:offsets[i+1]].
+    """
+    packed = pack_tile_keys(idx)
+    order = np.argsort(packed, kind="stable")
+    sp = packed[order]
+    if sp.shape[0] == 0:
+        return order, np.empty((0, 3), dtype=np.int64), np.zeros(1, dtype=np.int64)
+    starts = np.flatnonzero(np.r_[True, sp[1:] != sp[:-1]])
+    offsets = np.r_[starts, sp.shape[0]].astype(np.int64)
+    keys = unpack_tile_keys(sp[starts])
+    return order, keys, offsets
+
+
+def split_by_tile(points: np.ndarray, tile_size: float, bmin: np.ndarray, *arrays):
+    """
+    Yield (key, points_tile, *arrays_tile) per ogni tile non vuoto.
+    Gli array vengono riordinati una volta sola; ogni tile e' una slice contigua.
+    `arrays` puo' contenere None (es. colori assenti).
+    """
+    order, keys, offsets = group_by_tile(tile_indices(points, tile_size, bmin))
+    pts = points[order]
+    arrs = [a[order] if a is not None else None for a in arrays]
+    for i in range(keys.shape[0]):
+        a, b = int(offsets[i]), int(offsets[i+1])
+        key = (int(keys[i, 0]), int(keys[i, 1]), int(keys[i, 2]))
+        yield (key, pts[a:b], *[x[a:b] if x is not None else None for x in arrs])
+
+
+def _spread3(v: np.ndarray) -> np.ndarray:
+    """21 bit -> un bit ogni tre (interleaving Morton)."""
+    x = v.astype(np.uint64) & np.uint64(0x1fffff)
+    x = (x | (x << np.uint64(32))) & np.uint64(0x1f00000000ffff)
+    x = (x | (x << np.uint64(16))) & np.uint64(0x1f0000ff0000ff)
+    x = (x | (x << np.uint64(8))) & np.uint64(0x100f00f00f00f00f)
+    x = (x | (x << np.uint64(4))) & np.uint64(0x10c30c30c30c30c3)
+    x = (x | (x << np.uint64(2))) & np.uint64(0x1249249249249249)
+    return x
+
+
+def morton_order(coords: np.ndarray) -> np.ndarray:
+    """
+    Permutazione che ordina Nx3 coordinate lungo la curva di Morton (Z-order), 21 bit per asse.
+    Interi non negativi (punti quantizzati del tile) usati cosi' come sono; float riportati
+    sul proprio bbox. Punti vicini nello spazio finiscono vicini nell'array.
+    """
+    c = np.asarray(coords)
+    if c.shape[0] < 2:
+        return np.arange(c.shape[0])
+    if c.dtype.kind == "f":
+        mn = c.min(axis=0)
+        span = np.maximum(c.max(axis=0) - mn, 1e-12)
+        q = ((c - mn) / span * float(_KEY_MASK)).astype(np.uint64)
+    else:
+        q = c.astype(np.uint64)
+        shift = max(0, int(q.max()).bit_length() - _KEY_BITS)
+        q >>= np.uint64(shift)
+    codes = _spread3(q[:, 0]) | (_spread3(q[:, 1]) << np.uint64(1)) | (_spread3(q[:, 2]) << np.uint64(2))
+    return np.argsort(codes, kind="stable")
@@ -1,6 +1,7 @@
 from __future__ import annotations
 import numpy as np
 import open3d as o3d
+from core.neighbor_index import NeighborIndex, statistical_inliers, dbscan_labels
 
 def get_bounds_info(pcd: o3d.geometry.PointCloud) -> dict:
     pts = np.asarray(pcd.points)
@@ -20,14 +21,23 @@ def voxel_downsample(pcd: o3d.geometry.PointCloud, voxel_size: float = 0.05) ->
     voxel_size = max(1e-6, float(voxel_size))
     return pcd.voxel_down_sample(voxel_size)
 
-def denoise_statistical(pcd: o3d.geometry.PointCloud, nb_neighbors: int = 20, std_ratio: float = 2.0) -> o3d.geometry.PointCloud:
+def denoise_statistical(pcd: o3d.geometry.PointCloud, nb_neighbors: int = 20, std_ratio: float = 2.0,
+                        index: NeighborIndex | None = None) -> o3d.geometry.PointCloud:
+    """index: NeighborIndex di pcd (distanze k-NN riusate tra tentativi con parametri diversi)."""
     nb_neighbors = max(1, int(nb_neighbors))
     std_ratio = max(0.1, float(std_ratio))
+    if index is not None and index.matches(pcd):
+        return pcd.select_by_index(statistical_inliers(index, nb_neighbors, std_ratio).tolist())
     _, ind = pcd.remove_statistical_outlier(nb_neighbors=nb_neighbors, std_ratio=std_ratio)
     return pcd.select_by_index(ind)
 
-def dbscan_clusters(pcd: o3d.geometry.PointCloud, eps: float = 0.10, min_points: int = 20) -> tuple[o3d.geometry.PointCloud, int]:
-    labels = np.array(pcd.cluster_dbscan(eps=float(eps), min_points=int(min_points), print_progress=False))
+def dbscan_clusters(pcd: o3d.geometry.PointCloud, eps: float = 0.10, min_points: int = 20,
+                    index: NeighborIndex | None = None) -> tuple[o3d.geometry.PointCloud, int]:
+    """index: NeighborIndex di pcd (vicini entro eps riusati per eps <= quello gia' calcolato)."""
+    if index is not None and index.matches(pcd):
+        labels = dbscan_labels(index, float(eps), int(min_points))
+    else:
+        labels = np.array(pcd.cluster_dbscan(eps=float(eps), min_points=int(min_points), print_progress=False))
     if labels.size == 0:
         return pcd, 0
 
@@ -4,21 +4,71 @@ import numpy as np
 def reservoir_update(res_points: np.ndarray, res_colors: np.ndarray|None, seen: int,
                      chunk_points: np.ndarray, chunk_colors: np.ndarray|None,
                      rng: np.random.Generator) -> int:
-    """Reservoir sampling update."""
+    """Reservoir sampling update (Algorithm R vettorizzato sull'intero chunk)."""
     K = res_points.shape[0]
-    for i in range(chunk_points.shape[0]):
-        seen += 1
-        if seen <= K:
-            res_points[seen-1] = chunk_points[i]
-            if res_colors is not None and chunk_colors is not None:
-                res_colors[seen-1] = chunk_colors[i]
-        else:
-            j = int(rng.integers(1, seen+1))  # 1..seen
-            if j <= K:
-                res_points[j-1] = chunk_points[i]
-                if res_colors is not None and chunk_colors is not None:
-                    res_colors[j-1] = chunk_colors[i]
-    return seen
+    m = int(chunk_points.shape[0])
+    if m == 0:
+        return seen
+    with_cols = res_colors is not None and chunk_colors is not None
+
+    # 1) riempimento iniziale del reservoir
+    fill = max(0, min(m, K - seen))
+    if fill:
+        res_points[seen:seen+fill] = chunk_points[:fill]
+        if with_cols:
+            res_colors[seen:seen+fill] = chunk_colors[:fill]
+
+    # 2) sostituzioni: il punto t-esimo (1-based) prende lo slot j ~ U[0, t) se j < K
+    if fill < m:
+        t = np.arange(seen + fill + 1, seen + m + 1, dtype=np.int64)
+        j = rng.integers(0, t)
+        hit = np.flatnonzero(j < K)
+        if hit.size:
+            # stesso slot colpito piu' volte: vince l'ultimo punto, come nel loop sequenziale
+            slots, last = np.unique(j[hit][::-1], return_index=True)
+            src = hit[::-1][last] + fill
+            res_points[slots] = chunk_points[src]
+            if with_cols:
+                res_colors[slots] = chunk_colors[src]
+    return seen + m
+
+def _las_chunk_arrays(chunk, has_rgb: bool):
+    pts = np.vstack((chunk.x, chunk.y, chunk.z)).T.astype(np.float64)
+    cols = None
+    if has_rgb:
+        cols = np.vstack((chunk.red, chunk.green, chunk.blue)).T.astype(np.float64)
+        if cols.max() > 255:
+            cols = (cols / 65535.0) * 255.0
+        cols = cols / 255.0
+    return pts, cols
+
+def las_laz_info(path: str) -> dict:
+    """Header LAS/LAZ: numero punti, bounds e presenza RGB (senza leggere i punti)."""
+    import laspy
+
+    with laspy.open(path) as reader:
+        h = reader.header
+        return {
+            "count": int(h.point_count),
+            "bounds_min": np.asarray(h.mins, dtype=np.float64),
+            "bounds_max": np.asarray(h.maxs, dtype=np.float64),
+            "has_rgb": {"red","green","blue"}.issubset(set(h.point_format.dimension_names)),
+        }
+
+def iter_las_laz_chunks(path: str, chunk_size: int = 250_000):
+    """Chunk LAS/LAZ a piena risoluzione: yield (points float64, colors 0..1 | None)."""
+    import laspy
+
+    with laspy.open(path) as reader:
+        has_rgb = {"red","green","blue"}.issubset(set(reader.header.point_format.dimension_names))
+        for chunk in reader.chunk_iterator(int(chunk_size)):
+            yield _las_chunk_arrays(chunk, has_rgb)
+
+def iter_array_chunks(points: np.ndarray, colors: np.ndarray | None, chunk_size: int = 250_000):
+    """Stessa interfaccia di iter_las_laz_chunks per nuvole gia' in memoria (E57, PLY, ...)."""
+    for a in range(0, points.shape[0], int(chunk_size)):
+        b = a + int(chunk_size)
+        yield points[a:b], (colors[a:b] if colors is not None else None)
 
 def load_las_laz_reservoir(path: str, target_points: int = 2_000_000, seed: int = 7, progress_cb=None):
     """Chunk LAS/LAZ + reservoir sampling (uniforme) fino a target_points."""
@@ -29,7 +79,7 @@ def load_las_laz_reservoir(path: str, target_points: int = 2_000_000, seed: int
 
     with laspy.open(path) as reader:
         total = int(reader.header.point_count)
-        dims = set(reader.point_format.dimension_names)
+        dims = set(reader.header.point_format.dimension_names)
         has_rgb = {"red","green","blue"}.issubset(dims)
 
         res_pts = np.empty((target_points, 3), dtype=np.float64)
@@ -39,13 +89,7 @@ def load_las_laz_reservoir(path: str, target_points: int = 2_000_000, seed: int
         read = 0
 
         for chunk in reader.chunk_iterator(250_000):
-            pts = np.vstack((chunk.x, chunk.y, chunk.z)).T.astype(np.float64)
-            cols = None
-            if has_rgb:
-                cols = np.vstack((chunk.red, chunk.green, chunk.blue)).T.astype(np.float64)
-                if cols.max() > 255:
-                    cols = (cols / 65535.0) * 255.0
-                cols = cols / 255.0
+            pts, cols = _las_chunk_arrays(chunk, has_rgb)
             seen = reservoir_update(res_pts, res_cols, seen, pts, cols, rng)
             read += pts.shape[0]
             if progress_cb and total:
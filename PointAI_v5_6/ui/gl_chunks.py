@@ -0,0 +1,112 @@
+from __future__ import annotations
+import ctypes
+import numpy as np
+
+from OpenGL.GL import (
+    GL_ARRAY_BUFFER, GL_COLOR_ARRAY, GL_FLOAT, GL_STATIC_DRAW, GL_UNSIGNED_BYTE, GL_VERTEX_ARRAY,
+    GL_POINT_SPRITE, GL_COORD_REPLACE, GL_TRUE, GL_TEXTURE0, GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER,
+    GL_TEXTURE_MAG_FILTER, GL_LINEAR, GL_TEXTURE_WRAP_S, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE,
+    GL_PROGRAM_POINT_SIZE, GL_POINTS,
+    glGenBuffers, glDeleteBuffers, glBindBuffer, glBufferData, glVertexPointer, glColorPointer,
+    glEnableClientState, glDisableClientState, glColor4f, glNormal3f, glDrawArrays, glEnable, glDisable,
+    glActiveTexture, glBindTexture, glTexEnvi, glTexParameteri,
+)
+import pyqtgraph.opengl as gl
+
+_NULL = ctypes.c_void_p(0)
+
+
+def _as_color(color):
+    """uint8 (0-255) o float32 (0-1), Nx3/Nx4: nessuna copia se gia' contiguo. Tuple: colore unico."""
+    if not isinstance(color, np.ndarray):
+        return tuple(float(c) for c in color) + ((1.0,) if len(color) == 3 else ())
+    if color.ndim != 2 or color.shape[1] not in (3, 4):
+        raise ValueError("colors deve essere un array Nx3 o Nx4")
+    if color.dtype == np.uint8:
+        return np.ascontiguousarray(color)
+    return np.ascontiguousarray(color, dtype=np.float32)
+
+
+class ChunkScatterItem(gl.GLScatterPlotItem):
+    """
+    GLScatterPlotItem con posizioni e colori in VBO: caricati sulla GPU solo quando cambiano.
+    GLScatterPlotItem ripassa gli array client a ogni paint e converte i colori in float32;
+    qui setData(color=...) ricarica solo il buffer colori e i colori uint8 vanno alla GPU cosi' come sono.
+    Solo pxMode con size scalare (come nel viewer).
+    """
+
+    def __init__(self, pos, color=(0.35, 0.35, 0.35, 1.0), size: float = 2.0, **kwds):
+        self._vbo = {}          # "pos"/"color" -> buffer id
+        self._dirty = set()
+        super().__init__(pos=pos, color=color, size=float(size), pxMode=True, **kwds)
+
+    def setData(self, **kwds):
+        if "pos" in kwds:
+            pos = np.ascontiguousarray(kwds.pop("pos"), dtype=np.float32)
+            if pos.ndim != 2 or pos.shape[1] != 3:
+                raise ValueError("points deve essere un array Nx3")
+            self.pos = pos
+            self._dirty.add("pos")
+        if "color" in kwds:
+            self.color = _as_color(kwds.pop("color"))
+            self._dirty.add("color")
+        if "size" in kwds:
+            self.size = float(kwds.pop("size"))
+        if kwds.pop("pxMode", True) is not True or kwds:
+            raise ValueError(f"argomenti non supportati: {sorted(kwds) or ['pxMode']}")
+        self.update()
+
+    def _upload(self, name: str, arr: np.ndarray):
+        if name not in self._vbo:
+            self._vbo[name] = int(glGenBuffers(1))
+        glBindBuffer(GL_ARRAY_BUFFER, self._vbo[name])
+        glBufferData(GL_ARRAY_BUFFER, arr.nbytes, arr, GL_STATIC_DRAW)
+
+    def release(self):
+        """Libera i VBO (da chiamare prima di removeItem: serve il contesto GL della vista)."""
+        if self._vbo and self.view() is not None:
+            self.view().makeCurrent()
+            glDeleteBuffers(len(self._vbo), list(self._vbo.values()))
+        self._vbo.clear()
+        self._dirty = {"pos", "color"}
+
+    def paint(self):
+        if self.pos is None or self.pos.shape[0] == 0:
+            return
+        if "pos" in self._dirty:
+            self._upload("pos", self.pos)
+        if "color" in self._dirty and isinstance(self.color, np.ndarray):
+            self._upload("color", self.color)
+        self._dirty.clear()
+
+        self.setupGLState()
+        glEnable(GL_POINT_SPRITE)
+        glActiveTexture(GL_TEXTURE0)
+        glEnable(GL_TEXTURE_2D)
+        glBindTexture(GL_TEXTURE_2D, self.pointTexture)
+        glTexEnvi(GL_POINT_SPRITE, GL_COORD_REPLACE, GL_TRUE)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+        glEnable(GL_PROGRAM_POINT_SIZE)
+
+        with self.shader:
+            glEnableClientState(GL_VERTEX_ARRAY)
+            try:
+                glBindBuffer(GL_ARRAY_BUFFER, self._vbo["pos"])
+                glVertexPointer(3, GL_FLOAT, 0, _NULL)
+                if isinstance(self.color, np.ndarray):
+                    glEnableClientState(GL_COLOR_ARRAY)
+                    glBindBuffer(GL_ARRAY_BUFFER, self._vbo["color"])
+                    # uint8: normalizzato a 0-1 dalla pipeline
+                    glColorPointer(self.color.shape[1], GL_UNSIGNED_BYTE if self.color.dtype == np.uint8 else GL_FLOAT, 0, _NULL)
+                else:
+                    glColor4f(*self.color)
+                glNormal3f(self.size, 0, 0)   # lo shader pointSprite usa norm.x come dimensione
+                glDrawArrays(GL_POINTS, 0, self.pos.shape[0])
+            finally:
+                glBindBuffer(GL_ARRAY_BUFFER, 0)
+                glDisableClientState(GL_VERTEX_ARRAY)
+                glDisableClientState(GL_COLOR_ARRAY)
+                glDisable(GL_TEXTURE_2D)
@@ -13,6 +13,7 @@ from core.pointcloud_ops import (
     get_bounds_info, lowest_points, voxel_downsample,
     denoise_statistical, dbscan_clusters, extract_ground_ransac
 )
+from core.neighbor_index import NeighborIndex
 from core.command_parser import parse_command
 from core.nl_assistant import NaturalLanguageAssistant
 
@@ -39,6 +40,7 @@ class MainWindow(QMainWindow):
 
         self.original = None
         self.current = None
+        self._nindex: dict[int, NeighborIndex] = {}   # id(nuvola) -> indice vicini (solo original/current)
 
         self._load_thread = None
         self._load_worker = None
@@ -95,6 +97,15 @@ class MainWindow(QMainWindow):
     def _log(self, msg: str):
         self.log.append(msg)
 
+    def _neighbors(self) -> NeighborIndex:
+        """Indice vicini della nuvola corrente: costruito una volta, riusato finche' la nuvola non cambia."""
+        keep = {id(self.original), id(self.current)}
+        self._nindex = {k: v for k, v in self._nindex.items() if k in keep}
+        idx = self._nindex.get(id(self.current))
+        if idx is None or not idx.matches(self.current):
+            idx = self._nindex[id(self.current)] = NeighborIndex(self.current)
+        return idx
+
     def _set_loading_ui(self, loading: bool):
         self.btn_load.setEnabled(not loading)
         self.btn_view.setEnabled(not loading)
@@ -139,6 +150,7 @@ class MainWindow(QMainWindow):
     def _on_loaded(self, pcd, path: str):
         self.original = pcd
         self.current = pcd
+        self._nindex.clear()
         info = get_bounds_info(self.current)
         self.status.setText(
             f"Caricato: {path} | Punti: {info['count']} | Z min/max: {info['min'][2]:.3f} / {info['max'][2]:.3f}"
@@ -202,10 +214,13 @@ class MainWindow(QMainWindow):
                 self.current = voxel_downsample(self.current, c.args["voxel"])
                 self._log("OK downsample")
             elif c.name == "denoise":
-                self.current = denoise_statistical(self.current, c.args["nb_neighbors"], c.args["std_ratio"])
+                self.current = denoise_statistical(self.current, c.args["nb_neighbors"], c.args["std_ratio"],
+                                                   index=self._neighbors())
                 self._log("OK denoise")
             elif c.name == "cluster":
-                self.current, n = dbscan_clusters(self.current, c.args["eps"], c.args["min_points"])
+                idx = self._neighbors()
+                self.current, n = dbscan_clusters(self.current, c.args["eps"], c.args["min_points"], index=idx)
+                self._nindex[id(self.current)] = idx.rebind(self.current)   # stessi punti, solo colori
                 self._log(f"OK cluster {n}")
             elif c.name == "ground":
                 ground, non_ground, plane = extract_ground_ransac(
@@ -88,6 +88,7 @@ class UnifiedMainWindow(QMainWindow):
         ql.addLayout(left, 0)
 
         self.btn_load = QPushButton("Carica nuvola punti")
+        self.btn_stream = QPushButton("Apri store (streaming camera)")
         self.progress = QProgressBar()
         self.status = QLabel("Pronto")
 
@@ -105,6 +106,7 @@ class UnifiedMainWindow(QMainWindow):
         self.log.setReadOnly(True)
 
         left.addWidget(self.btn_load)
+        left.addWidget(self.btn_stream)
         left.addWidget(QLabel("Max punti display"))
         left.addWidget(self.max_points)
         left.addWidget(QLabel("AI mode"))
@@ -119,6 +121,7 @@ class UnifiedMainWindow(QMainWindow):
 
         # signals
         self.btn_load.clicked.connect(self.on_load)
+        self.btn_stream.clicked.connect(self.on_stream_store)
         self.ai_input.returnPressed.connect(self.on_ai_command)
         self.ai_mode.currentTextChanged.connect(self.ai.set_mode)
 
@@ -155,6 +158,17 @@ class UnifiedMainWindow(QMainWindow):
 
         self._load_thread.start()
 
+    def on_stream_store(self):
+        path = QFileDialog.getExistingDirectory(self, "Apri store (Zarr)", "")
+        if not path:
+            return
+        try:
+            budget = int(self.max_points.value())
+            self.viewer.attach_store(path, point_budget=budget, workers=min(8, os.cpu_count() or 1))
+            self.status.setText(f"Streaming: {os.path.basename(path)} (budget {budget:,} punti)")
+        except Exception as e:
+            self.on_error(str(e) + "\n" + traceback.format_exc())
+
     def on_progress(self, pct: float, msg: str):
         self.progress.setValue(int(pct))
         self.status.setText(msg)
@@ -3,8 +3,17 @@ import numpy as np
 
 import pyqtgraph.opengl as gl
 import pyqtgraph as pg
+from PySide6.QtCore import QTimer
 from PySide6.QtWidgets import QWidget
 
+from core.oc_store import PointStore
+from core.oc_shapes import FrustumShape
+from core.oc_stream import TileStreamer
+from ui.gl_chunks import ChunkScatterItem
+
+_GREY = (0.35, 0.35, 0.35, 1.0)
+_MAX_SHIFT = 1e4   # origine oltre cui float32 va centrato in float64 (passo float32 a 1e4 ~ 1 mm)
+
 
 class PointCloudViewer(QWidget):
     def __init__(self, parent=None):
@@ -17,10 +26,22 @@ class PointCloudViewer(QWidget):
         layout.setContentsMargins(0, 0, 0, 0)
         layout.addWidget(self.view)
 
-        self._scatter = None
-        self._points = None  # centered points (float32)
+        # chunk di punti: key -> ChunkScatterItem (VBO propri, aggiornabili singolarmente)
+        self._chunks: dict = {}
+        self._bounds: dict = {}   # key -> (min, max) in coordinate vista
+
+        # streaming da PointStore (attach_store)
+        self._streamer: TileStreamer | None = None
+        self._stream_timer = QTimer(self)
+        self._stream_timer.timeout.connect(self._stream_tick)
+        self._origin = np.zeros(3)
+        self._extent = 100.0
+        self._cam_key = None
+        self._point_size = 2.0
 
-        # helpers
+        self._add_helpers()
+
+    def _add_helpers(self):
         axis = gl.GLAxisItem()
         axis.setSize(50, 50, 50)
         self.view.addItem(axis)
@@ -31,62 +52,177 @@ class PointCloudViewer(QWidget):
         self.view.addItem(grid)
 
     def set_pointcloud(self, points: np.ndarray, colors: np.ndarray | None = None, point_size: float = 2.0):
-        self.view.clear()
-
-        pts = np.asarray(points, dtype=np.float64)
+        """
+        Sostituisce la nuvola mostrata (un solo chunk "cloud"). Assi e griglia restano.
+        float32 gia' centrato e colori uint8 / float32 0-1 passano alla GPU senza copie; float64 e
+        float32 lontano dall'origine (es. UTM) vengono centrati in float64 e convertiti una volta sola.
+        """
+        self.detach_store()
+        self.clear_chunks()
+
+        pts = np.asarray(points)
         if pts.ndim != 2 or pts.shape[1] != 3:
             raise ValueError("points deve essere un array Nx3")
-
-        # 1) rimuovi NaN/Inf (altrimenti OpenGL spesso non disegna nulla)
-        mask = np.isfinite(pts).all(axis=1)
-        pts = pts[mask]
+        cols = None if colors is None else np.asarray(colors)
+        if cols is not None and cols.ndim == 2 and cols.shape[1] > 4:
+            cols = cols[:, :3]
+
+        # rimuovi NaN/Inf (altrimenti OpenGL spesso non disegna nulla): copia solo se presenti
+        if pts.dtype.kind == "f":
+            mask = np.isfinite(pts).all(axis=1)
+            if not mask.all():
+                pts = pts[mask]
+                cols = cols[mask] if cols is not None else None
         if pts.shape[0] == 0:
             raise ValueError("Tutti i punti erano NaN/Inf. Nulla da visualizzare.")
 
-        # 2) centra punti (niente translate accumulato)
-        center = pts.mean(axis=0)
-        pts_c = (pts - center).astype(np.float32, copy=False)
-        self._points = pts_c
+        # colori 0-255 in float: uint8 (4x meno memoria sulla GPU)
+        if cols is not None and cols.dtype != np.uint8 and cols.max() > 1.0:
+            cols = np.clip(cols, 0.0, 255.0).astype(np.uint8)
 
-        # colori
-        if colors is None:
-            rgba = np.ones((len(pts_c), 4), dtype=np.float32)
-            rgba[:, :3] = 0.35
+        self._origin = (pts.min(axis=0).astype(np.float64) + pts.max(axis=0)) / 2.0
+        self._point_size = float(point_size)
+        self.set_chunk("cloud", pts, cols)
+        self.autofit()
+
+    # ---------- chunk ----------
+    def _view_pos(self, points, relative: bool = False) -> tuple[np.ndarray, np.ndarray]:
+        """
+        (pos float32, traslazione dell'item). float32 vicino all'origine: nessuna copia, l'origine va
+        nella trasformazione. Con origine grande la trasformazione float32 sulla GPU fa tremare i punti:
+        si centra in float64 prima della conversione. relative: punti gia' relativi all'origine della vista.
+        """
+        pts = np.asarray(points)
+        if relative:
+            return pts.astype(np.float32, copy=False), np.zeros(3)
+        if pts.dtype == np.float32 and np.abs(self._origin).max() <= _MAX_SHIFT:
+            return pts, -self._origin
+        return (pts - self._origin).astype(np.float32), np.zeros(3)
+
+    def set_chunk(self, key, points: np.ndarray, colors: np.ndarray | None = None, relative: bool = False):
+        """
+        Aggiunge o sostituisce il chunk `key` (coordinate come set_pointcloud, colori uint8 o float 0-1,
+        Nx3/Nx4). Gli altri chunk non vengono toccati. colors=None su un chunk esistente con lo stesso
+        numero di punti mantiene i colori caricati.
+        relative: coordinate gia' relative all'origine della vista (es. TileStreamer con origin), senza copie.
+        """
+        pos, shift = self._view_pos(points, relative)
+        item = self._chunks.get(key)
+        if item is None:
+            item = ChunkScatterItem(pos, _GREY if colors is None else colors, size=self._point_size)
+            self.view.addItem(item)
+            self._chunks[key] = item
         else:
-            c = np.asarray(colors, dtype=np.float32)
-            c = c[mask]
-            if c.ndim == 2 and c.shape[1] >= 3:
-                c = c[:, :3]
-            if c.max() > 1.0:
-                c = c / 255.0
-            rgba = np.concatenate([c, np.ones((len(c), 1), dtype=np.float32)], axis=1)
-
-        self._scatter = gl.GLScatterPlotItem(pos=pts_c, color=rgba, size=float(point_size), pxMode=True)
-        self.view.addItem(self._scatter)
-
-        # axis+grid di nuovo (clear li rimuove)
-        axis = gl.GLAxisItem()
-        axis.setSize(50, 50, 50)
-        self.view.addItem(axis)
+            same_n = item.pos is not None and item.pos.shape[0] == pos.shape[0]
+            if colors is not None:
+                item.setData(pos=pos, color=colors)
+            elif same_n:
+                item.setData(pos=pos)
+            else:
+                item.setData(pos=pos, color=_GREY)
+        item.resetTransform()
+        item.translate(*shift)
+        if pos.shape[0]:
+            self._bounds[key] = (pos.min(axis=0) + shift, pos.max(axis=0) + shift)
+        else:
+            self._bounds.pop(key, None)
 
-        grid = gl.GLGridItem()
-        grid.setSize(200, 200)
-        grid.setSpacing(10, 10)
-        self.view.addItem(grid)
+    def set_chunk_colors(self, key, colors):
+        """Solo colori (es. classificazione/colormap): le posizioni sulla GPU restano."""
+        self._chunks[key].setData(color=colors)
 
-        self.autofit()
+    def remove_chunk(self, key):
+        item = self._chunks.pop(key, None)
+        self._bounds.pop(key, None)
+        if item is not None:
+            item.release()
+            self.view.removeItem(item)
+
+    def clear_chunks(self):
+        for key in list(self._chunks):
+            self.remove_chunk(key)
+
+    def chunk_keys(self) -> list:
+        return list(self._chunks)
 
     def autofit(self):
-        if self._points is None or len(self._points) == 0:
+        if not self._bounds:
             return
-        mn = self._points.min(axis=0)
-        mx = self._points.max(axis=0)
+        mn = np.min([b[0] for b in self._bounds.values()], axis=0)
+        mx = np.max([b[1] for b in self._bounds.values()], axis=0)
         extent = float(np.linalg.norm(mx - mn))
         dist = max(10.0, extent * 1.2)
 
         # imposta camera “sensata” e non all’origine random
+        self.view.opts["center"] = pg.Vector(*((mn + mx) / 2.0))
         self.view.setCameraPosition(distance=dist, elevation=20, azimuth=45)
 
     def set_point_size(self, px: float):
-        if self._scatter is not None:
-            self._scatter.setData(size=float(px))
+        self._point_size = float(px)
+        for item in self._chunks.values():
+            item.setData(size=float(px))
+
+    # ---------- streaming ----------
+    def attach_store(self, store, point_budget: int = 3_000_000, workers: int = 4, point_size: float = 2.0):
+        """
+        Vista streaming su un PointStore: tile e LOD seguono la camera (plan_lods sul frustum),
+        al piu' point_budget punti sulla GPU. Letture in background, un item per tile:
+        la navigazione resta fluida mentre arriva il dettaglio.
+        """
+        self.detach_store()
+        ps = store if isinstance(store, PointStore) else PointStore(store)
+        meta = ps.read_meta()
+        mn = np.asarray(meta.bounds_min, dtype=np.float64)
+        mx = np.asarray(meta.bounds_max, dtype=np.float64)
+        # coordinate vista centrate sullo store (float32 sulla GPU)
+        self._origin = (mn + mx) / 2.0
+        self._extent = float(np.linalg.norm(mx - mn))
+        self._point_size = float(point_size)
+
+        self.clear_chunks()
+        self.view.opts["center"] = pg.Vector(0, 0, 0)
+        self.view.setCameraPosition(distance=max(10.0, self._extent*0.8), elevation=30, azimuth=45)
+
+        # tile decodificati in float64 e centrati sull'origine della vista prima del float32
+        self._streamer = TileStreamer(ps, point_budget=point_budget, workers=workers, origin=self._origin)
+        self._cam_key = None
+        self._stream_timer.start(100)
+
+    def detach_store(self):
+        if self._streamer is None:
+            return
+        self._stream_timer.stop()
+        self._streamer.close()
+        self._streamer = None
+        self.clear_chunks()
+
+    def _camera_frustum(self):
+        """(eye, FrustumShape) in coordinate store dalla camera corrente del GLViewWidget."""
+        p = self.view.cameraPosition()
+        c = self.view.opts["center"]
+        eye = np.array([p.x(), p.y(), p.z()]) + self._origin
+        target = np.array([c.x(), c.y(), c.z()]) + self._origin
+        w, h = max(1, self.view.width()), max(1, self.view.height())
+        # pyqtgraph: fov orizzontale
+        vfov = np.degrees(2.0*np.arctan(np.tan(np.radians(self.view.opts["fov"])/2.0) * h/w))
+        dist = float(self.view.opts["distance"])
+        shape = FrustumShape.from_camera(eye, target, up=(0.0, 0.0, 1.0), fov_deg=vfov, aspect=w/h,
+                                         near=dist*0.001, far=dist + self._extent)
+        return eye, shape
+
+    def _stream_tick(self):
+        if self._streamer is None:
+            return
+        eye, shape = self._camera_frustum()
+        key = (tuple(np.round(eye, 2)), tuple(np.round(shape.corners[-1], 2)), self.view.width(), self.view.height())
+        if key != self._cam_key:
+            self._cam_key = key
+            self._streamer.update(eye, shape)
+
+        # poche modifiche per tick: il thread UI non si blocca sugli upload
+        added, removed = self._streamer.poll(max_tiles=24)
+        for k in removed:
+            self.remove_chunk(k)
+        for k, pts, cols in added:
+            # float32 gia' relativi all'origine: nessuna copia
+            self.set_chunk(k, pts, cols, relative=True)